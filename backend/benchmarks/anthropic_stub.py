@@ -0,0 +1,231 @@
+"""
+Minimal Anthropic Messages API server for checking request shapes offline.
+
+Answers POST /v1/messages (streamed or not) with a canned reply and
+simulates prompt caching: every `cache_control` breakpoint writes the
+prefix up to it, and a later request whose prefix matches a written one
+(at a breakpoint or up to 20 blocks before it) reads it instead. The usage
+of each response reports cache reads and writes the way the API does, and
+every request body can be logged as JSON lines for inspection:
+
+    python -m backend.benchmarks.anthropic_stub --port 8787 --log requests.jsonl
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8787 uvicorn backend.main:app
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backend.benchmarks.fake_llm import as_tool_call
+
+LOOKBACK_BLOCKS = 20
+
+
+def count_tokens(value) -> int:
+    """Rough token estimate (~4 characters per token), like history.count_tokens."""
+    return (len(json.dumps(value, ensure_ascii=False)) + 3) // 4
+
+
+def prompt_blocks(body):
+    """The request's cacheable prefix in API order: tools, system, then messages."""
+    blocks = list(body.get("tools") or [])
+    system = body.get("system") or []
+    if isinstance(system, str):
+        system = [{"type": "text", "text": system}]
+    blocks += system
+    for message in body.get("messages") or []:
+        content = message["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        blocks += [{"role": message["role"], **block} for block in content]
+    return blocks
+
+
+class PromptCache:
+    """Which prefixes have been written, by digest; shared by every request."""
+
+    def __init__(self, min_tokens):
+        self.min_tokens = min_tokens
+        self.written = set()
+        self.lock = threading.Lock()
+
+    def usage(self, body):
+        """Returns (input, cache_read, cache_write) token counts for a request."""
+        blocks = prompt_blocks(body)
+        plain = [{k: v for k, v in b.items() if k != "cache_control"} for b in blocks]
+        sizes = [count_tokens(b) for b in plain]
+        digests, running = [], hashlib.sha256()
+        for block in plain:
+            running.update(json.dumps(block, sort_keys=True).encode())
+            digests.append(running.copy().hexdigest())
+        breakpoints = [i for i, b in enumerate(blocks) if "cache_control" in b]
+
+        with self.lock:
+            read_end = 0  # blocks [0, read_end) come from the cache
+            for point in breakpoints:
+                for i in range(point, max(-1, point - LOOKBACK_BLOCKS), -1):
+                    if digests[i] in self.written:
+                        read_end = max(read_end, i + 1)
+                        break
+            write_end = read_end
+            for point in breakpoints:
+                if point + 1 > read_end and sum(sizes[: point + 1]) >= self.min_tokens:
+                    self.written.add(digests[point])
+                    write_end = max(write_end, point + 1)
+
+        cache_read = sum(sizes[:read_end])
+        cache_write = sum(sizes[read_end:write_end])
+        return sum(sizes[write_end:]), cache_read, cache_write
+
+
+def reply_content(body, reply, tool_input=None):
+    """
+    A text answer, or a tool call when tools are offered: `tool_input` for
+    the first tool it has every required field of, else the reply read as a
+    Thought/Action or Final Answer (a run_command / final_answer call).
+    """
+    tools = body.get("tools")
+    if not tools:
+        return {"type": "text", "text": reply}
+    if tool_input is not None:
+        name, arguments = tools[0]["name"], tool_input
+        for tool in tools:
+            if set(tool.get("input_schema", {}).get("required", [])) <= set(tool_input):
+                name = tool["name"]
+                break
+    else:
+        calls = [c for c in as_tool_call(reply) if c["name"] in {t["name"] for t in tools}]
+        if not calls:
+            return {"type": "text", "text": reply}
+        name, arguments = calls[0]["name"], calls[0]["input"]
+    return {
+        "type": "tool_use",
+        "id": f"toolu_{uuid.uuid4().hex[:24]}",
+        "name": name,
+        "input": arguments,
+    }
+
+
+def make_handler(reply, cache, log_path=None, tool_input=None):
+    log_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            if self.path.split("?")[0] != "/v1/messages":
+                return self._send(404, "application/json", b'{"type":"error"}')
+            body = json.loads(self.rfile.read(int(self.headers.get("content-length") or 0)))
+            if log_path:
+                with log_lock, open(log_path, "a") as f:
+                    f.write(json.dumps(body) + "\n")
+
+            input_tokens, cache_read, cache_write = cache.usage(body)
+            content = reply_content(body, reply, tool_input)
+            usage = {
+                "input_tokens": input_tokens,
+                "output_tokens": count_tokens(content),
+                "cache_read_input_tokens": cache_read,
+                "cache_creation_input_tokens": cache_write,
+            }
+            message = {
+                "id": f"msg_{uuid.uuid4().hex[:24]}",
+                "type": "message",
+                "role": "assistant",
+                "model": body.get("model", "stub"),
+                "content": [content],
+                "stop_reason": "tool_use" if content["type"] == "tool_use" else "end_turn",
+                "stop_sequence": None,
+                "usage": usage,
+            }
+            if body.get("stream"):
+                data = "".join(
+                    f"event: {name}\ndata: {json.dumps(event)}\n\n"
+                    for name, event in stream_events(message)
+                )
+                return self._send(200, "text/event-stream", data.encode())
+            self._send(200, "application/json", json.dumps(message).encode())
+
+        def _send(self, status, content_type, data):
+            self.send_response(status)
+            self.send_header("content-type", content_type)
+            self.send_header("content-length", str(len(data)))
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def stream_events(message, chunk_size=16):
+    """The server-sent events of a streamed `message`."""
+    content = message["content"][0]
+    start = {**message, "content": [], "stop_reason": None}
+    start["usage"] = {**message["usage"], "output_tokens": 1}
+    yield "message_start", {"type": "message_start", "message": start}
+    if content["type"] == "text":
+        text = content["text"]
+        yield "content_block_start", {
+            "type": "content_block_start",
+            "index": 0,
+            "content_block": {"type": "text", "text": ""},
+        }
+        deltas = [{"type": "text_delta", "text": text[i : i + chunk_size]} for i in range(0, len(text), chunk_size)]
+    else:
+        partial = json.dumps(content["input"])
+        yield "content_block_start", {
+            "type": "content_block_start",
+            "index": 0,
+            "content_block": {**content, "input": {}},
+        }
+        deltas = [
+            {"type": "input_json_delta", "partial_json": partial[i : i + chunk_size]}
+            for i in range(0, len(partial), chunk_size)
+        ]
+    for delta in deltas:
+        yield "content_block_delta", {"type": "content_block_delta", "index": 0, "delta": delta}
+    yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+    yield "message_delta", {
+        "type": "message_delta",
+        "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+        "usage": {"output_tokens": message["usage"]["output_tokens"]},
+    }
+    yield "message_stop", {"type": "message_stop"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--reply", default="Thought: Done.\nFinal Answer: Nothing to do.")
+    parser.add_argument("--min-tokens", type=int, default=1024, help="shortest cacheable prefix")
+    parser.add_argument("--log", default=None, help="append every request body to this file")
+    parser.add_argument(
+        "--tool-input",
+        type=json.loads,
+        default=None,
+        help='JSON input of every tool call, e.g. \'{"thought": "Done.", "answer": "Nothing to do."}\'',
+    )
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer(
+        (args.host, args.port),
+        make_handler(args.reply, PromptCache(args.min_tokens), args.log, args.tool_input),
+    )
+    print(f"Anthropic stub listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import asyncio
+
+# A typical "add a CI workflow" task: one probe, one write, one push
+DEFAULT_TRANSCRIPT = [
+    "Thought: Check what is already in the repository.\n"
+    "Action: ls -la\n"
+    "Result: Will be filled in after execution.",
+    "Thought: Add a minimal GitHub Actions workflow.\n"
+    "Action: mkdir -p .github/workflows && printf '%s\\n' 'name: CI' 'on: [push]' "
+    "'jobs:' '  build:' '    runs-on: ubuntu-latest' '    steps:' "
+    "'      - uses: actions/checkout@v4' > .github/workflows/ci.yml\n"
+    "Result: Will be filled in after execution.",
+    "Thought: Commit the workflow and push it.\n"
+    "Action: git add . && git commit -qm 'Add CI workflow' && git push -q origin HEAD\n"
+    "Result: Will be filled in after execution.",
+    "Final Answer: The CI workflow was added, committed and pushed.",
+]
+
+
+def as_tool_call(answer):
+    """Turns a canned Thought/Action answer into the tool call ClaudeLLM would return."""
+    fields = {}
+    for line in answer.splitlines():
+        key, _, value = line.partition(":")
+        fields[key.strip().lower()] = value.strip()
+    if "final answer" in fields:
+        name, arguments = "final_answer", {"answer": fields["final answer"]}
+    elif fields.get("action"):
+        name, arguments = "run_command", {"command": fields["action"]}
+    else:
+        return []
+    arguments["thought"] = fields.get("thought", "")
+    return [{"id": "toolu_scripted", "name": name, "input": arguments}]
+
+
+class FakeStream:
+    """
+    Streams a canned answer in small chunks, like ClaudeLLM's ChatStream.
+    When offered tools, it streams only the thought and returns the rest as a call.
+    """
+
+    def __init__(self, llm, answer, tools=None):
+        self.llm = llm
+        self.answer = answer
+        self.text = ""
+        self.tool_calls = as_tool_call(answer) if tools else []
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.llm.latency)
+        streamed = self.answer
+        if self.tool_calls:
+            streamed = self.tool_calls[0]["input"]["thought"]
+        size = self.llm.chunk_size
+        for i in range(0, len(streamed), size):
+            if self.llm.chunk_delay:
+                await asyncio.sleep(self.llm.chunk_delay)
+            yield streamed[i : i + size]
+        self.text = "" if self.tool_calls else self.answer.strip()
+
+
+class ScriptedLLM:
+    """
+    Drop-in replacement for ClaudeLLM that replays a transcript instead of
+    calling the API. The step is derived from the conversation itself (one
+    assistant message per step taken), so any number of tasks can share one
+    instance concurrently.
+    """
+
+    def __init__(self, transcript, latency=0.2, chunk_size=16, chunk_delay=0.005):
+        self.transcript = transcript
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+
+    def answer(self, messages):
+        self.calls += 1
+        step = sum(1 for m in messages if m["role"] == "assistant")
+        return self.transcript[min(step, len(self.transcript) - 1)]
+
+    async def chat(self, messages):
+        await asyncio.sleep(self.latency)
+        return self.answer(messages).strip()
+
+    async def chat_tools(self, messages, tools, tool_choice=None):
+        await asyncio.sleep(self.latency)
+        answer = self.answer(messages)
+        calls = as_tool_call(answer)
+        return ("" if calls else answer.strip()), calls
+
+    def chat_stream(self, messages, tools=None, tool_choice=None, stream_input=None):
+        return FakeStream(self, self.answer(messages), tools)
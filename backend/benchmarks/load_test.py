@@ -0,0 +1,315 @@
+"""
+Offline end-to-end benchmark of backend.main:app.
+
+Runs the real app in-process against local bare git repositories, with a
+scripted LLM in place of Claude and an automated client approving every
+action, then reports throughput, step latency, event-loop lag and peak RSS
+as JSON so results can be compared between versions:
+
+    python -m backend.benchmarks.load_test --tasks 50 --concurrency 50 --out bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(values, scale=1000.0):
+    """p50/p99/max of a list of seconds, in milliseconds by default."""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 0.50) * scale, 2),
+        "p99": round(percentile(values, 0.99) * scale, 2),
+        "max": round(max(values) * scale, 2),
+        "mean": round(sum(values) / len(values) * scale, 2),
+    }
+
+
+def configure_environment(workdir):
+    """Points every store and remote at the scratch directory. Must run before importing the app."""
+    os.environ.update(
+        {
+            "REPO_URL_TEMPLATE": os.path.join(workdir, "remotes", "{repo_name}.git"),
+            "REPOS_DIR": os.path.join(workdir, "repos"),
+            "EVENT_DB_PATH": os.path.join(workdir, "events.sqlite3"),
+            "STATE_DB_PATH": os.path.join(workdir, "state.sqlite3"),
+            "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.sqlite3"),
+            "LLM_CACHE_ENABLED": "false",
+            "PLAN_CACHE_PATH": os.path.join(workdir, "plan_cache.sqlite3"),
+            "OUTPUT_DIR": os.path.join(workdir, "task_output"),
+            "CLAUDE_API_KEY": os.getenv("CLAUDE_API_KEY", "offline-benchmark"),
+            "GIT_AUTHOR_NAME": "Benchmark",
+            "GIT_AUTHOR_EMAIL": "benchmark@example.com",
+            "GIT_COMMITTER_NAME": "Benchmark",
+            "GIT_COMMITTER_EMAIL": "benchmark@example.com",
+        }
+    )
+    os.makedirs(os.environ["REPOS_DIR"], exist_ok=True)
+
+
+def create_remotes(workdir, count):
+    """Creates `count` bare repositories with one initial commit on main."""
+    names = []
+    for i in range(count):
+        name = f"bench-repo-{i}"
+        remote = os.path.join(workdir, "remotes", f"{name}.git")
+        seed = os.path.join(workdir, "seed", name)
+        subprocess.run(["git", "init", "-q", "--bare", "-b", "main", remote], check=True)
+        subprocess.run(
+            ["git", "clone", "-q", remote, seed], check=True, stderr=subprocess.DEVNULL
+        )
+        with open(os.path.join(seed, "README.md"), "w") as f:
+            f.write(f"# {name}\n")
+        with open(os.path.join(seed, "package.json"), "w") as f:
+            f.write('{"name": "%s"}\n' % name)
+        for args in (["add", "."], ["commit", "-qm", "Initial commit"], ["push", "-q", "origin", "main"]):
+            subprocess.run(["git", *args], cwd=seed, check=True)
+        names.append(name)
+    return names
+
+
+class SSEParser:
+    """Incremental parser for the app's `id/event/data` frames."""
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        events = []
+        while "\n\n" in self.buffer:
+            block, self.buffer = self.buffer.split("\n\n", 1)
+            event = {"type": "message", "data": {}}
+            for line in block.split("\n"):
+                field, _, value = line.partition(": ")
+                if field == "event":
+                    event["type"] = value
+                elif field == "data":
+                    event["data"] = json.loads(value)
+            events.append(event)
+        return events
+
+
+class LoopLagMonitor:
+    """Measures how late a short sleep wakes up, i.e. how busy the event loop is."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+
+async def drive_task(client, repo_name, approval_delay, limit):
+    """
+    Starts one task and approves each action after `approval_delay`.
+    A step runs from the task start (or an approval) until the next approval
+    request (or the end of the task), so it excludes the simulated human.
+    """
+    async with limit:
+        started = time.perf_counter()
+        step_started = started
+        steps, state, task_id = [], None, None
+        parser = SSEParser()
+        async with client.stream(
+            "POST",
+            "/run-automation",
+            json={"user_input": "Add a CI workflow", "repo_name": repo_name},
+            headers={"accept-encoding": "identity"},
+        ) as response:
+            response.raise_for_status()
+            task_id = response.headers.get("x-task-id")
+            async for chunk in response.aiter_text():
+                for event in parser.feed(chunk):
+                    data = event["data"]
+                    if event["type"] == "action_pending":
+                        steps.append(time.perf_counter() - step_started)
+                        await asyncio.sleep(approval_delay)
+                        await client.post(
+                            "/approve-action",
+                            json={"task_id": data["step_id"], "approved": True},
+                        )
+                        step_started = time.perf_counter()
+                    elif event["type"] == "status" and data.get("final"):
+                        state = data.get("state")
+        finished = time.perf_counter()
+        steps.append(finished - step_started)
+        return {
+            "task_id": task_id,
+            "state": state,
+            "duration": finished - started,
+            "steps": steps,
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args, workdir):
+    import httpx
+    import uvicorn
+
+    from backend import main
+    from backend.benchmarks.fake_llm import DEFAULT_TRANSCRIPT, ScriptedLLM
+    from backend.services import metrics
+
+    # 🤖 Every agent answers from the script instead of calling Claude
+    orchestrator = main.orchestrator
+    llm = ScriptedLLM(DEFAULT_TRANSCRIPT, latency=args.llm_latency)
+    orchestrator.reasoning_agent.llm = llm
+    orchestrator.prompt_engineer.llm = ScriptedLLM(
+        ["Add a GitHub Actions CI workflow, commit and push it."], latency=args.llm_latency
+    )
+    orchestrator.reflector_agent.llm = ScriptedLLM(["Action: git status"], latency=args.llm_latency)
+
+    repos = create_remotes(workdir, args.repos)
+
+    server = uvicorn.Server(
+        uvicorn.Config(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+    )
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    monitor = LoopLagMonitor()
+    monitoring = asyncio.create_task(monitor.run())
+    limit = asyncio.Semaphore(args.concurrency)
+    client = httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{args.port}",
+        timeout=args.timeout,
+        limits=httpx.Limits(max_connections=args.concurrency * 2 + 10),
+    )
+    try:
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *(
+                drive_task(client, repos[i % len(repos)], args.approval_delay, limit)
+                for i in range(args.tasks)
+            ),
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        monitoring.cancel()
+        await client.aclose()
+        server.should_exit = True
+        await serving
+
+    results = [o for o in outcomes if isinstance(o, dict)]
+    errors = [repr(o) for o in outcomes if not isinstance(o, dict)]
+    completed = [r for r in results if r["state"] == "Completed"]
+
+    # Where the server spent its time, summed over every task's trace
+    breakdown = {}
+    for result in results:
+        trace = metrics.traces.get(result["task_id"]) or {"totals": {}}
+        for name, seconds in trace["totals"].items():
+            breakdown[name] = round(breakdown.get(name, 0) + seconds, 3)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "revision": git_revision(),
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "tasks": args.tasks,
+            "concurrency": args.concurrency,
+            "repos": args.repos,
+            "llm_latency_s": args.llm_latency,
+            "approval_delay_s": args.approval_delay,
+        },
+        "tasks": {
+            "started": args.tasks,
+            "completed": len(completed),
+            "failed": len(results) - len(completed),
+            "errors": errors[:10],
+        },
+        "duration_s": round(elapsed, 3),
+        "tasks_per_sec": round(len(completed) / elapsed, 3) if elapsed else None,
+        "step_latency_ms": summarize([s for r in results for s in r["steps"]]),
+        "task_latency_ms": summarize([r["duration"] for r in results]),
+        "event_loop_lag_ms": summarize(monitor.samples),
+        "peak_rss_mb": {
+            "process": round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit / 2**20, 1
+            ),
+            "largest_child": round(
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * rss_unit / 2**20, 1
+            ),
+        },
+        "llm_calls": llm.calls,
+        "server_time_s": breakdown,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--tasks", type=int, default=50, help="tasks to run in total")
+    parser.add_argument("--concurrency", type=int, default=50, help="tasks streaming at once")
+    parser.add_argument("--repos", type=int, default=5, help="local remotes to spread tasks over")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--approval-delay", type=float, default=0.05, help="seconds before approving")
+    parser.add_argument("--timeout", type=float, default=300, help="HTTP timeout in seconds")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--label", default=None, help="free-form label stored in the report")
+    parser.add_argument("--out", default="benchmark_results.json", help="where to write the JSON report")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="agent-bench-")
+    configure_environment(workdir)
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)  # the orchestrator resolves ./repos relative to the cwd
+    try:
+        report = asyncio.run(run_benchmark(args, workdir))
+    finally:
+        os.chdir(previous_cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    return 0 if report["tasks"]["completed"] == args.tasks else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Minimal Ollama-compatible server for trying model routes offline.
+
+Answers POST /api/chat (streamed or not) with a canned reply after a
+configurable delay, so routes such as
+
+    LLM_ROUTE_REFLECTOR=ollama:stub,claude:claude-3-5-haiku-20241022
+
+can be exercised without a GPU, and failover can be provoked with --delay:
+
+    python -m backend.benchmarks.ollama_stub --port 11434 --reply "Action: git status"
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(reply, delay, chunk_size=8):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/api/tags":
+                return self._json({"models": [{"name": "stub", "model": "stub"}]})
+            self.send_error(404)
+
+        def do_POST(self):
+            if self.path != "/api/chat":
+                return self.send_error(404)
+            length = int(self.headers.get("content-length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(delay)
+
+            model = request.get("model", "stub")
+            try:
+                if not request.get("stream", True):
+                    return self._json(self._part(model, reply, done=True))
+
+                self.send_response(200)
+                self.send_header("content-type", "application/x-ndjson")
+                self.end_headers()
+                for i in range(0, len(reply), chunk_size):
+                    self._line(self._part(model, reply[i : i + chunk_size]))
+                self._line(self._part(model, "", done=True))
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client gave up waiting, e.g. to fail over
+
+        def _part(self, model, content, done=False):
+            part = {
+                "model": model,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "message": {"role": "assistant", "content": content},
+                "done": done,
+            }
+            if done:
+                part.update(done_reason="stop", prompt_eval_count=10, eval_count=len(reply) // 4)
+            return part
+
+        def _line(self, body):
+            self.wfile.write(json.dumps(body).encode() + b"\n")
+            self.wfile.flush()
+
+        def _json(self, body):
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--reply", default="Action: git status", help="text of every answer")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds before answering")
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.reply, args.delay))
+    print(f"Ollama stub listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import os
+
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+def env_flag(name, default=False):
+    """A boolean setting: 1, true, yes or on (in any case) enable it, other values disable it."""
+    value = os.getenv(name, "").strip()
+    if not value:
+        return default
+    return value.lower() in TRUE_VALUES
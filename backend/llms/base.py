@@ -0,0 +1,101 @@
+from backend.llms.cache import make_key
+from backend.services import metrics
+
+
+class TokenUsage:
+    """
+    LLM tokens used by the tasks someone watches (e.g. batches with a token
+    budget), counted whether or not metrics are enabled.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+
+    def watch(self, task_id):
+        self.tasks[task_id] = 0
+
+    def add(self, tokens, task_id=None):
+        task_id = task_id or metrics.current_task_id.get()
+        if task_id in self.tasks:
+            self.tasks[task_id] += tokens
+
+    def get(self, task_id):
+        return self.tasks.get(task_id, 0)
+
+    def forget(self, task_id):
+        """Stops counting for a task and returns its total."""
+        return self.tasks.pop(task_id, 0)
+
+
+token_usage = TokenUsage()
+
+
+class BaseLLM:
+    """
+    What every provider shares: sampling settings, optional memoization
+    through an LLMCache and latency/token reporting labelled by agent and provider.
+    Subclasses implement chat, chat_tools and chat_stream.
+    """
+
+    provider = "unknown"
+
+    def __init__(self, model, cache=None, agent=None, max_tokens=1024, temperature=0.5):
+        self.model = model
+        self.agent = agent or "unknown"  # label for latency and token metrics
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        # Agents opt into memoization by passing an LLMCache
+        self.cache = cache
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def name(self):
+        return f"{self.provider}:{self.model}"
+
+    def record(self, duration, mode, usage=None):
+        """Reports the latency and token usage of one completion."""
+        tokens = {}
+        if usage is not None:
+            cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+            cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+            tokens = {
+                "input_tokens": usage.input_tokens,
+                "output_tokens": usage.output_tokens,
+                # Prompt caching: input served from the cache, and input written to it
+                "cache_read_tokens": cache_read,
+                "cache_write_tokens": cache_write,
+            }
+            token_usage.add(sum(tokens.values()))
+            for direction in ("input", "output", "cache_read", "cache_write"):
+                metrics.llm_tokens.inc(
+                    tokens[f"{direction}_tokens"], agent=self.agent, direction=direction
+                )
+        metrics.observe(
+            metrics.llm_latency,
+            "llm",
+            duration,
+            agent=self.agent,
+            mode=mode,
+            provider=self.provider,
+            model=self.model,
+            **tokens,
+        )
+
+    async def cached(self, messages):
+        """Returns a cached completion for these messages, if caching is enabled."""
+        if self.cache is None:
+            return None
+        value = await self.cache.get(self._cache_key(messages))
+        if value is None:
+            self.cache_misses += 1
+        else:
+            self.cache_hits += 1
+        return value
+
+    async def remember(self, messages, text):
+        if self.cache is not None and text:
+            await self.cache.set(self._cache_key(messages), text)
+
+    def _cache_key(self, messages):
+        return make_key(messages, self.model, self.temperature)
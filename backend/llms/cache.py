@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+from backend.env import env_flag
+from backend.services.sqlite_store import SQLiteStore
+
+LLM_CACHE_ENABLED = env_flag("LLM_CACHE_ENABLED", True)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+LLM_CACHE_DISK_ENTRIES = int(os.getenv("LLM_CACHE_DISK_ENTRIES", "5000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def _normalize(text):
+    return " ".join(str(text).split())
+
+
+def make_key(messages, model, temperature) -> str:
+    """Hashes the prompt, ignoring whitespace differences, together with model settings."""
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "messages": [[m["role"], _normalize(m["content"])] for m in messages],
+    }
+    return hashlib.sha256(json.dumps(payload).encode()).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier memoizing cache for LLM completions: an in-memory LRU in front of
+    a SQLite table. Entries expire after `ttl` seconds and the least recently
+    used ones are evicted once a tier is full.
+    """
+
+    def __init__(
+        self,
+        path=LLM_CACHE_PATH,
+        memory_entries=LLM_CACHE_MEMORY_ENTRIES,
+        disk_entries=LLM_CACHE_DISK_ENTRIES,
+        ttl=LLM_CACHE_TTL,
+    ):
+        self.memory = OrderedDict()
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self.disk = SQLiteStore(path, "llm_cache", disk_entries, ttl)
+
+    async def get(self, key):
+        """Returns the cached completion for `key`, or None."""
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry and now - entry[1] < self.ttl:
+            self.memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return entry[0]
+        self.memory.pop(key, None)
+
+        value = await self.disk.get(key)
+        if value is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["disk_hits"] += 1
+        self._remember(key, value, now)
+        return value
+
+    async def set(self, key, value):
+        self._remember(key, value, time.time())
+        await self.disk.set(key, value)
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def _remember(self, key, value, now):
+        self.memory[key] = (value, now)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+
+_cache = None
+
+
+def get_cache():
+    """Returns the process-wide cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = LLMCache()
+    return _cache
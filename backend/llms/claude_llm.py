@@ -1,31 +1,177 @@
-from anthropic import AsyncAnthropic
-from dotenv import load_dotenv
-import os
+import time
 
-load_dotenv()
+from backend.env import env_flag
+from backend.llms.base import BaseLLM
+from backend.llms.gateway import get_gateway
 
+# 💾 Mark the static system prompt and the conversation so far as cacheable
+LLM_PROMPT_CACHING = env_flag("LLM_PROMPT_CACHING", True)
+CACHE_BREAKPOINT = {"type": "ephemeral"}
 
-class ClaudeLLM:
-    def __init__(self, model="claude-3-5-sonnet-20241022"):
-        self.client = AsyncAnthropic(api_key=os.getenv("CLAUDE_API_KEY"))
-        self.model = model
+
+class ChatStream:
+    """
+    Async iterator over the text deltas of a single completion.
+    Once iteration has finished, `text` holds the complete message and
+    `tool_calls` the tools the model called, if it was offered any.
+    With `stream_input`, that string field of a tool call is streamed as
+    it is generated too (e.g. a "thought"), although it is not part of `text`.
+    """
+
+    def __init__(self, llm, messages, tools=None, tool_choice=None, stream_input=None):
+        self.llm = llm
+        self.messages = messages
+        self.tools = tools
+        self.tool_choice = tool_choice
+        self.stream_input = stream_input
+        self.text = ""
+        self.tool_calls = []
+
+    async def __aiter__(self):
+        cached = None if self.tools else await self.llm.cached(self.messages)
+        if cached is not None:
+            self.text = cached
+            self.llm.record(0, "cached")
+            yield cached
+            return
+
+        parts = []
+        streamed = 0  # characters of the current tool call's `stream_input` sent so far
+
+        start = time.perf_counter()
+        async with self.llm.gateway.stream(
+            **self.llm.request(self.messages, self.tools, self.tool_choice)
+        ) as stream:
+            async for event in stream:
+                if event.type == "text":
+                    parts.append(event.text)
+                    yield event.text
+                elif event.type == "content_block_start":
+                    streamed = 0
+                elif event.type == "input_json" and self.stream_input:
+                    snapshot = event.snapshot if isinstance(event.snapshot, dict) else {}
+                    value = snapshot.get(self.stream_input)
+                    if isinstance(value, str) and len(value) > streamed:
+                        yield value[streamed:]
+                        streamed = len(value)
+            message = await stream.get_final_message()
+        self.llm.record(time.perf_counter() - start, "stream", message.usage)
+
+        self.text = "".join(parts).strip()
+        self.tool_calls = tool_calls(message)
+        if not self.tools:
+            await self.llm.remember(self.messages, self.text)
+
+
+class ClaudeLLM(BaseLLM):
+    provider = "claude"
+
+    def __init__(
+        self,
+        model="claude-3-5-sonnet-20241022",
+        gateway=None,
+        cache=None,
+        agent=None,
+        max_tokens=1024,
+        prompt_caching=LLM_PROMPT_CACHING,
+    ):
+        super().__init__(model, cache=cache, agent=agent, max_tokens=max_tokens)
+        # All instances share one pooled, rate-limited client unless told otherwise
+        self.gateway = gateway or get_gateway()
+        self.prompt_caching = prompt_caching
 
     async def chat(self, messages):
-        # Extract system prompt and actual messages
-        system_prompt = ""
-        cleaned_messages = []
-
-        for m in messages:
-            if m["role"] == "system":
-                system_prompt = m["content"]
-            else:
-                cleaned_messages.append(m)
-
-        response = await self.client.messages.create(
-            model=self.model,
-            max_tokens=1024,
-            temperature=0.5,
-            system=system_prompt,
-            messages=cleaned_messages,
+        cached = await self.cached(messages)
+        if cached is not None:
+            self.record(0, "cached")
+            return cached
+
+        start = time.perf_counter()
+        response = await self.gateway.create(**self.request(messages))
+        self.record(time.perf_counter() - start, "chat", response.usage)
+        text = response.content[0].text.strip()
+        await self.remember(messages, text)
+        return text
+
+    async def chat_tools(self, messages, tools, tool_choice=None):
+        """
+        Offers `tools` (Anthropic tool-use schemas) to the model.
+        Returns the text of the answer and the tools it called.
+        """
+        start = time.perf_counter()
+        response = await self.gateway.create(
+            **self.request(messages, tools, tool_choice)
         )
-        return response.content[0].text.strip()
+        self.record(time.perf_counter() - start, "chat", response.usage)
+        text = "".join(b.text for b in response.content if b.type == "text")
+        return text.strip(), tool_calls(response)
+
+    def chat_stream(self, messages, tools=None, tool_choice=None, stream_input=None):
+        """Streams the response token by token instead of waiting for all of it."""
+        return ChatStream(self, messages, tools, tool_choice, stream_input)
+
+    def request(self, messages, tools=None, tool_choice=None):
+        """
+        Keyword arguments of a Messages API request. With prompt caching, the
+        first system prompt (the agent's static instructions, together with
+        the tools) and the whole conversation up to the latest message end
+        in cache breakpoints, so each step reads what the previous one wrote.
+        """
+        system_prompts, cleaned_messages = split_system_prompt(messages)
+        system = [{"type": "text", "text": text} for text in system_prompts]
+        if self.prompt_caching:
+            if system:
+                system[0]["cache_control"] = CACHE_BREAKPOINT
+            cleaned_messages = mark_last_message(cleaned_messages)
+        kwargs = {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "messages": cleaned_messages,
+        }
+        if system:
+            kwargs["system"] = system
+        if tools:
+            kwargs["tools"] = tools
+            if tool_choice:
+                kwargs["tool_choice"] = tool_choice
+        return kwargs
+
+
+def tool_calls(message):
+    """The tool_use blocks of a response as [{"id", "name", "input"}]."""
+    return [
+        {"id": block.id, "name": block.name, "input": block.input}
+        for block in getattr(message, "content", None) or []
+        if block.type == "tool_use"
+    ]
+
+
+def split_system_prompt(messages):
+    """Extract system prompts (in order) and actual messages"""
+    system_prompts = []
+    cleaned_messages = []
+
+    for m in messages:
+        if m["role"] == "system":
+            system_prompts.append(m["content"])
+        else:
+            cleaned_messages.append(m)
+
+    return system_prompts, cleaned_messages
+
+
+def mark_last_message(messages):
+    """Copies `messages` with a cache breakpoint on the last content block."""
+    if not messages:
+        return messages
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content}]
+    else:
+        blocks = [dict(block) for block in content]
+    if not blocks:
+        return messages
+    blocks[-1]["cache_control"] = CACHE_BREAKPOINT
+    return messages[:-1] + [{**last, "content": blocks}]
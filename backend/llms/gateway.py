@@ -0,0 +1,174 @@
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+
+from anthropic import (
+    APIConnectionError,
+    APIStatusError,
+    AsyncAnthropic,
+    DefaultAsyncHttpxClient,
+)
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "50"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30.0"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+
+class TokenBucket:
+    """Simple token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def is_retryable(error) -> bool:
+    """Rate limits, overloads, server errors and dropped connections are retried."""
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """
+    Single shared entry point to the Anthropic API.
+    All agents reuse one keep-alive connection pool; requests are capped by a
+    semaphore, paced by a token bucket and retried with jittered backoff.
+    """
+
+    def __init__(
+        self,
+        api_key=None,
+        base_url=None,
+        max_in_flight=LLM_MAX_IN_FLIGHT,
+        requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+        max_retries=LLM_MAX_RETRIES,
+        backoff_base=LLM_BACKOFF_BASE,
+        backoff_max=LLM_BACKOFF_MAX,
+        timeout=LLM_TIMEOUT,
+    ):
+        # One keep-alive connection pool shared by every agent in the process
+        self.http_client = DefaultAsyncHttpxClient()
+        self.client = AsyncAnthropic(
+            api_key=api_key or os.getenv("CLAUDE_API_KEY"),
+            base_url=base_url or os.getenv("ANTHROPIC_BASE_URL"),
+            http_client=self.http_client,
+            timeout=timeout,
+            max_retries=0,  # retries are handled here so they respect our limits
+        )
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        rate = requests_per_minute / 60
+        self.bucket = TokenBucket(rate, max(1.0, rate * 10)) if rate > 0 else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+
+    def saturated(self) -> bool:
+        """True while every in-flight slot is taken or the rate limit is exhausted."""
+        return self.semaphore.locked() or (
+            self.bucket is not None and self.bucket.tokens < 1
+        )
+
+    def backoff_delay(self, attempt, error=None):
+        """Full-jitter exponential backoff, never shorter than a server Retry-After."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+        retry_after = _retry_after(error)
+        return max(delay, retry_after) if retry_after else delay
+
+    async def _with_retries(self, send):
+        attempt = 0
+        while True:
+            if self.bucket:
+                await self.bucket.acquire()
+            self.stats["requests"] += 1
+            try:
+                return await send()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    self.stats["failures"] += 1
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.backoff_delay(attempt, e))
+                attempt += 1
+
+    async def create(self, **kwargs):
+        """Sends a `messages.create` request through the shared limits."""
+        async with self.semaphore:
+            return await self._with_retries(
+                lambda: self.client.messages.create(**kwargs)
+            )
+
+    @asynccontextmanager
+    async def stream(self, **kwargs):
+        """
+        Opens a `messages.stream` request through the shared limits.
+        Only opening the stream is retried; once tokens flow, errors propagate.
+        """
+        async with self.semaphore:
+            manager = None
+
+            async def open_stream():
+                nonlocal manager
+                manager = self.client.messages.stream(**kwargs)
+                return await manager.__aenter__()
+
+            stream = await self._with_retries(open_stream)
+            try:
+                yield stream
+            finally:
+                await manager.__aexit__(None, None, None)
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+_gateway = None
+
+
+def get_gateway():
+    """Returns the process-wide gateway, creating it on first use."""
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+    return _gateway
+
+
+def set_gateway(gateway):
+    """Replaces the process-wide gateway (e.g. to point at a local fake server)."""
+    global _gateway
+    _gateway = gateway
@@ -0,0 +1,141 @@
+import os
+import time
+from types import SimpleNamespace
+
+import ollama
+
+from backend.llms.base import BaseLLM
+
+# 🦙 Local models served by Ollama (or anything speaking its /api/chat)
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+
+_clients = {}
+
+
+def get_client(host=OLLAMA_HOST):
+    """One pooled client per Ollama host, shared by every agent."""
+    client = _clients.get(host)
+    if client is None:
+        client = _clients[host] = ollama.AsyncClient(host=host, timeout=OLLAMA_TIMEOUT)
+    return client
+
+
+def ollama_tools(tools):
+    """Anthropic tool schemas in the function-calling format Ollama expects."""
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": tool["name"],
+                "description": tool.get("description", ""),
+                "parameters": tool["input_schema"],
+            },
+        }
+        for tool in tools or []
+    ]
+
+
+def tool_calls(message):
+    """The tool calls of an Ollama message as [{"id", "name", "input"}]."""
+    return [
+        {
+            "id": f"ollama-{i}",
+            "name": call.function.name,
+            "input": dict(call.function.arguments or {}),
+        }
+        for i, call in enumerate(getattr(message, "tool_calls", None) or [])
+    ]
+
+
+def usage(response):
+    return SimpleNamespace(
+        input_tokens=response.prompt_eval_count or 0,
+        output_tokens=response.eval_count or 0,
+    )
+
+
+class OllamaStream:
+    """Same contract as ClaudeLLM's ChatStream: yields text, then exposes `text` and `tool_calls`."""
+
+    def __init__(self, llm, messages, tools=None):
+        self.llm = llm
+        self.messages = messages
+        self.tools = tools
+        self.text = ""
+        self.tool_calls = []
+
+    async def __aiter__(self):
+        cached = None if self.tools else await self.llm.cached(self.messages)
+        if cached is not None:
+            self.text = cached
+            self.llm.record(0, "cached")
+            yield cached
+            return
+
+        parts = []
+        final = None
+        start = time.perf_counter()
+        async for part in await self.llm.client.chat(
+            **self.llm.request(self.messages, self.tools), stream=True
+        ):
+            if part.message.content:
+                parts.append(part.message.content)
+                yield part.message.content
+            self.tool_calls.extend(tool_calls(part.message))
+            if part.done:
+                final = part
+        self.llm.record(
+            time.perf_counter() - start, "stream", usage(final) if final else None
+        )
+
+        self.text = "".join(parts).strip()
+        if not self.tools:
+            await self.llm.remember(self.messages, self.text)
+
+
+class OllamaLLM(BaseLLM):
+    """
+    A model served by Ollama. Takes the same messages as ClaudeLLM (the system
+    prompt stays in the list); `tool_choice` is not supported and ignored.
+    """
+
+    provider = "ollama"
+
+    def __init__(
+        self, model="llama3.2", host=OLLAMA_HOST, cache=None, agent=None, max_tokens=1024
+    ):
+        super().__init__(model, cache=cache, agent=agent, max_tokens=max_tokens)
+        self.client = get_client(host)
+
+    async def chat(self, messages):
+        cached = await self.cached(messages)
+        if cached is not None:
+            self.record(0, "cached")
+            return cached
+
+        start = time.perf_counter()
+        response = await self.client.chat(**self.request(messages))
+        self.record(time.perf_counter() - start, "chat", usage(response))
+        text = (response.message.content or "").strip()
+        await self.remember(messages, text)
+        return text
+
+    async def chat_tools(self, messages, tools, tool_choice=None):
+        start = time.perf_counter()
+        response = await self.client.chat(**self.request(messages, tools))
+        self.record(time.perf_counter() - start, "chat", usage(response))
+        return (response.message.content or "").strip(), tool_calls(response.message)
+
+    def chat_stream(self, messages, tools=None, tool_choice=None, stream_input=None):
+        return OllamaStream(self, messages, tools)
+
+    def request(self, messages, tools=None):
+        kwargs = {
+            "model": self.model,
+            "messages": messages,
+            "options": {"temperature": self.temperature, "num_predict": self.max_tokens},
+        }
+        if tools:
+            kwargs["tools"] = ollama_tools(tools)
+        return kwargs
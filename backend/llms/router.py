@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+import ollama
+
+from backend.llms.claude_llm import ClaudeLLM
+from backend.llms.gateway import is_retryable
+from backend.llms.ollama_llm import OllamaLLM
+from backend.services import metrics
+
+# 🧭 Which models each agent role uses, in order of preference: "provider:model,..."
+DEFAULT_ROUTES = {
+    "reasoning": "claude:claude-3-5-sonnet-20241022",
+    "prompt_engineer": "claude:claude-3-5-haiku-20241022,claude:claude-3-5-sonnet-20241022",
+    "reflector": "claude:claude-3-5-haiku-20241022,claude:claude-3-5-sonnet-20241022",
+}
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "1024"))
+# Seconds a provider gets (to its first token when streaming) before the next one is tried
+LLM_FAILOVER_TIMEOUT = float(os.getenv("LLM_FAILOVER_TIMEOUT", "30"))
+# Seconds a provider that timed out or failed is tried last
+LLM_PROVIDER_COOLDOWN = float(os.getenv("LLM_PROVIDER_COOLDOWN", "60"))
+
+PROVIDERS = {"claude": ClaudeLLM, "ollama": OllamaLLM}
+
+llm_failovers = metrics.registry.counter(
+    "agent_llm_failovers_total",
+    "LLM requests handed to the next provider of a route",
+    ("agent", "provider", "reason"),
+)
+llm_provider_latency = metrics.registry.gauge(
+    "agent_llm_provider_latency_seconds",
+    "Moving average of each provider's latency (to the first token when streaming)",
+    ("provider", "model"),
+)
+
+
+def should_fail_over(error) -> bool:
+    """
+    Timeouts and outages (dropped connections, rate limits, server errors) move
+    a request to the next provider; errors in the request itself, such as a
+    bad key or a prompt that is too long, would fail there too.
+    """
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError, ConnectionError)):
+        return True
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code == 429 or error.status_code >= 500
+    return is_retryable(error)
+
+
+def route_spec(agent):
+    """The route of an agent role, from LLM_ROUTE_<ROLE> or the defaults."""
+    return os.getenv(
+        f"LLM_ROUTE_{agent.upper()}",
+        DEFAULT_ROUTES.get(agent, DEFAULT_ROUTES["reasoning"]),
+    )
+
+
+def parse_route(spec):
+    """Parses "claude:claude-3-5-haiku-20241022,ollama:llama3.2" into (provider, model) pairs."""
+    route = []
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        provider, _, model = entry.strip().partition(":")
+        if provider not in PROVIDERS or not model:
+            raise ValueError(f"Invalid LLM route entry: {entry!r}")
+        route.append((provider, model))
+    if not route:
+        raise ValueError(f"Empty LLM route: {spec!r}")
+    return route
+
+
+class ProviderHealth:
+    """Latency and recent failures of one provider:model, shared by every route using it."""
+
+    def __init__(self, provider, model, cooldown=LLM_PROVIDER_COOLDOWN):
+        self.provider = provider
+        self.model = model
+        self.cooldown = cooldown
+        self.latency = None  # exponential moving average, in seconds
+        self.failures = 0
+        self.down_until = 0.0
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.down_until
+
+    def succeeded(self, latency):
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        self.failures = 0
+        self.down_until = 0.0
+        llm_provider_latency.set(self.latency, provider=self.provider, model=self.model)
+
+    def failed(self):
+        self.failures += 1
+        self.down_until = time.monotonic() + self.cooldown
+
+
+_health = {}
+
+
+def provider_health(llm):
+    health = _health.get(llm.name)
+    if health is None:
+        health = _health[llm.name] = ProviderHealth(llm.provider, llm.model)
+    return health
+
+
+class RoutedStream:
+    """
+    Streams from the first provider of the route that starts answering in
+    time. Once a provider has sent text, the answer is not moved to another
+    one: its errors reach the caller like any other.
+    """
+
+    def __init__(self, router, messages, options):
+        self.router = router
+        self.messages = messages
+        self.options = options
+        self.text = ""
+        self.tool_calls = []
+
+    async def __aiter__(self):
+        error = None
+        for llm, timeout in self.router.attempts():
+            stream = llm.chat_stream(self.messages, **self.options)
+            chunks = stream.__aiter__()
+            start = time.perf_counter()
+            try:
+                first = await asyncio.wait_for(_first(chunks), timeout)
+            except Exception as e:
+                await chunks.aclose()
+                if not should_fail_over(e):
+                    raise
+                self.router.failed(llm, e)
+                error = e
+                continue
+            self.router.succeeded(llm, time.perf_counter() - start)
+
+            if first is not None:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+            self.text = stream.text
+            self.tool_calls = getattr(stream, "tool_calls", [])
+            return
+        raise error
+
+
+async def _first(chunks):
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class RoutedLLM:
+    """
+    Same interface as ClaudeLLM, backed by an ordered list of providers.
+    A request goes to the first provider that is not cooling down; if it
+    times out or fails it is retried on the next one, and the provider is
+    tried last for LLM_PROVIDER_COOLDOWN seconds.
+    """
+
+    def __init__(self, agent, providers, timeout=LLM_FAILOVER_TIMEOUT):
+        self.agent = agent
+        self.providers = providers
+        self.timeout = timeout
+
+    def attempts(self):
+        """(provider, timeout) in the order to try them; the last one has no timeout."""
+        ordered = sorted(
+            self.providers, key=lambda llm: not provider_health(llm).available
+        )
+        return [
+            (llm, self.timeout if i < len(ordered) - 1 else None)
+            for i, llm in enumerate(ordered)
+        ]
+
+    async def chat(self, messages):
+        return await self._call("chat", messages)
+
+    async def chat_tools(self, messages, tools, tool_choice=None):
+        return await self._call("chat_tools", messages, tools, tool_choice)
+
+    def chat_stream(self, messages, tools=None, tool_choice=None, stream_input=None):
+        return RoutedStream(
+            self,
+            messages,
+            {"tools": tools, "tool_choice": tool_choice, "stream_input": stream_input},
+        )
+
+    async def _call(self, method, *args):
+        error = None
+        for llm, timeout in self.attempts():
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(getattr(llm, method)(*args), timeout)
+            except Exception as e:
+                if not should_fail_over(e):
+                    raise
+                self.failed(llm, e)
+                error = e
+                continue
+            self.succeeded(llm, time.perf_counter() - start)
+            return result
+        raise error
+
+    def succeeded(self, llm, latency):
+        provider_health(llm).succeeded(latency)
+
+    def failed(self, llm, error):
+        provider_health(llm).failed()
+        reason = "timeout" if isinstance(error, asyncio.TimeoutError) else "error"
+        llm_failovers.inc(agent=self.agent, provider=llm.name, reason=reason)
+        logging.warning(f"LLM {llm.name} failed for {self.agent} ({reason}): {error!r}")
+
+
+def route_llm(agent, cache=None):
+    """Builds the LLM of an agent role from its route."""
+    providers = [
+        PROVIDERS[provider](
+            model=model, cache=cache, agent=agent, max_tokens=LLM_MAX_TOKENS
+        )
+        for provider, model in parse_route(route_spec(agent))
+    ]
+    return RoutedLLM(agent, providers)
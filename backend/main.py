@@ -1,13 +1,38 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from pydantic import BaseModel
+import asyncio
+import os
 import uuid
+from contextlib import asynccontextmanager
+from backend.services import events, metrics
 from backend.services.agent_orchestrator import AgentOrchestrator
 from backend.services.agent_orchestrator import cancel_execution
-from backend.services.state import approval_channels
+from backend.services.batches import BATCH_MAX_REPOS, Batch, BatchScheduler
+from backend.services.event_store import event_store
+from backend.services.output_log import log_path, parse_range, read_range
+from backend.services.shell_pool import SHELL_SESSIONS_ENABLED, shell_pool
+from backend.services.sse import accepts_gzip, encode_events, stream_headers
+from backend.services.state import state_backend
+from backend.services.task_registry import TaskState, task_registry
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import (
+    FileResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # 🐚 Have shells ready before the first task asks for one
+    if SHELL_SESSIONS_ENABLED:
+        shell_pool.refill()
+    yield
+    await shell_pool.shutdown()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS to allow frontend requests
 app.add_middleware(
@@ -16,19 +41,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods (POST, GET, etc.)
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["X-Task-ID"],  # Lets the frontend cancel its own task
 )
 
-# Store task statuses and LLM output history
-task_status = {}
-llm_outputs = {}
-
 # Instantiate orchestrator
 orchestrator = AgentOrchestrator()
 
+# Keep references to running tasks so they are not garbage collected
+background_tasks = set()
+
 
 class UserRequest(BaseModel):
     user_input: str
     repo_name: str
+    plan_mode: bool | None = None  # None uses the server default (PLAN_MODE)
+
+
+class BatchRequest(BaseModel):
+    instruction: str
+    repos: list[str]
+    priority: int = 0  # higher runs first
+    approve_patterns: list[str] = []  # e.g. ["git add *", "git commit -m *"]
+    plan_mode: bool | None = None
+    llm_token_budget: int | None = None  # stop starting new tasks past this
+
+
+class BatchApproval(BaseModel):
+    pattern: str
 
 
 class ApprovalRequest(BaseModel):
@@ -38,7 +77,9 @@ class ApprovalRequest(BaseModel):
 
 
 @app.post("/run-automation")
-async def run_automation(request: UserRequest):
+async def run_automation(
+    request: UserRequest, accept_encoding: str | None = Header(default=None)
+):
     user_input = request.user_input.strip()
     repo_name = request.repo_name.strip()
 
@@ -48,36 +89,154 @@ async def run_automation(request: UserRequest):
         )
 
     task_id = str(uuid.uuid4())
-    task_status[task_id] = "Running"
 
-    async def log_stream():
-        try:
-            async for log in orchestrator.run(task_id, repo_name, user_input):
-                yield log
-            task_status[task_id] = "Completed"
-            yield "\n✅ Task Completed!"
-        except Exception as e:
-            task_status[task_id] = "Failed"
-            yield f"\n❌ Error: {str(e)}"
+    # 🚀 The task runs on its own; this response only follows its event log
+    await event_store.open(task_id)
+    task = asyncio.create_task(
+        run_task(task_id, repo_name, user_input, request.plan_mode)
+    )
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+    compress = accepts_gzip(accept_encoding)
+    return StreamingResponse(
+        encode_events(event_store.follow(task_id), compress=compress),
+        media_type="text/event-stream",
+        headers=stream_headers(compress, **{"X-Task-ID": task_id}),
+    )
+
+
+async def run_task(task_id, repo_name, user_input, plan_mode=None, on_event=None):
+    """
+    Runs the orchestrator independently of any HTTP connection, logging every
+    event (and passing it to `on_event`). Returns the final task state.
+    """
+    try:
+        async for event in orchestrator.run(
+            task_id, repo_name, user_input, plan_mode=plan_mode
+        ):
+            event_store.append(task_id, event["type"], event["data"])
+            if on_event is not None:
+                await on_event(event)
+    except Exception as e:
+        event = events.status(f"\n❌ Error: {str(e)}", level="error")
+        event_store.append(task_id, event["type"], event["data"])
+    finally:
+        status = task_registry.status(task_id) or TaskState.FAILED
+        if status == TaskState.COMPLETED:
+            event = events.status("\n✅ Task Completed!", state=status, final=True)
+        else:
+            event = events.status("", state=status, final=True)
+        event_store.append(task_id, event["type"], event["data"])
+        await event_store.close(task_id, status)
+    return status
+
+
+# 🚚 Batch tasks are queued and paced by one scheduler per process
+batch_scheduler = BatchScheduler(run_task)
+
+
+@app.post("/batches", status_code=202)
+async def create_batch(request: BatchRequest):
+    """Rolls one instruction out to many repositories."""
+    instruction = request.instruction.strip()
+    repos = list(dict.fromkeys(r.strip() for r in request.repos if r.strip()))
+    if not instruction or not repos:
+        raise HTTPException(
+            status_code=400, detail="An instruction and at least one repo are required"
+        )
+    if len(repos) > BATCH_MAX_REPOS:
+        raise HTTPException(
+            status_code=400, detail=f"A batch is limited to {BATCH_MAX_REPOS} repos"
+        )
+
+    batch = batch_scheduler.submit(
+        Batch(
+            instruction,
+            repos,
+            priority=request.priority,
+            approve_patterns=request.approve_patterns,
+            plan_mode=request.plan_mode,
+            llm_token_budget=request.llm_token_budget,
+        )
+    )
+    return {
+        "batch_id": batch.id,
+        "total": len(batch.jobs),
+        "queued": batch_scheduler.queued(),
+    }
+
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Progress, throughput and per-repo state of a batch."""
+    batch = batch_scheduler.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found.")
+    return batch.summary()
+
+
+@app.post("/batches/{batch_id}/approve")
+async def approve_batch(batch_id: str, request: BatchApproval):
+    """Approves an action pattern once for every task of the batch, including pending ones."""
+    batch = batch_scheduler.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found.")
+    approved = await batch_scheduler.approve(batch, request.pattern.strip())
+    return {
+        "batch_id": batch_id,
+        "approve_patterns": batch.approve_patterns,
+        "approved": approved,
+    }
+
+
+@app.post("/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    batch = batch_scheduler.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found.")
+    await batch_scheduler.cancel(batch, cancel_execution)
+    return {"message": "Batch cancelled", "batch_id": batch_id}
 
-    return StreamingResponse(log_stream(), media_type="text/event-stream")
+
+@app.get("/tasks/{task_id}/events")
+async def task_events(
+    task_id: str,
+    last_event_id: str | None = Header(default=None),
+    accept_encoding: str | None = Header(default=None),
+    after: int | None = None,
+):
+    """Reattaches to a task, replaying only the events after Last-Event-ID."""
+    if await event_store.status(task_id) is None:
+        raise HTTPException(status_code=404, detail="Task ID not found.")
+
+    if after is None:
+        after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+
+    compress = accepts_gzip(accept_encoding)
+    return StreamingResponse(
+        encode_events(event_store.follow(task_id, after), compress=compress),
+        media_type="text/event-stream",
+        headers=stream_headers(compress),
+    )
 
 
 @app.post("/approve-action")
 async def approve_action(request: ApprovalRequest):
     task_id = request.task_id
-    if task_id not in approval_channels:
-        raise HTTPException(
-            status_code=404, detail="Task ID not found or already processed."
-        )
 
-    # 🧠 Put approval response directly into the channel
-    await approval_channels[task_id].put(
+    # 🧠 Route the decision to whichever worker owns the step
+    delivered = await state_backend.submit_approval(
+        task_id,
         {
             "approved": request.approved,
             "edited_command": request.edited_command,
-        }
+        },
     )
+    if not delivered:
+        raise HTTPException(
+            status_code=404, detail="Task ID not found or already processed."
+        )
 
     return {
         "status": "acknowledged",
@@ -89,15 +248,78 @@ async def approve_action(request: ApprovalRequest):
 
 @app.get("/get-llm-output/{task_id}")
 async def get_llm_output(task_id: str):
-    """Optional: Retrieve raw LLM output if you choose to store it."""
-    if task_id not in llm_outputs:
+    """Retrieve the full output of a task from its event log."""
+    stored = await event_store.read(task_id)
+    if not stored:
         raise HTTPException(
             status_code=404, detail="Task ID not found or no LLM output available."
         )
-    return {"llm_output": llm_outputs[task_id]}
+    return {
+        "llm_output": "".join(e["data"].get("text", "") for e in stored),
+        "status": await event_store.status(task_id),
+    }
+
+
+@app.get("/tasks/{task_id}/output")
+async def task_output(task_id: str, range: str | None = Header(default=None)):
+    """
+    Full output of every command a task ran. Result events carry the byte
+    range of each command, which can be fetched with `Range: bytes=start-end`.
+    """
+    try:
+        path = log_path(task_id)
+    except ValueError:
+        path = None
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No output for this task.")
+    if range is None:
+        return FileResponse(
+            path, media_type="text/plain; charset=utf-8", headers={"Accept-Ranges": "bytes"}
+        )
+
+    size = os.path.getsize(path)
+    try:
+        start, end = parse_range(range, size)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=416, detail=str(e), headers={"Content-Range": f"bytes */{size}"}
+        )
+    content = await asyncio.to_thread(read_range, path, start, end)
+    return Response(
+        content,
+        status_code=206,
+        media_type="text/plain; charset=utf-8",
+        headers={"Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{size}"},
+    )
+
+
+@app.get("/tasks/{task_id}/trace")
+async def task_trace(task_id: str):
+    """Where the time of one task went: LLM calls, commands, approvals, repo sync."""
+    trace = metrics.traces.get(task_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="No trace for this task.")
+    return trace
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
 
 
 @app.post("/cancel-automation")
 async def cancel_automation():
-    cancel_execution()
+    await cancel_execution()
     return {"message": "Automation cancelled"}
+
+
+@app.post("/cancel-automation/{task_id}")
+async def cancel_task(task_id: str):
+    if not await cancel_execution(task_id):
+        raise HTTPException(
+            status_code=404, detail="Task ID not found or already finished."
+        )
+    return {"message": "Automation cancelled", "task_id": task_id}
@@ -1,207 +1,792 @@
-from .agents.reasoning_agent import ReasoningAgent
+from .agents.reasoning_agent import AnswerFormatError, ReasoningAgent, tool_answer
 from .agents.prompt_agent import PromptEngineerAgent
 from .agents.reflector_agent import ReflectorAgent
+from backend.env import env_flag
+from backend.services import events, metrics
 import asyncio
+import logging
 import uuid
 import os
-import subprocess
 import re
-from backend.services.state import approval_channels, cancelled_tasks
+from backend.services.executor import CommandResult, command_slot, stream_command
+from backend.services.output_log import (
+    OUTPUT_STREAM_CHARS,
+    CapturedResult,
+    SpooledResult,
+)
+from backend.services.plan_cache import PLAN_CACHE_ENABLED, PlanReplay, get_plan_cache
+from backend.services.policy import Classification, command_policy
+from backend.services.history import (
+    HISTORY_TOKEN_BUDGET,
+    HistoryManager,
+    count_message_tokens,
+)
+from backend.services.repo_index import REPO_INDEX_ENABLED, RepoIndex, moves_head
+from backend.services.repo_manager import REPOS_DIR, RepoManager, is_push
+from backend.services.shell_pool import (
+    SHELL_SESSIONS_ENABLED,
+    SessionError,
+    shell_pool,
+)
+from backend.services.speculation import SPECULATION_ENABLED, Speculator
+from backend.services.state import state_backend
+from backend.services.task_registry import (
+    ApprovalTimeout,
+    TaskCancelled,
+    TaskState,
+    task_registry,
+)
+
+
+# 📋 Plan mode: several commands per LLM turn, approved together
+PLAN_MODE = env_flag("PLAN_MODE", False)
+PLAN_MAX_STEPS = int(os.getenv("PLAN_MAX_STEPS", "10"))
+# 📝 How many times an answer without a usable Action or Plan is sent back for correction
+FORMAT_RETRIES = int(os.getenv("FORMAT_RETRIES", "2"))
 
 
 class AgentOrchestrator:
-    def __init__(self, model_name=None):
+    def __init__(
+        self,
+        model_name=None,
+        token_budget=HISTORY_TOKEN_BUDGET,
+        repo_manager=None,
+        speculate=SPECULATION_ENABLED,
+        policy=command_policy,
+        plan_mode=PLAN_MODE,
+        replay_plans=PLAN_CACHE_ENABLED,
+        shell_sessions=SHELL_SESSIONS_ENABLED,
+        index_repos=REPO_INDEX_ENABLED,
+    ):
         self.reasoning_agent = ReasoningAgent(model_name)
         self.prompt_engineer = PromptEngineerAgent(model_name)
         self.reflector_agent = ReflectorAgent(model_name)
+        self.token_budget = token_budget
+        self.repo_manager = repo_manager or RepoManager()
+        self.speculate = speculate
+        self.policy = policy
+        self.plan_mode = plan_mode
+        self.replay_plans = replay_plans
+        self.shell_sessions = shell_sessions
+        self.index_repos = index_repos
+        self.repo_index = RepoIndex(self.repo_manager.base_dir)
+
+    async def run(
+        self, task_id, repo_name, user_input, token_budget=None, plan_mode=None
+    ):
+        await task_registry.register(task_id, repo_name)
+        metrics.current_task_id.set(task_id)
+        state = TaskState.FAILED
+        if plan_mode is None:
+            plan_mode = self.plan_mode
+        try:
+            async for event in self._run(
+                task_id, repo_name, user_input, token_budget, plan_mode
+            ):
+                yield event
+            state = TaskState.COMPLETED
+        except TaskCancelled as e:
+            state = TaskState.TIMED_OUT if e.reason == "timeout" else TaskState.CANCELLED
+            yield events.status(f"\n🛑 Task stopped: {state}.", state=state)
+        except ApprovalTimeout:
+            state = TaskState.TIMED_OUT
+            yield events.status(
+                "\n⌛ No approval received in time. Task stopped.", state=state
+            )
+        except asyncio.CancelledError:
+            state = TaskState.CANCELLED
+            raise
+        finally:
+            # 🧹 Free the workspace, approval channels and history of the task
+            await self.release_workspace(task_id, repo_name)
+            await task_registry.finish(task_id, state)
+
+    async def _run(self, task_id, repo_name, user_input, token_budget, plan_mode):
+        history = HistoryManager(token_budget=token_budget or self.token_budget)
+        task_registry.get(task_id).history = history
+
+        # 📦 Prepare the workspace while the prompt is being refined
+        workspace_task = asyncio.create_task(
+            self.repo_manager.create_worktree(task_id, repo_name)
+        )
 
-    async def run(self, task_id, repo_name, user_input):
-        approval_q = asyncio.Queue()
-        history = []
-        approval_channels[task_id] = approval_q
-
-        refined_input = await self.prompt_engineer.refine(user_input)
-        yield f"\n🧠 Refined Task: {refined_input}"
-        yield "\n"
+        refine_stream = self.prompt_engineer.refine_stream(user_input)
+        yield events.thought("\n🧠 Refined Task: ", agent="prompt_engineer")
+        async for delta in refine_stream:
+            yield events.thought(delta, agent="prompt_engineer")
+        refined_input = refine_stream.text
+        yield events.thought("\n", agent="prompt_engineer")
 
-        repo_path = f"./repos/{repo_name}"
-        if os.path.exists(repo_path):
-            history.append(
+        try:
+            workspace = await workspace_task
+            history.pin(
                 {
                     "role": "user",
-                    "content": f"The repository {repo_name} is already cloned locally into {repo_path}. You are already in the correct directory. DO NOT clone again or use 'cd'.",
+                    "content": f"The repository {repo_name} is already cloned locally and checked out at the latest origin/{self.repo_manager.default_branch} in your working directory. You start in its root directory. DO NOT clone again or 'cd' out of it; `cd` into its subdirectories is fine. `git push` publishes your commits to origin/{self.repo_manager.default_branch}.",
                 }
             )
-            # Check if repo is behind origin/main
-            try:
-                result = subprocess.run(
-                    ["git", "remote", "update"],
-                    cwd=repo_path,
-                    capture_output=True,
-                    text=True,
+            yield events.status(f"\n📂 Workspace ready for `{repo_name}`.\n")
+        except Exception as e:
+            workspace = None
+            yield events.status(
+                f"\n⚠️ Could not prepare a workspace for `{repo_name}`: {str(e)}\n",
+                level="warning",
+            )
+            if os.path.exists(self.repo_manager.legacy_path(repo_name)):
+                history.pin(
+                    {
+                        "role": "user",
+                        "content": f"The repository {repo_name} is already cloned locally into ./repos/{repo_name}. You start in its root directory. DO NOT clone again or 'cd' out of it; `cd` into its subdirectories is fine.",
+                    }
                 )
-
-                rev_list = subprocess.run(
-                    ["git", "rev-list", "HEAD...origin/main", "--count"],
-                    cwd=repo_path,
-                    capture_output=True,
-                    text=True,
+            else:
+                history.pin(
+                    {
+                        "role": "user",
+                        "content": f"The repository {repo_name} is NOT cloned yet. Start either by cloning it using: git clone https://github.com/eugenius0/{repo_name}.git or if its a gitlab repo using: https://gitlab.com/{repo_name}.git",  # hardcoded username
+                    }
                 )
 
-                if rev_list.returncode == 0 and rev_list.stdout.strip() != "0":
-                    history.append(
-                        {
-                            "role": "user",
-                            "content": f"The local repository {repo_name} is out of sync with origin/main. Automatically pulling latest changes...",
-                        }
-                    )
-
-                    try:
-                        pull_result = subprocess.run(
-                            ["git", "pull", "origin", "main"],
-                            cwd=repo_path,
-                            capture_output=True,
-                            text=True,
-                        )
-                        if pull_result.returncode == 0:
-                            history.append(
-                                {
-                                    "role": "user",
-                                    "content": f"✅ Successfully pulled latest changes:\n{pull_result.stdout.strip()}",
-                                }
-                            )
-                            yield f"\n📥 Auto-update: Pulled latest changes from origin/main for `{repo_name}`."
-                            yield "\n"
-                        else:
-                            history.append(
-                                {
-                                    "role": "user",
-                                    "content": f"❌ Failed to pull latest changes:\n{pull_result.stderr.strip()}",
-                                }
-                            )
-                    except Exception as e:
-                        history.append(
-                            {
-                                "role": "user",
-                                "content": f"❌ Exception while pulling latest changes: {str(e)}",
-                            }
-                        )
-
-                else:
-                    history.append(
-                        {
-                            "role": "user",
-                            "content": f"The local repository {repo_name} is up to date with origin/main.",
-                        }
-                    )
-
+        # 🗂️ Tell the agents what the repository contains instead of having them explore
+        if self.index_repos and workspace:
+            try:
+                manifest = await self.repo_index.update(repo_name, workspace)
+                message = {"role": "user", "content": manifest.text()}
+                history.pin(message)
+                task_registry.get(task_id).manifest = message
+                yield events.status(
+                    f"\n🗂️ Indexed `{repo_name}`: {len(manifest.files)} files.\n",
+                    index_commit=manifest.commit,
+                )
             except Exception as e:
-                history.append(
+                logging.warning(f"Could not index {repo_name} for task {task_id}: {e}")
+
+        # 🐚 Run the task's commands in one persistent shell, like a terminal
+        if self.shell_sessions and workspace:
+            try:
+                await shell_pool.lease(task_id, workspace)
+                history.pin(
                     {
                         "role": "user",
-                        "content": f"⚠️ Failed to check sync status for {repo_name}. Reason: {str(e)}",
+                        "content": "Your commands run one after another in the same shell session: directory changes, exported variables and activated virtualenvs carry over to the next step.",
                     }
                 )
+            except Exception as e:
+                logging.warning(f"No shell session for task {task_id}: {e}")
 
-        else:
-            history.append(
-                {
-                    "role": "user",
-                    "content": f"The repository {repo_name} is NOT cloned yet. Start either by cloning it using: git clone https://github.com/eugenius0/{repo_name}.git or if its a gitlab repo using: https://gitlab.com/{repo_name}.git",  # hardcoded username
-                }
+        # ♻️ Reuse the commands that completed this task on a similar repo before
+        replay = None
+        if self.replay_plans and workspace:
+            try:
+                replay = await PlanReplay.start(get_plan_cache(), user_input, workspace)
+            except Exception as e:
+                logging.warning(f"Plan cache lookup failed for task {task_id}: {e}")
+        if replay and replay.active:
+            yield events.status(
+                f"\n♻️ Replaying a cached plan of {len(replay.cached)} steps. "
+                "The Reasoning Agent takes over if anything differs.\n",
+                plan_cache="hit",
+                steps=len(replay.cached),
             )
 
-        while True:
-            # 🔍 Get LLM output
-            thought_output = await self.reasoning_agent.think(
-                refined_input, repo_name, history
+        # 🔮 Work ahead while approvals are pending (needs an isolated workspace)
+        speculator = None
+        if self.speculate and workspace and not plan_mode:
+            speculator = Speculator(
+                task_id,
+                self.reasoning_agent,
+                repo_name,
+                workspace,
+                refined_input,
+                format_result,
             )
-
-            # ✅ Extract action before appending to history
-            action = extract_action(thought_output)
-
-            # Ensure the Result line is a placeholder before execution
-            if (
-                "Result:" in thought_output
-                and "Will be filled in after execution" not in thought_output
+        steps = self._plan_steps if plan_mode else self._steps
+        try:
+            async for event in steps(
+                task_id, repo_name, refined_input, history, workspace, speculator, replay
             ):
-                yield "\n⚠️ Warning: The agent hallucinated a Result. Retrying with corrected instruction..."
-                yield "\n"
+                yield event
+            if replay:
+                await replay.finish()
+        finally:
+            if speculator:
+                speculator.close()
+
+        if speculator and speculator.stats["speculations"]:
+            yield events.status(
+                f"\n🔮 Speculation: {speculator.stats['hits']}/"
+                f"{speculator.stats['speculations']} approvals reused precomputed work "
+                f"({speculator.hit_rate():.0%} hit rate)",
+                speculation=dict(speculator.stats),
+            )
 
-                history.append(
-                    {
-                        "role": "user",
-                        "content": (
-                            "⚠️ You included a real Result before the Action was approved or executed. "
-                            "Please only use: Result: Will be filled in after execution.\n"
-                            "Try again with the same Thought and Action, but follow the structure strictly."
-                        ),
-                    }
+    async def _steps(
+        self, task_id, repo_name, refined_input, history, workspace, speculator, replay
+    ):
+        """One Thought → Action → Result round trip (and approval) per command."""
+        speculation = None
+        format_retries = 0
+        while True:
+            task_registry.check_cancelled(task_id)
+
+            # 📏 Report how large the prompt for this step is
+            context = history.messages()
+            yield self._prompt_size(refined_input, repo_name, history, context)
+
+            # 🔮 Reuse the next thought if it was precomputed from this exact history
+            thought_output = None
+            action = None
+            format_error = None
+            if speculation:
+                thought_output = await speculator.thought_for(speculation, context)
+                speculation = None
+            if thought_output is not None:
+                yield events.thought(f"\n🧠 {thought_output}\n")
+            elif replay and replay.active:
+                thought_output = replay_thought(replay)
+                yield events.thought(f"\n♻️ {thought_output}\n")
+            else:
+                # 🔍 Stream LLM output as it is generated
+                thought_stream = self.reasoning_agent.think_stream(
+                    refined_input, repo_name, context
                 )
+                async for event in self._stream_thought(thought_stream):
+                    yield event
+                thought_output = thought_stream.text
+
+                # 🧰 A run_command / final_answer call needs no parsing
+                try:
+                    answer = tool_answer(getattr(thought_stream, "tool_calls", None))
+                except AnswerFormatError as e:
+                    answer, format_error = None, str(e)
+                if answer:
+                    thought_output, action = answer
+                    metrics.answer_formats.inc(source="tool")
+                    # Only the thought was streamed; show the call like a text answer
+                    call_line = thought_output.splitlines()[1]
+                    yield events.thought(f"{call_line}\n")
+                else:
+                    metrics.answer_formats.inc(source="text")
 
-            yield f"\n🧠 {thought_output}"
-            history.append({"role": "assistant", "content": thought_output})
-            yield "\n"
+            # ✅ Extract action before appending to history
+            if action is None and format_error is None:
+                action = extract_action(thought_output)
+
+            for event in self._guard_result(thought_output, history):
+                yield event
+            if thought_output.strip():
+                history.append({"role": "assistant", "content": thought_output})
 
             # ✅ Check if task is complete
-            if "Final Answer" in thought_output:
-                yield "\n🎉 All steps executed."
+            if "Final Answer" in thought_output and not format_error:
+                if replay:
+                    replay.completed = True
+                yield events.status("\n🎉 All steps executed.")
                 break
 
-            # ❌ Handle missing action
+            # ❌ Send an answer without a usable action back for correction
             if not action:
-                yield "\n⚠️ No action found. Aborting."
-                break
+                if format_retries >= FORMAT_RETRIES:
+                    metrics.format_retries.inc(reason="unusable")
+                    yield events.status("\n⚠️ No action found. Aborting.", level="warning")
+                    break
+                format_retries += 1
+                for event in self._correct_format(
+                    history,
+                    format_retries,
+                    "invalid_command" if format_error else "missing_action",
+                    format_error or self._missing_action_hint(),
+                ):
+                    yield event
+                continue
+            format_retries = 0
+
+            # 🛡 Harmless actions skip the approval round trip
+            decision = self.policy.classify(action)
+            if decision.auto_approved:
+                yield events.policy(decision, "auto-approved")
+                approval = {"approved": True, "edited_command": None}
+            else:
+                yield events.policy(decision, "approval required")
+                approval = None
 
             # 🔁 Approval step
-            step_id = str(uuid.uuid4())
-            approval_channels[step_id] = approval_q
-            yield f"\n[ApprovalRequired] {step_id} → {action}"
-            yield "\n"
-            yield "\n⏸ Awaiting user approval..."
-            yield "\n"
-
-            approval = await approval_q.get()
+            if approval is None:
+                step_id = str(uuid.uuid4())
+                await task_registry.add_step(task_id, step_id)
+                yield events.action_pending(
+                    step_id, action, classification=decision.classification
+                )
+
+                if speculator and not (replay and replay.active):
+                    speculation = speculator.start(action, history)
+                try:
+                    approval = await task_registry.wait_for_approval(task_id, step_id)
+                finally:
+                    await task_registry.remove_step(task_id, step_id)
+                yield events.policy(*self._user_verdict(decision, approval))
+
             if not approval["approved"]:
-                yield "\n❌ Action rejected by user. Asking Reflector Agent for an alternative..."
-                yield "\n"
+                if speculator:
+                    speculator.discard(speculation)
+                    speculation = None
+                async for event in self._leave_replay(replay):
+                    yield event
+                async for event in self._reject(
+                    task_id, approval["edited_command"] or action, repo_name, history
+                ):
+                    yield event
+                continue
 
-                # Ask reflector for a better version of the rejected command
-                rejected_command = approval["edited_command"] or action
-                recovery = await self.reflector_agent.suggest_fix(
-                    rejected_command, "User rejected this action.", repo_name
+            # 🧨 Execute the (possibly edited) action
+            used_command = approval["edited_command"] or action
+            if replay and not replay.follows([used_command]):
+                async for event in self._leave_replay(replay):
+                    yield event
+            if speculator:
+                speculation = await speculator.resolve(speculation, used_command)
+            outcome = CapturedResult(task_id, used_command)
+            if speculation and speculation.outcome:
+                # The read-only command already ran while the user was deciding
+                outcome.copy_from(speculation.outcome)
+                outcome.close()
+                speculation.outcome.close()
+                yield events.status(
+                    f"\n⚡ Reusing the result computed ahead of time for: {used_command}\n",
+                    command=used_command,
+                    speculative=True,
                 )
-                yield "\n"
-                yield f"\n🔄 Reflector Agent Suggestion:\n{recovery}"
+                for stream in ("stdout", "stderr"):
+                    if getattr(outcome, stream):
+                        yield events.result_chunk(stream, getattr(outcome, stream))
+            else:
+                async for event in self._execute(
+                    task_id, used_command, repo_name, outcome, workspace
+                ):
+                    yield event
+            task_registry.check_cancelled(task_id)
+            result = format_result(used_command, outcome)
+            yield events.status(
+                f"\n📄 Result: {result}\n",
+                result=result,
+                ok=not result.startswith("❌"),
+                log=outcome.log_range(),
+            )
+            history.add_result(result, outcome.log_range())
+            if replay and not result.startswith("❌"):
+                replay.record(used_command)
 
+            # 🛠 If failed, ask ReflectorAgent to suggest a fix
+            if result.startswith("❌"):
+                async for event in self._leave_replay(replay, failed=True):
+                    yield event
+                recovery_stream = self._suggest_fix(task_id, action, result, repo_name)
+                async for event in self._stream_reflection(recovery_stream):
+                    yield event
                 history.append(
                     {
                         "role": "user",
-                        "content": f"User rejected the action. Try this instead:\n{recovery}",
+                        "content": f"Error occurred. Try this instead:\n{recovery_stream.text}",
                     }
                 )
-                continue
 
-            # 🧨 Execute the (possibly edited) action
-            used_command = approval["edited_command"] or action
-            result = execute_action(used_command, repo_name)
-            yield f"\n📄 Result: {result}"
-            yield "\n"
-            history.append({"role": "user", "content": f"Result: {result}"})
+    async def _plan_steps(
+        self,
+        task_id,
+        repo_name,
+        refined_input,
+        history,
+        workspace,
+        speculator=None,
+        replay=None,
+    ):
+        """Several commands per LLM turn: the whole plan is approved once."""
+        format_retries = 0
+        while True:
+            task_registry.check_cancelled(task_id)
 
-            # 🛠 If failed, ask ReflectorAgent to suggest a fix
-            if result.startswith("❌"):
-                recovery = await self.reflector_agent.suggest_fix(
-                    action, result, repo_name
+            context = history.messages()
+            yield self._prompt_size(refined_input, repo_name, history, context, True)
+
+            if replay and replay.active:
+                thought_output = replay_thought(replay, plan=True)
+                yield events.thought(f"\n♻️ {thought_output}\n")
+            else:
+                thought_stream = self.reasoning_agent.plan_stream(
+                    refined_input, repo_name, context
+                )
+                async for event in self._stream_thought(thought_stream):
+                    yield event
+                thought_output = thought_stream.text
+
+            plan = extract_plan(thought_output)
+            for event in self._guard_result(thought_output, history):
+                yield event
+            history.append({"role": "assistant", "content": thought_output})
+
+            if "Final Answer" in thought_output:
+                if replay:
+                    replay.completed = True
+                yield events.status("\n🎉 All steps executed.")
+                break
+            if not plan:
+                if format_retries >= FORMAT_RETRIES:
+                    metrics.format_retries.inc(reason="unusable")
+                    yield events.status("\n⚠️ No plan found. Aborting.", level="warning")
+                    break
+                format_retries += 1
+                for event in self._correct_format(
+                    history,
+                    format_retries,
+                    "missing_plan",
+                    "Your answer had no Plan. Answer with 'Plan:' followed by numbered "
+                    "single-line shell commands, or with 'Final Answer:' if the task is done.",
+                ):
+                    yield event
+                continue
+            format_retries = 0
+
+            # 🛡 The plan skips approval only if every one of its steps would
+            decisions = [self.policy.classify(command) for command in plan]
+            auto_approved = all(d.auto_approved for d in decisions)
+            verdict = "auto-approved" if auto_approved else "approval required"
+            for decision in decisions:
+                yield events.policy(decision, f"{verdict} (plan)")
+
+            if auto_approved:
+                approval = {"approved": True, "edited_command": None}
+            else:
+                step_id = str(uuid.uuid4())
+                await task_registry.add_step(task_id, step_id)
+                yield events.action_pending(
+                    step_id,
+                    format_plan(plan),
+                    plan=plan,
+                    classification=_riskiest(decisions),
                 )
-                yield "\n"
-                yield f"\n🔄 Reflector Agent Suggestion:\n{recovery}"
+                try:
+                    approval = await task_registry.wait_for_approval(task_id, step_id)
+                finally:
+                    await task_registry.remove_step(task_id, step_id)
+
+            if approval["approved"] and approval["edited_command"]:
+                edited = parse_plan(approval["edited_command"])
+                if edited != plan:
+                    plan = edited
+                    history.append(
+                        {
+                            "role": "user",
+                            "content": f"The user edited the plan to:\n{format_plan(plan)}",
+                        }
+                    )
+            if not auto_approved:
+                verdict = "approved" if approval["approved"] else "rejected"
+                by = approval.get("by", "user")
+                for decision in [self.policy.classify(command) for command in plan]:
+                    yield events.policy(decision, f"{verdict} by {by} (plan)")
+
+            if replay and not (approval["approved"] and replay.follows(plan)):
+                async for event in self._leave_replay(replay):
+                    yield event
+            if not approval["approved"]:
+                async for event in self._reject(
+                    task_id, format_plan(plan), repo_name, history
+                ):
+                    yield event
+                continue
+
+            # 🧨 Execute the plan in order, stopping at the first failure
+            for index, command in enumerate(plan, 1):
+                task_registry.check_cancelled(task_id)
+                step = f"{index}/{len(plan)}"
+                outcome = CapturedResult(task_id, command)
+                async for event in self._execute(
+                    task_id, command, repo_name, outcome, workspace, step
+                ):
+                    yield event
+                task_registry.check_cancelled(task_id)
+                result = format_result(command, outcome)
+                failed = result.startswith("❌")
+                yield events.status(
+                    f"\n📄 Result: {result}\n",
+                    result=result,
+                    ok=not failed,
+                    step=index,
+                    log=outcome.log_range(),
+                )
+                history.add_result(
+                    f"[step {step}] {command}\n{result}", outcome.log_range()
+                )
+                if not failed:
+                    if replay:
+                        replay.record(command)
+                    continue
+
+                async for event in self._leave_replay(replay, failed=True):
+                    yield event
+
+                # 🛠 Re-plan from the failed step with the Reflector Agent's help
+                recovery_stream = self._suggest_fix(task_id, command, result, repo_name)
+                async for event in self._stream_reflection(recovery_stream):
+                    yield event
+                skipped = plan[index:]
                 history.append(
                     {
                         "role": "user",
-                        "content": f"Error occurred. Try this instead:\n{recovery}",
+                        "content": (
+                            f"The plan stopped at step {step} because it failed."
+                            + (
+                                " These steps were NOT run:\n"
+                                + format_plan(skipped, index + 1)
+                                if skipped
+                                else ""
+                            )
+                            + f"\nSuggested fix:\n{recovery_stream.text}\n"
+                            "Send a new Plan that continues from here."
+                        ),
                     }
                 )
+                break
+            else:
+                history.append(
+                    {
+                        "role": "user",
+                        "content": f"All {len(plan)} steps of the plan succeeded.",
+                    }
+                )
+
+    def _prompt_size(self, refined_input, repo_name, history, context, plan=False):
+        prompt_tokens = count_message_tokens(
+            self.reasoning_agent.build_prompt(refined_input, repo_name, context, plan)
+        )
+        return events.status(
+            f"\n📏 Prompt size: ~{prompt_tokens} tokens "
+            f"(history ~{history.token_count()}/{history.token_budget}, "
+            f"{history.compacted_turns} turns summarized)",
+            prompt_tokens=prompt_tokens,
+        )
+
+    async def _stream_thought(self, thought_stream):
+        yield events.thought("\n🧠 ")
+        async for delta in thought_stream:
+            yield events.thought(delta)
+        yield events.thought("\n")
+
+    async def _stream_reflection(self, recovery_stream):
+        yield events.reflection("\n\n🔄 Reflector Agent Suggestion:\n")
+        async for delta in recovery_stream:
+            yield events.reflection(delta)
+
+    def _guard_result(self, thought_output, history):
+        """Ensures the Result line is a placeholder before execution."""
+        if (
+            "Result:" in thought_output
+            and "Will be filled in after execution" not in thought_output
+        ):
+            metrics.format_retries.inc(reason="hallucinated_result")
+            yield events.status(
+                "\n⚠️ Warning: The agent hallucinated a Result. Retrying with corrected instruction...\n",
+                level="warning",
+            )
+
+            history.append(
+                {
+                    "role": "user",
+                    "content": (
+                        "⚠️ You included a real Result before the Action was approved or executed. "
+                        "Please only use: Result: Will be filled in after execution.\n"
+                        "Try again with the same Thought and Action, but follow the structure strictly."
+                    ),
+                }
+            )
+
+    def _missing_action_hint(self):
+        if self.reasoning_agent.tool_use:
+            return (
+                "Your answer had no usable tool call. Call `run_command` with a "
+                "single-line shell command, or `final_answer` if the task is done."
+            )
+        return (
+            "Your answer had no 'Action:' line. Answer with a Thought and a "
+            "single-line Action, or with 'Final Answer:' if the task is done."
+        )
+
+    def _correct_format(self, history, attempt, reason, correction):
+        """Tells the agent why its answer was unusable so it answers again."""
+        metrics.format_retries.inc(reason=reason)
+        yield events.status(
+            f"\n⚠️ {correction} Asking again ({attempt}/{FORMAT_RETRIES})...\n",
+            level="warning",
+        )
+        history.append({"role": "user", "content": f"⚠️ {correction}"})
+
+    async def _leave_replay(self, replay, failed=False):
+        """Stops replaying a cached plan once the task leaves it."""
+        if replay and await replay.diverge(failed):
+            reason = "a cached step failed" if failed else "the task left the cached plan"
+            yield events.status(
+                f"\n♻️ Stopped replaying because {reason}. The Reasoning Agent takes over.\n",
+                plan_cache="failed" if failed else "diverged",
+            )
+
+    async def _reject(self, task_id, rejected_command, repo_name, history):
+        yield events.status(
+            "\n❌ Action rejected by user. Asking Reflector Agent for an alternative...\n"
+        )
+
+        # Ask reflector for a better version of the rejected command
+        recovery_stream = self._suggest_fix(
+            task_id, rejected_command, "User rejected this action.", repo_name
+        )
+        async for event in self._stream_reflection(recovery_stream):
+            yield event
+
+        history.append(
+            {
+                "role": "user",
+                "content": f"User rejected the action. Try this instead:\n{recovery_stream.text}",
+            }
+        )
+
+    async def _execute(
+        self, task_id, command, repo_name, outcome, workspace=None, step=None
+    ):
+        """
+        Runs one approved command, streaming its output as events. Only the
+        first OUTPUT_STREAM_CHARS are streamed; the task log has all of it.
+        """
+        label = f" [{step}]" if step else ""
+        yield events.status(
+            f"\n▶️ Running{label}: {command}\n", command=command, step=step
+        )
+        session = None
+        try:
+            if not command.strip().startswith("git clone"):
+                session, restarted = await shell_pool.acquire(task_id)
+                if restarted:
+                    yield events.status(
+                        "\n🐚 The previous shell session ended; starting a fresh one "
+                        "(exported variables are gone).\n",
+                        level="warning",
+                    )
+            task_registry.attach_command(task_id, outcome)
+            # ⚡ Independent read-only commands of a chain run concurrently, unless
+            # a shell session holds the environment they would have to share
+            parallel = None if session else self.policy.parallel_groups(command)
+            if parallel:
+                chunks = self.run_parallel(
+                    task_id, parallel, repo_name, outcome, workspace
+                )
+            else:
+                chunks = self.run_action(
+                    command, repo_name, outcome, workspace, session
+                )
+            streamed = 0
+            async for stream, chunk in chunks:
+                if streamed < OUTPUT_STREAM_CHARS:
+                    chunk = chunk[: OUTPUT_STREAM_CHARS - streamed]
+                    yield events.result_chunk(stream, chunk)
+                    streamed += len(chunk)
+                    if streamed >= OUTPUT_STREAM_CHARS:
+                        yield events.status(
+                            "\n✂️ Output is long; the rest goes to the task log only.\n",
+                            level="warning",
+                        )
+        finally:
+            outcome.close()
+            task_registry.detach_command(task_id)
+
+        # 🗂️ Keep the manifest in step with commits and pulls
+        if self.index_repos and workspace and outcome.ok and moves_head(command):
+            await self._reindex(task_id, repo_name, workspace)
+
+    async def _reindex(self, task_id, repo_name, workspace):
+        record = task_registry.get(task_id)
+        try:
+            manifest = await self.repo_index.update(repo_name, workspace)
+        except Exception as e:
+            logging.warning(f"Could not re-index {repo_name} for task {task_id}: {e}")
+            return
+        if record and record.manifest:
+            record.manifest["content"] = manifest.text()
+
+    def _suggest_fix(self, task_id, command, error, repo_name):
+        """Streams the Reflector Agent's fix, with the repository manifest if there is one."""
+        record = task_registry.get(task_id)
+        context = record.manifest["content"] if record and record.manifest else None
+        return self.reflector_agent.suggest_fix_stream(
+            command, repo_name, error, context=context
+        )
+
+    async def run_action(
+        self, command, repo_name, outcome, workspace=None, session=None
+    ):
+        """Runs an action in the task's workspace, holding the repo's push lock for pushes."""
+        if not is_push(command):
+            async for item in stream_action(
+                command, repo_name, outcome, workspace, session
+            ):
+                yield item
+            return
+
+        async with self.repo_manager.push_lock(repo_name):
+            async for item in stream_action(
+                command, repo_name, outcome, workspace, session
+            ):
+                yield item
+        # Let other tasks see the pushed commits without waiting for the next refresh
+        asyncio.create_task(self.repo_manager.refresh(repo_name))
+
+    async def run_parallel(
+        self, task_id, commands, repo_name, outcome, workspace=None
+    ):
+        """
+        Runs independent read-only commands at the same time, then reports them
+        in order with the shell's `&&` / `;` semantics: after a failure, the
+        commands joined by `&&` are skipped up to the next `;`. Running a
+        read-only command the shell would have skipped is harmless; its output
+        is dropped.
+        """
+        outcomes = [SpooledResult() for _ in commands]
+        task_registry.attach_command(task_id, *outcomes)
+        try:
+            await asyncio.gather(
+                *(
+                    execute_into(command, repo_name, result, workspace)
+                    for (_, command), result in zip(commands, outcomes)
+                )
+            )
+
+            succeeded = True
+            for (operator, command), result in zip(commands, outcomes):
+                if operator == "&&" and not succeeded:
+                    continue
+                succeeded = result.ok
+                for stream, chunk in result.chunks():
+                    outcome.add(stream, chunk)
+                    yield stream, chunk
+                outcome.returncode = result.returncode
+                outcome.timed_out = outcome.timed_out or result.timed_out
+        finally:
+            for result in outcomes:
+                result.close()
+
+    def _user_verdict(self, decision, approval):
+        """Audits the user's ruling, classifying the command they edited if any."""
+        edited = approval["edited_command"]
+        by = approval.get("by", "user")  # or e.g. a batch-wide approval pattern
+        if not approval["approved"]:
+            return decision, f"rejected by {by}"
+        if edited and edited != decision.command:
+            return self.policy.classify(edited), f"edited and approved by {by}"
+        return decision, f"approved by {by}"
+
+    async def release_workspace(self, task_id, repo_name):
+        shell_pool.release(task_id)
+        try:
+            await self.repo_manager.remove_worktree(task_id, repo_name)
+        except Exception as e:
+            logging.warning(f"Failed to remove workspace of task {task_id}: {e}")
 
 
 # --- Helper functions ---
@@ -220,6 +805,84 @@ def extract_action(content: str) -> str:
     return _extract_block_action(lines)
 
 
+def extract_plan(content: str) -> list:
+    """
+    Extracts the numbered commands listed below 'Plan:'.
+    Falls back to a single 'Action:' if the agent answered with one.
+    """
+    steps = []
+    in_plan = False
+    for line in content.splitlines():
+        stripped = line.strip()
+        if stripped.lower().startswith("plan:"):
+            in_plan = True
+            continue
+        if not in_plan:
+            continue
+        if stripped.lower().startswith(("result:", "thought:", "final answer")):
+            break
+        command = _plan_step(stripped)
+        if command:
+            steps.append(command)
+
+    if not steps:
+        action = extract_action(content)
+        return [action] if action else []
+    return steps[:PLAN_MAX_STEPS]
+
+
+def parse_plan(text: str) -> list:
+    """Turns a (possibly user-edited) plan back into its commands."""
+    steps = []
+    for line in text.splitlines():
+        command = _plan_step(line.strip()) or line.strip()
+        if command and not command.startswith("#"):
+            steps.append(command)
+    return steps
+
+
+def format_plan(plan, start=1) -> str:
+    return "\n".join(
+        f"{index}. {command}" for index, command in enumerate(plan, start)
+    )
+
+
+def replay_thought(replay, plan=False) -> str:
+    """Writes the next cached step(s) the way the Reasoning Agent would have."""
+    commands = replay.take(PLAN_MAX_STEPS if plan else 1)
+    if not commands:
+        return (
+            f"Final Answer: Replayed all {len(replay.cached)} steps of a cached plan "
+            "that completed this task before."
+        )
+    if plan:
+        start = replay.position - len(commands) + 1
+        return (
+            "Thought: Continue with a cached plan that completed this task before.\n"
+            f"Plan:\n{format_plan(commands, start)}\n"
+            "Result: Will be filled in after execution."
+        )
+    return (
+        f"Thought: Step {replay.position}/{len(replay.cached)} of a cached plan "
+        "that completed this task before.\n"
+        f"Action: {commands[0]}\n"
+        "Result: Will be filled in after execution."
+    )
+
+
+def _plan_step(line):
+    """Returns the command of a numbered plan line like '2. git add .'."""
+    match = re.match(r"^(\d+)[.)]\s+(.*)$", line)
+    if match:
+        return match.group(2).strip().strip("`").strip()
+    return None
+
+
+def _riskiest(decisions):
+    order = [Classification.READ_ONLY, Classification.MUTATING, Classification.DANGEROUS]
+    return max((d.classification for d in decisions), key=order.index)
+
+
 def _extract_inline_action(lines):
     """Extracts an inline action if present."""
     for line in lines:
@@ -269,29 +932,75 @@ def _process_command_line(line, inside_code_block, command_lines):
             command_lines.append(stripped)
 
 
-def execute_action(command: str, repo_name: str) -> str:
-    """Executes a shell command using the proper working directory."""
-    base_dir = "./repos"
+def _action_cwd(command: str, repo_name: str, workspace=None) -> str:
+    """Resolves the working directory for an action."""
+    base_dir = REPOS_DIR
     os.makedirs(base_dir, exist_ok=True)
 
     is_clone = command.strip().startswith("git clone")
-    cwd = base_dir if is_clone else os.path.join(base_dir, repo_name)
+    if is_clone:
+        return base_dir
+    return workspace or os.path.join(base_dir, repo_name)
 
-    if not is_clone and not os.path.exists(cwd):
-        return f"❌ Error: Repository directory does not exist: {cwd}"
 
-    try:
-        result = subprocess.run(
-            command, shell=True, capture_output=True, text=True, cwd=cwd
+async def stream_action(
+    command: str, repo_name: str, outcome: CommandResult, workspace=None, session=None
+):
+    """
+    Streams the output of a shell command while it runs in the repo directory,
+    or in the task's shell session, which remembers where the last command left off.
+    """
+    cwd = _action_cwd(command, repo_name, workspace)
+    if session is None and not os.path.exists(cwd):
+        outcome.stderr = f"Repository directory does not exist: {cwd}"
+        return
+
+    with metrics.timed(metrics.command_latency, "command") as labels:
+        try:
+            if session is not None:
+                async with command_slot(repo_name):
+                    async for stream, chunk in session.run(command, outcome):
+                        yield stream, chunk
+            else:
+                async for stream, chunk in stream_command(
+                    command, cwd, repo_name, result=outcome
+                ):
+                    yield stream, chunk
+        except (OSError, SessionError) as e:
+            outcome.stderr = str(e)
+        labels["status"] = (
+            "timeout" if outcome.timed_out else "ok" if outcome.ok else "failed"
         )
-        if result.returncode == 0:
-            return result.stdout.strip() or f"✅ Successfully executed: {command}"
-        else:
-            return f"❌ Command failed with error:\n{result.stderr.strip()}"
-    except subprocess.CalledProcessError as e:
-        return f"❌ Command execution error:\n{str(e)}"
 
 
-def cancel_execution():
-    """Cancel all pending approval tasks."""
-    cancelled_tasks.update(approval_channels.keys())
+def format_result(command: str, outcome: CommandResult) -> str:
+    """Turns a finished command into the Result text shown to the user and agents."""
+    if outcome.timed_out:
+        return f"❌ Command timed out:\n{outcome.stderr.strip()}"
+    if outcome.returncode is None:
+        return f"❌ Error: {outcome.stderr.strip()}"
+    if outcome.ok:
+        return outcome.stdout.strip() or f"✅ Successfully executed: {command}"
+    # Tools like npm report some errors on stdout only
+    error = outcome.stderr.strip() or outcome.stdout.strip()
+    return f"❌ Command failed with error:\n{error}"
+
+
+async def execute_into(
+    command: str, repo_name: str, outcome: CommandResult, workspace=None
+):
+    """Runs a shell command to completion, collecting its output into `outcome`."""
+    async for _ in stream_action(command, repo_name, outcome, workspace):
+        pass
+    return outcome
+
+
+async def execute_action(command: str, repo_name: str, workspace=None) -> str:
+    """Executes a shell command using the proper working directory."""
+    outcome = await execute_into(command, repo_name, CommandResult(), workspace)
+    return format_result(command, outcome)
+
+
+async def cancel_execution(task_id=None):
+    """Cancels one task, or every running task if no task_id is given, on any worker."""
+    return await state_backend.request_cancel(task_id)
@@ -1,12 +1,14 @@
-import ollama
-
-from backend.llms.claude_llm import ClaudeLLM
+from backend.llms.cache import LLM_CACHE_ENABLED, get_cache
+from backend.llms.router import route_llm
 
 
 class PromptEngineerAgent:
-    def __init__(self, model_name=None):
+    def __init__(self, model_name=None, use_cache=LLM_CACHE_ENABLED):
         self.model_name = model_name
-        self.llm = ClaudeLLM()
+        # Operators send the same few requests over and over, so refinements are memoized
+        self.llm = route_llm(
+            "prompt_engineer", cache=get_cache() if use_cache else None
+        )
 
     def build_prompt(self, user_input):
         return [
@@ -40,3 +42,7 @@ class PromptEngineerAgent:
     async def refine(self, user_input):
         messages = self.build_prompt(user_input)
         return await self.llm.chat(messages)
+
+    def refine_stream(self, user_input):
+        messages = self.build_prompt(user_input)
+        return self.llm.chat_stream(messages)
@@ -1,63 +1,121 @@
 import logging
-import ollama
 
-from backend.llms.claude_llm import ClaudeLLM
+from backend.env import env_flag
+from backend.llms.router import route_llm
+
+# How the agent is asked to answer: one Action per turn, or a Plan of several
+ACTION_FORMAT = {
+    "step": "- Action: Provide ONE shell command to execute (e.g., git, mkdir, etc.) and wait for approval before continuing.\n",
+    "approval": "- Await approval after each Action.\n",
+    "placement": "- Always put the shell command on the **same line** as 'Action:' (do NOT use Markdown code blocks).\n",
+    "output": "  Action: <single-line shell command>\n",
+    "single_line": "- Action must be a single-line shell command (no code blocks).\n",
+}
+PLAN_FORMAT = {
+    "step": "- Plan: Provide an ordered, numbered list of ALL shell commands needed for the next part of the task (e.g., mkdir, writing files, git add, commit and push). The plan is approved once and the commands run one after another.\n",
+    "approval": "- Execution stops at the first failing command; you will then be asked for a new Plan that continues from there.\n",
+    "placement": "- Put each command on its own numbered line below 'Plan:' (do NOT use Markdown code blocks).\n",
+    "output": "  Plan:\n  1. <single-line shell command>\n  2. <single-line shell command>\n",
+    "single_line": "- Every step of the Plan must be a single-line shell command (no code blocks).\n",
+}
+# 🧰 Structured answers: the model calls run_command / final_answer instead of writing text
+REASONING_TOOL_USE = env_flag("REASONING_TOOL_USE", True)
+TOOL_FORMAT = {
+    "step": "- Action: Call the `run_command` tool with your thought and ONE shell command (e.g., git, mkdir, etc.); it runs once approved.\n",
+    "approval": "- Await approval after each Action. The command's output comes back as its Result.\n",
+    "placement": "- Put the shell command in the `command` field of `run_command` (no Markdown code blocks). Call `final_answer` instead of writing 'Final Answer:'.\n",
+    "output": "  Action: a call to `run_command` (or `final_answer` when the task is done)\n",
+    "single_line": "- The command must be a single-line shell command (no code blocks).\n",
+}
+ACTION_TOOLS = [
+    {
+        "name": "run_command",
+        "description": "Run ONE shell command in the repository once the user approves it.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "thought": {
+                    "type": "string",
+                    "description": "What you will do next and why.",
+                },
+                "command": {
+                    "type": "string",
+                    "description": "A single-line shell command.",
+                },
+            },
+            "required": ["thought", "command"],
+        },
+    },
+    {
+        "name": "final_answer",
+        "description": "Finish the task once every change is committed and pushed, or nothing is left to do.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "thought": {"type": "string"},
+                "answer": {
+                    "type": "string",
+                    "description": "What was done.",
+                },
+            },
+            "required": ["answer"],
+        },
+    },
+]
+TOOL_CHOICE = {"type": "any"}
+
+
+class AnswerFormatError(Exception):
+    """A tool call the agent cannot act on; the message tells the model why."""
+
+
+def tool_answer(tool_calls):
+    """
+    Turns a run_command / final_answer call into (text, command).
+    The text uses the Thought/Action format so history reads the same either
+    way; the command is "" for a final answer. Returns None without a call and
+    raises AnswerFormatError for a run_command that cannot be run.
+    """
+    for call in tool_calls or []:
+        fields = call["input"] if isinstance(call["input"], dict) else {}
+        thought = " ".join(str(fields.get("thought", "")).split())
+        if call["name"] == "final_answer":
+            return f"Thought: {thought}\nFinal Answer: {fields.get('answer', '')}", ""
+        if call["name"] != "run_command":
+            continue
+        command = str(fields.get("command", "")).strip()
+        if not command:
+            raise AnswerFormatError("The `command` of your run_command call was empty.")
+        if "\n" in command:
+            raise AnswerFormatError(
+                f"The `command` of your run_command call spans {len(command.splitlines())} "
+                "lines; it must be a single-line shell command. Chain commands with && "
+                "or run one per step."
+            )
+        return (
+            f"Thought: {thought}\nAction: {command}\n"
+            "Result: Will be filled in after execution.",
+            command,
+        )
+    return None
 
 
 class ReasoningAgent:
-    def __init__(self, model_name=None):
+    def __init__(self, model_name=None, tool_use=REASONING_TOOL_USE):
         self.model_name = model_name
-        self.llm = (
-            ClaudeLLM()
-        )  # or whatever you're using to call the model, used "ollama" before
+        self.tool_use = tool_use
+        self.llm = route_llm("reasoning")
 
-    def build_prompt(self, task_description, repo_name, history):
+    def build_prompt(self, task_description, repo_name, history, plan=False):
+        if plan:
+            answer = PLAN_FORMAT
+        else:
+            answer = TOOL_FORMAT if self.tool_use else ACTION_FORMAT
+        # The rules are the same for every task so they can be served from the
+        # prompt cache; everything about this task comes after them
         return [
-            {
-                "role": "system",
-                "content": (
-                    "You are an AI DevOps engineer that follows the ReAct pattern: Thought → Action → Result.\n"
-                    "For each step, respond using:\n"
-                    "- Thought: Describe what you will do next.\n"
-                    "- Action: Provide ONE shell command to execute (e.g., git, mkdir, etc.) and wait for approval before continuing.\n"
-                    "- Result: Fill this in only after the Action has been approved, executed, and output is known.\n"
-                    "Rules:\n"
-                    f"- ❌ ABSOLUTELY FORBIDDEN: DO NOT run 'cd {repo_name}' — the system is already inside './repos/{repo_name}' after cloning. You MUST assume the working directory is already correct.\n"
-                    "- ✅ FIRST: Always check if the task is already completed. If yes, immediately respond with: Final Answer: <task is done explanation>"
-                    f"- Start either by cloning the repo using: using: git clone https://github.com/eugenius0/{repo_name}.git\n"
-                    f"If the repository is from GitLab and is called gitlab-automation clone using git clone https://gitlab.com/automation-framework-gitlab/{repo_name}.git\n"
-                    f"- The repository is cloned into the '{repo_name}' directory.\n If it is gitlab then you are inside ./repos/gitlab-automation/.\n"
-                    f"- The Task: {task_description} is the task you need to accomplish.\n"
-                    f"- Only continue with further steps if they are necessary to complete the task: {task_description}.\n"
-                    "+ If you are deleting, editing, or modifying files, always check for their presence first. In case it is not in the root directory check inside the folders.\n"
-                    "⚠️ Never say a file was created, deleted or modified unless the command was executed and committed and the result was pushed to the remote repository.\n"
-                    "- Await approval after each Action.\n"
-                    "- Use shell commands that are likely to succeed.\n"
-                    "- Do NOT use interactive editors like nano, vi, or code."
-                    "- To write files, ALWAYS use shell redirection."
-                    "- For single-line content: use `echo 'your line here' > filename`"
-                    "- For multiple lines: use `printf '%s\n' 'line1' 'line2' 'line3' > filename`"
-                    "- ❌ NEVER use `echo -e`. It can cause syntax errors, especially in YAML files (e.g., `-e name:` is invalid)."
-                    "- ❌ NEVER start file content with `-e` or include `-e name:` as the first line of any file."
-                    "- ✅ Use `printf` for reliable multi-line file creation across all shells."
-                    "- Always put the shell command on the **same line** as 'Action:' (do NOT use Markdown code blocks).\n"
-                    "- Never generate a Result line until the command has actually been executed. Use: Result: Will be filled in after execution. as a placeholder."
-                    "- Whatever gets pushed such as a pipeline should work out-of-the-box without requiring manual edits"
-                    "- If you create, delete, or modify files (e.g., GitHub Actions workflows, Dockerfiles, README, etc.), you MUST commit and push the changes. ALWAYS do this using:"
-                    "git add . && git commit -m '<your commit message>' && git push"
-                    "- Do NOT consider a task complete until those changes have been committed and pushed."
-                    "- If you need to run a command that requires sudo, use: sudo -S <command> <<< 'your_password'\n"
-                    "- If the task (e.g. cloning a repository) is already fully completed, finish with 'Final Answer:...'.\n"
-                    "- End with 'Final Answer: ...' only when all steps are complete and those got pushed and no further actions are required.\n"
-                    "⚠️ FORMAT RULES:\n"
-                    "- ONLY output the following lines, no extra text or markdown:\n"
-                    "  Thought: <your thought>\n"
-                    "  Action: <single-line shell command>\n"
-                    "  Result: Will be filled in after execution.\n"
-                    "- DO NOT include explanations, markdown (e.g., ```), emojis, or extra text.\n"
-                    "- Action must be a single-line shell command (no code blocks).\n"
-                ),
-            },
+            {"role": "system", "content": system_prompt(answer)},
+            {"role": "system", "content": task_context(task_description, repo_name)},
             {
                 "role": "user",
                 "content": f"The task is: {task_description} for repository {repo_name}.",
@@ -67,4 +125,86 @@ class ReasoningAgent:
     async def think(self, task_description, repo_name, history):
         logging.info(f"ReasoningAgent initialized with repo: {repo_name}")
         messages = self.build_prompt(task_description, repo_name, history)
-        return await self.llm.chat(messages)
+        if not self.tool_use:
+            return await self.llm.chat(messages)
+        text, tool_calls = await self.llm.chat_tools(messages, ACTION_TOOLS, TOOL_CHOICE)
+        try:
+            answer = tool_answer(tool_calls)
+        except AnswerFormatError:
+            answer = None
+        return answer[0] if answer else text
+
+    def think_stream(self, task_description, repo_name, history):
+        """
+        Streams the next step. With tool use the thought is streamed and the
+        call is left in `tool_calls` for `tool_answer`.
+        """
+        logging.info(f"ReasoningAgent streaming for repo: {repo_name}")
+        messages = self.build_prompt(task_description, repo_name, history)
+        if not self.tool_use:
+            return self.llm.chat_stream(messages)
+        return self.llm.chat_stream(
+            messages, tools=ACTION_TOOLS, tool_choice=TOOL_CHOICE, stream_input="thought"
+        )
+
+    def plan_stream(self, task_description, repo_name, history):
+        """Streams a multi-command Plan that is approved and executed as a whole."""
+        logging.info(f"ReasoningAgent planning for repo: {repo_name}")
+        messages = self.build_prompt(task_description, repo_name, history, plan=True)
+        return self.llm.chat_stream(messages)
+
+
+def system_prompt(answer):
+    """The static rules of the ReAct loop for one answer format."""
+    return (
+        "You are an AI DevOps engineer that follows the ReAct pattern: Thought → Action → Result.\n"
+        "For each step, respond using:\n"
+        "- Thought: Describe what you will do next.\n"
+        + answer["step"]
+        + "- Result: Fill this in only after the Action has been approved, executed, and output is known.\n"
+        "Rules:\n"
+        "- ❌ DO NOT run 'cd' into the repository or out of it — the system starts you inside './repos/<repository>' after cloning. `cd` into its subdirectories is fine (e.g. `cd frontend && npm test`); in a shell session the new directory carries over to later steps.\n"
+        "- ✅ FIRST: Always check if the task is already completed. If yes, immediately respond with: Final Answer: <task is done explanation>\n"
+        "- The repository and the task are described in the task context that follows these rules.\n"
+        "- Only continue with further steps if they are necessary to complete the task.\n"
+        "+ If you are deleting, editing, or modifying files, always check for their presence first. In case it is not in the root directory check inside the folders.\n"
+        "⚠️ Never say a file was created, deleted or modified unless the command was executed and committed and the result was pushed to the remote repository.\n"
+        + answer["approval"]
+        + "- Use shell commands that are likely to succeed.\n"
+        "- Do NOT use interactive editors like nano, vi, or code."
+        "- To write files, ALWAYS use shell redirection."
+        "- For single-line content: use `echo 'your line here' > filename`"
+        "- For multiple lines: use `printf '%s\n' 'line1' 'line2' 'line3' > filename`"
+        "- ❌ NEVER use `echo -e`. It can cause syntax errors, especially in YAML files (e.g., `-e name:` is invalid)."
+        "- ❌ NEVER start file content with `-e` or include `-e name:` as the first line of any file."
+        "- ✅ Use `printf` for reliable multi-line file creation across all shells."
+        + answer["placement"]
+        + "- Never generate a Result line until the command has actually been executed. Use: Result: Will be filled in after execution. as a placeholder."
+        "- Whatever gets pushed such as a pipeline should work out-of-the-box without requiring manual edits"
+        "- If you create, delete, or modify files (e.g., GitHub Actions workflows, Dockerfiles, README, etc.), you MUST commit and push the changes. ALWAYS do this using:"
+        "git add . && git commit -m '<your commit message>' && git push"
+        "- Do NOT consider a task complete until those changes have been committed and pushed."
+        "- If you need to run a command that requires sudo, use: sudo -S <command> <<< 'your_password'\n"
+        "- If the task (e.g. cloning a repository) is already fully completed, finish with 'Final Answer:...'.\n"
+        "- End with 'Final Answer: ...' only when all steps are complete and those got pushed and no further actions are required.\n"
+        "⚠️ FORMAT RULES:\n"
+        "- ONLY output the following lines, no extra text or markdown:\n"
+        "  Thought: <your thought>\n"
+        + answer["output"]
+        + "  Result: Will be filled in after execution.\n"
+        "- DO NOT include explanations, markdown (e.g., ```), emojis, or extra text.\n"
+        + answer["single_line"]
+    )
+
+
+def task_context(task_description, repo_name):
+    """The per-task part of the system prompt."""
+    return (
+        "Task context:\n"
+        f"- ❌ DO NOT run 'cd {repo_name}' — the system starts you inside './repos/{repo_name}'.\n"
+        f"- If it is not cloned yet, start by cloning the repo using: git clone https://github.com/eugenius0/{repo_name}.git\n"
+        f"If the repository is from GitLab and is called gitlab-automation clone using git clone https://gitlab.com/automation-framework-gitlab/{repo_name}.git\n"
+        f"- The repository is cloned into the '{repo_name}' directory.\n If it is gitlab then you are inside ./repos/gitlab-automation/.\n"
+        f"- The Task: {task_description} is the task you need to accomplish.\n"
+        f"- Only continue with further steps if they are necessary to complete the task: {task_description}.\n"
+    )
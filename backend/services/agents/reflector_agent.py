@@ -1,14 +1,12 @@
-import ollama
-
-from backend.llms.claude_llm import ClaudeLLM
+from backend.llms.router import route_llm
 
 
 class ReflectorAgent:
     def __init__(self, model_name=None):
         self.model_name = model_name
-        self.llm = ClaudeLLM()
+        self.llm = route_llm("reflector")
 
-    def build_prompt(self, action, repo_name, error_output):
+    def build_prompt(self, action, repo_name, error_output, context=None):
         return [
             {
                 "role": "system",
@@ -17,8 +15,6 @@ class ReflectorAgent:
                     "Your job is to reflect on failed shell commands and suggest a valid, improved alternative.\n\n"
                     "Context:\n"
                     "- The user is running DevOps automation tasks inside a cloned GitHub repository.\n"
-                    f"- All repositories are cloned into the './repos/{repo_name}' directory.\n"
-                    f"- The current working directory is already './repos/{repo_name}'. NEVER use 'cd', 'repos/', or try to enter '{repo_name}' — you are already inside that directory.\n"
                     "- If a file or folder is missing, check it with `ls`, `ls -a`, or `git status`.\n"
                     "- If deleting or modifying a file, always confirm it exists first using `ls` or `test -f`.\n"
                     "- If a command fails because something already exists (e.g., clone), assume it's available and continue.\n"
@@ -31,6 +27,15 @@ class ReflectorAgent:
                     "- Output format: Action: <your new shell command(s)>"
                 ),
             },
+            {
+                # Kept apart from the static instructions above so those can be cached
+                "role": "system",
+                "content": (
+                    "Repository context:\n"
+                    f"- All repositories are cloned into the './repos/{repo_name}' directory.\n"
+                    f"- The current working directory is already './repos/{repo_name}'. NEVER use 'repos/' or try to enter '{repo_name}' — you are already inside that directory. `cd` into its subdirectories is fine.\n"
+                ),
+            },
             {
                 "role": "user",
                 "content": (
@@ -40,10 +45,15 @@ class ReflectorAgent:
                     f"Repository: {repo_name}\n\n"
                     "Your task is to suggest a better shell command that resolves the issue.\n"
                     "If the issue is context-related or unclear, you may propose a quick check using 'ls', 'git status', or 'test -f' to investigate."
+                    + (f"\n\n{context}" if context else "")
                 ),
             },
         ]
 
-    async def suggest_fix(self, action, repo_name, error_output):
-        messages = self.build_prompt(action, repo_name, error_output)
+    async def suggest_fix(self, action, repo_name, error_output, context=None):
+        messages = self.build_prompt(action, repo_name, error_output, context)
         return await self.llm.chat(messages)
+
+    def suggest_fix_stream(self, action, repo_name, error_output, context=None):
+        messages = self.build_prompt(action, repo_name, error_output, context)
+        return self.llm.chat_stream(messages)
@@ -0,0 +1,348 @@
+import asyncio
+import fnmatch
+import itertools
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from backend.llms.base import token_usage
+from backend.llms.gateway import get_gateway
+from backend.services import events, metrics
+from backend.services.event_store import event_store
+from backend.services.policy import Classification, split_command
+from backend.services.state import state_backend
+from backend.services.task_registry import TaskState
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_THROTTLE_INTERVAL = float(os.getenv("BATCH_THROTTLE_INTERVAL", "1.0"))
+BATCH_MAX_REPOS = int(os.getenv("BATCH_MAX_REPOS", "1000"))
+BATCHES_KEPT = int(os.getenv("BATCHES_KEPT", "100"))
+
+batch_tasks = metrics.registry.counter(
+    "agent_batch_tasks_total", "Batch tasks by final state", ("state",)
+)
+batch_throttled = metrics.registry.counter(
+    "agent_batch_throttle_waits_total",
+    "Times a batch task was held back because the LLM gateway was saturated",
+)
+
+QUEUED = "queued"
+RUNNING = "running"
+SKIPPED = "skipped"  # never started: the batch was cancelled or ran out of LLM budget
+DONE_STATES = {
+    TaskState.COMPLETED,
+    TaskState.FAILED,
+    TaskState.CANCELLED,
+    TaskState.TIMED_OUT,
+    SKIPPED,
+}
+
+
+class BatchJob:
+    """One repository of a batch, and the task that runs it."""
+
+    def __init__(self, batch, repo_name):
+        self.batch = batch
+        self.repo_name = repo_name
+        self.task_id = None
+        self.state = QUEUED
+        self.started = None
+        self.finished = None
+        self.tokens = 0
+        self.pending = None  # {"step_id", "action"} while waiting for approval
+
+    @property
+    def done(self):
+        return self.state in DONE_STATES
+
+    def to_dict(self):
+        return {
+            "repo_name": self.repo_name,
+            "task_id": self.task_id,
+            "state": self.state,
+            "duration": (
+                round(self.finished - self.started, 3)
+                if self.started and self.finished
+                else None
+            ),
+            "pending_action": self.pending,
+        }
+
+
+class Batch:
+    """
+    One instruction rolled out to many repositories. Actions matching one of
+    `approve_patterns` (shell-style globs such as "git add *") are approved
+    for every task of the batch without asking.
+    """
+
+    def __init__(
+        self,
+        instruction,
+        repos,
+        priority=0,
+        approve_patterns=None,
+        plan_mode=None,
+        llm_token_budget=None,
+    ):
+        self.id = str(uuid.uuid4())
+        self.instruction = instruction
+        self.priority = priority
+        self.approve_patterns = list(approve_patterns or [])
+        self.plan_mode = plan_mode
+        self.llm_token_budget = llm_token_budget
+        self.created = time.time()
+        self.finished = None
+        self.cancelled = False
+        self.jobs = [BatchJob(self, repo) for repo in repos]
+
+    def approving_pattern(self, commands):
+        """
+        The pattern that approves all of `commands`, if any. Every simple
+        command of a chain or pipeline must match a pattern on its own, and
+        lines with redirections or command substitution never match.
+        """
+        parts = []
+        for command in commands:
+            segments = split_command(command)
+            if not segments:
+                return None
+            parts += [part for _, pipeline in segments for part in pipeline]
+        matches = [
+            {p for p in self.approve_patterns if fnmatch.fnmatchcase(part, p)}
+            for part in parts
+        ]
+        if not matches or not all(matches):
+            return None
+        common = set.intersection(*matches)
+        for pattern in self.approve_patterns:
+            if pattern in common:
+                return pattern
+        return "several patterns"
+
+    def tokens_used(self):
+        return sum(
+            token_usage.get(job.task_id) if job.state == RUNNING else job.tokens
+            for job in self.jobs
+        )
+
+    def over_budget(self):
+        if self.llm_token_budget is None:
+            return False
+        return self.tokens_used() >= self.llm_token_budget
+
+    @property
+    def state(self):
+        if self.cancelled:
+            return "cancelled"
+        return "finished" if self.finished else "running"
+
+    def summary(self):
+        counts = {}
+        for job in self.jobs:
+            counts[job.state] = counts.get(job.state, 0) + 1
+        done = [job for job in self.jobs if job.done]
+        completed = counts.get(TaskState.COMPLETED, 0)
+        elapsed = (self.finished or time.time()) - self.created
+        durations = [job.finished - job.started for job in done if job.started]
+        throughput = completed / elapsed * 60 if elapsed else 0.0
+        average = sum(durations) / len(durations) if durations else None
+        return {
+            "batch_id": self.id,
+            "instruction": self.instruction,
+            "priority": self.priority,
+            "approve_patterns": self.approve_patterns,
+            "state": self.state,
+            "total": len(self.jobs),
+            "done": len(done),
+            "progress": round(len(done) / len(self.jobs), 3) if self.jobs else 1.0,
+            "counts": counts,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_per_min": round(throughput, 3),
+            "avg_task_s": round(average, 3) if average is not None else None,
+            "llm_tokens": self.tokens_used(),
+            "llm_token_budget": self.llm_token_budget,
+            "tasks": [job.to_dict() for job in self.jobs],
+        }
+
+
+class BatchScheduler:
+    """
+    Runs batch tasks from one priority queue (higher priority first, then
+    first come first served). At most `max_concurrency` run at once and a
+    repository never has two batch tasks running at the same time; a job
+    whose repository is busy waits aside until it is free. New tasks are
+    held back while the LLM gateway is saturated.
+    """
+
+    def __init__(self, run_task, max_concurrency=BATCH_MAX_CONCURRENCY):
+        # (task_id, repo_name, user_input, plan_mode, on_event) -> final task state
+        self.run_task = run_task
+        self.max_concurrency = max_concurrency
+        self.queue = asyncio.PriorityQueue()
+        self.counter = itertools.count()
+        self.batches = OrderedDict()
+        self.busy_repos = set()
+        self.waiting = {}  # repo -> deque of queue entries waiting for the repo
+        self.running = set()
+        self.slots = None
+        self.dispatcher = None
+        _schedulers.append(self)
+
+    def submit(self, batch):
+        self.batches[batch.id] = batch
+        self._prune()
+        for job in batch.jobs:
+            self.queue.put_nowait((-batch.priority, next(self.counter), job))
+        self._start()
+        return batch
+
+    def get(self, batch_id):
+        return self.batches.get(batch_id)
+
+    def queued(self):
+        return self.queue.qsize() + sum(len(w) for w in self.waiting.values())
+
+    async def approve(self, batch, pattern):
+        """Adds an approval pattern and approves the pending actions it matches."""
+        if pattern not in batch.approve_patterns:
+            batch.approve_patterns.append(pattern)
+        approved = 0
+        for job in batch.jobs:
+            if job.pending and await self._auto_approve(job, job.pending):
+                approved += 1
+        return approved
+
+    async def cancel(self, batch, cancel_task):
+        """Skips the jobs that have not started and cancels the running ones."""
+        batch.cancelled = True
+        for job in batch.jobs:
+            if job.state == RUNNING and job.task_id:
+                await cancel_task(job.task_id)
+
+    def _start(self):
+        if self.dispatcher is None or self.dispatcher.done():
+            self.slots = self.slots or asyncio.Semaphore(self.max_concurrency)
+            self.dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self):
+        while True:
+            await self.slots.acquire()
+            try:
+                await self._llm_headroom()
+                entry = await self._next()
+            except BaseException:
+                self.slots.release()
+                raise
+            job = entry[2]
+            self.busy_repos.add(job.repo_name)
+            runner = asyncio.create_task(self._run(job))
+            self.running.add(runner)
+            runner.add_done_callback(self.running.discard)
+
+    async def _next(self):
+        """The highest-priority job that can start now; others are set aside."""
+        while True:
+            entry = await self.queue.get()
+            job = entry[2]
+            if job.batch.cancelled or job.batch.over_budget():
+                self._finish(job, SKIPPED)
+                continue
+            if job.repo_name in self.busy_repos:
+                self.waiting.setdefault(job.repo_name, deque()).append(entry)
+                continue
+            return entry
+
+    async def _llm_headroom(self):
+        """Waits while the LLM gateway is saturated, unless nothing is running."""
+        while self.busy_repos and get_gateway().saturated():
+            batch_throttled.inc()
+            await asyncio.sleep(BATCH_THROTTLE_INTERVAL)
+
+    async def _run(self, job):
+        job.task_id = str(uuid.uuid4())
+        token_usage.watch(job.task_id)
+        job.state = RUNNING
+        job.started = time.time()
+
+        async def on_event(event):
+            await self._watch(job, event)
+
+        state = TaskState.FAILED
+        try:
+            await event_store.open(job.task_id)
+            state = await self.run_task(
+                job.task_id,
+                job.repo_name,
+                job.batch.instruction,
+                job.batch.plan_mode,
+                on_event,
+            )
+        except Exception as e:
+            logging.warning(f"Batch task {job.task_id} for {job.repo_name} failed: {e}")
+        finally:
+            job.tokens = token_usage.forget(job.task_id)
+            self._finish(job, state)
+            self.busy_repos.discard(job.repo_name)
+            waiting = self.waiting.get(job.repo_name)
+            if waiting:
+                self.queue.put_nowait(waiting.popleft())
+                if not waiting:
+                    del self.waiting[job.repo_name]
+            self.slots.release()
+
+    async def _watch(self, job, event):
+        """Tracks the action a task is waiting on and approves it if a pattern allows."""
+        if event["type"] == events.ACTION_PENDING:
+            job.pending = {
+                "step_id": event["data"]["step_id"],
+                "action": event["data"]["action"],
+                "plan": event["data"].get("plan"),
+                "classification": event["data"].get("classification"),
+            }
+            await self._auto_approve(job, job.pending)
+        elif event["type"] in (events.POLICY, events.STATUS):
+            job.pending = None
+
+    async def _auto_approve(self, job, pending):
+        if pending.get("classification") == Classification.DANGEROUS:
+            return False  # dangerous commands always need a human
+        commands = pending.get("plan") or [pending["action"]]
+        pattern = job.batch.approving_pattern(commands)
+        if pattern is None:
+            return False
+        delivered = await state_backend.submit_approval(
+            pending["step_id"],
+            {
+                "approved": True,
+                "edited_command": None,
+                "by": f"batch pattern {pattern!r}",
+            },
+        )
+        if delivered:
+            job.pending = None
+        return delivered
+
+    def _finish(self, job, state):
+        job.state = state
+        job.pending = None
+        job.finished = time.time()
+        batch_tasks.inc(state=state)
+        if all(j.done for j in job.batch.jobs):
+            job.batch.finished = job.batch.finished or time.time()
+
+    def _prune(self):
+        finished = [b.id for b in self.batches.values() if b.finished]
+        for batch_id in finished[: max(0, len(self.batches) - BATCHES_KEPT)]:
+            del self.batches[batch_id]
+
+
+_schedulers = []
+
+metrics.registry.gauge(
+    "agent_batch_queue_depth",
+    "Batch tasks waiting to start",
+    fn=lambda: sum(scheduler.queued() for scheduler in _schedulers),
+)
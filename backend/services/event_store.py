@@ -0,0 +1,216 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict, deque
+
+EVENT_DB_PATH = os.getenv("EVENT_DB_PATH", "task_events.sqlite3")
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "1000"))
+EVENT_HOT_TASKS = int(os.getenv("EVENT_HOT_TASKS", "200"))
+EVENT_RETENTION = float(os.getenv("EVENT_RETENTION", str(7 * 24 * 3600)))
+EVENT_POLL_INTERVAL = float(os.getenv("EVENT_POLL_INTERVAL", "0.5"))
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "0.05"))
+
+
+class EventStore:
+    """
+    Append-only log of everything a task emits.
+    Events are numbered per task, kept in a bounded ring buffer while the task
+    is hot and written to SQLite (WAL mode) in small batches, so clients can
+    reattach and replay whatever they missed.
+    """
+
+    def __init__(
+        self,
+        path=EVENT_DB_PATH,
+        buffer_size=EVENT_BUFFER_SIZE,
+        hot_tasks=EVENT_HOT_TASKS,
+        retention=EVENT_RETENTION,
+    ):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "task_id TEXT, seq INTEGER, type TEXT, data TEXT, created REAL, "
+            "PRIMARY KEY (task_id, seq))"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "task_id TEXT PRIMARY KEY, status TEXT, created REAL, finished REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS tasks_created ON tasks (created)")
+        self.db.commit()
+        self.db_lock = asyncio.Lock()
+
+        self.buffer_size = buffer_size
+        self.hot_tasks = hot_tasks
+        self.retention = retention
+        self.buffers = OrderedDict()  # task_id -> deque of recent events
+        self.next_seq = {}
+        self.closing = set()  # finished, but not marked so in the database yet
+        self.wakeups = {}
+        self.pending = []
+        self._writer = None
+
+    # --- Writing ---
+
+    async def open(self, task_id):
+        self.next_seq[task_id] = 1
+        self.buffers[task_id] = deque(maxlen=self.buffer_size)
+        self._trim_buffers()
+        async with self.db_lock:
+            await asyncio.to_thread(self._insert_task, task_id)
+
+    def append(self, task_id, type, data):
+        """Records an event and wakes up everyone following the task."""
+        seq = self.next_seq[task_id]
+        self.next_seq[task_id] = seq + 1
+        event = {"id": seq, "type": type, "data": data}
+        self.buffers[task_id].append(event)
+        self.pending.append((task_id, seq, type, json.dumps(data), time.time()))
+        self._start_writer()
+        self._wake(task_id)
+        return seq
+
+    async def close(self, task_id, status):
+        """Marks the task as finished once all of its events are on disk."""
+        self.closing.add(task_id)
+        self.next_seq.pop(task_id, None)
+        try:
+            await self.flush()
+            async with self.db_lock:
+                await asyncio.to_thread(self._finish_task, task_id, status)
+        finally:
+            # From here on the database answers whether the task is finished
+            self.closing.discard(task_id)
+        self._wake(task_id)
+        self.wakeups.pop(task_id, None)
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        async with self.db_lock:
+            await asyncio.to_thread(self._insert_events, batch)
+
+    def _start_writer(self):
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_soon())
+
+    async def _write_soon(self):
+        # Batch everything emitted within the flush interval into one transaction
+        await asyncio.sleep(EVENT_FLUSH_INTERVAL)
+        await self.flush()
+
+    def _wake(self, task_id):
+        wakeup = self.wakeups.pop(task_id, None)
+        if wakeup:
+            wakeup.set()
+
+    def _trim_buffers(self):
+        while len(self.buffers) > self.hot_tasks:
+            oldest = next(iter(self.buffers))
+            if oldest in self.next_seq:
+                break  # never drop the buffer of a task that is still running
+            self.buffers.popitem(last=False)
+
+    # --- Reading ---
+
+    async def read(self, task_id, after=0):
+        """Returns every event of a task with an id greater than `after`."""
+        buffer = self.buffers.get(task_id)
+        if buffer and buffer[0]["id"] <= after + 1:
+            self.buffers.move_to_end(task_id)
+            return [e for e in buffer if e["id"] > after]
+
+        await self.flush()
+        async with self.db_lock:
+            rows = await asyncio.to_thread(self._select_events, task_id, after)
+        return [{"id": r[0], "type": r[1], "data": json.loads(r[2])} for r in rows]
+
+    async def status(self, task_id):
+        """Returns the stored status of a task, or None if it is unknown."""
+        async with self.db_lock:
+            row = await asyncio.to_thread(self._select_task, task_id)
+        return row[0] if row else None
+
+    async def is_finished(self, task_id):
+        if task_id in self.closing:
+            return True
+        if task_id in self.next_seq:
+            return False
+        async with self.db_lock:
+            row = await asyncio.to_thread(self._select_task, task_id)
+        return row is None or row[1] is not None
+
+    async def follow(self, task_id, after=0):
+        """Replays missed events, then yields new ones live until the task finishes."""
+        while True:
+            wakeup = None
+            if task_id in self.next_seq:
+                wakeup = self.wakeups.setdefault(task_id, asyncio.Event())
+            finished = await self.is_finished(task_id)
+
+            events = await self.read(task_id, after)
+            for event in events:
+                yield event
+                after = event["id"]
+            if finished:
+                return
+
+            if wakeup is not None:
+                await wakeup.wait()
+            else:
+                # Task runs elsewhere (e.g. in another worker): poll the database
+                await asyncio.sleep(EVENT_POLL_INTERVAL)
+
+    # --- SQLite helpers (run in a worker thread) ---
+
+    def _insert_task(self, task_id):
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO tasks (task_id, status, created, finished) "
+            "VALUES (?, ?, ?, NULL)",
+            (task_id, "Running", now),
+        )
+        # Drop tasks that are past the retention period
+        expired = now - self.retention
+        self.db.execute(
+            "DELETE FROM events WHERE task_id IN "
+            "(SELECT task_id FROM tasks WHERE created < ?)",
+            (expired,),
+        )
+        self.db.execute("DELETE FROM tasks WHERE created < ?", (expired,))
+        self.db.commit()
+
+    def _finish_task(self, task_id, status):
+        self.db.execute(
+            "UPDATE tasks SET status = ?, finished = ? WHERE task_id = ?",
+            (status, time.time(), task_id),
+        )
+        self.db.commit()
+
+    def _insert_events(self, batch):
+        self.db.executemany(
+            "INSERT OR IGNORE INTO events (task_id, seq, type, data, created) "
+            "VALUES (?, ?, ?, ?, ?)",
+            batch,
+        )
+        self.db.commit()
+
+    def _select_events(self, task_id, after):
+        return self.db.execute(
+            "SELECT seq, type, data FROM events WHERE task_id = ? AND seq > ? "
+            "ORDER BY seq",
+            (task_id, after),
+        ).fetchall()
+
+    def _select_task(self, task_id):
+        return self.db.execute(
+            "SELECT status, finished FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+
+
+event_store = EventStore()
@@ -0,0 +1,57 @@
+"""
+Typed events emitted by a task.
+Every event carries a human-readable `text` (what the log view shows) plus
+structured fields, so clients never have to scrape the text.
+"""
+
+THOUGHT = "thought"
+ACTION_PENDING = "action_pending"
+RESULT_CHUNK = "result_chunk"
+REFLECTION = "reflection"
+STATUS = "status"
+POLICY = "policy"
+
+
+def event(type, text, **fields):
+    return {"type": type, "data": {"text": text, **fields}}
+
+
+def thought(text, agent="reasoning"):
+    """A (partial) piece of LLM output, streamed as it is generated."""
+    return event(THOUGHT, text, agent=agent)
+
+
+def action_pending(step_id, action, **fields):
+    """An action waiting for the user's approval."""
+    return event(
+        ACTION_PENDING,
+        f"\n[ApprovalRequired] {step_id} → {action}\n\n⏸ Awaiting user approval...\n",
+        step_id=step_id,
+        action=action,
+        **fields,
+    )
+
+
+def result_chunk(stream, text):
+    """Live output of the command that is currently running."""
+    return event(RESULT_CHUNK, text, stream=stream)
+
+
+def reflection(text):
+    """A (partial) suggestion from the Reflector Agent."""
+    return event(REFLECTION, text)
+
+
+def status(text, **fields):
+    """Progress, warnings, results and the final task state."""
+    return event(STATUS, text, **fields)
+
+
+def policy(decision, verdict):
+    """Audit record of how the command policy (or the user) ruled on an action."""
+    return event(
+        POLICY,
+        f"\n🛡 Policy: {decision.classification} → {verdict}\n",
+        verdict=verdict,
+        **decision.to_dict(),
+    )
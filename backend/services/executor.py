@@ -0,0 +1,149 @@
+import asyncio
+import os
+import signal
+from contextlib import asynccontextmanager
+
+DEFAULT_TIMEOUT = float(os.getenv("COMMAND_TIMEOUT", "600"))
+MAX_CONCURRENT_COMMANDS = int(os.getenv("MAX_CONCURRENT_COMMANDS", "8"))
+MAX_CONCURRENT_PER_REPO = int(os.getenv("MAX_CONCURRENT_PER_REPO", "4"))
+# Chunks read ahead of the consumer; beyond this the command blocks on its pipe
+PIPE_QUEUE_CHUNKS = 16
+
+_global_limit = asyncio.Semaphore(MAX_CONCURRENT_COMMANDS)
+_repo_limits = {}
+
+
+class CommandResult:
+    """Collects the outcome of a command while it is being streamed."""
+
+    def __init__(self):
+        self.returncode = None
+        self.stdout = ""
+        self.stderr = ""
+        self.timed_out = False
+        self.process = None
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out
+
+    def add(self, stream, text):
+        """Appends output to "stdout" or "stderr"."""
+        setattr(self, stream, getattr(self, stream) + text)
+
+
+def _repo_limit(repo_name):
+    if repo_name not in _repo_limits:
+        _repo_limits[repo_name] = asyncio.Semaphore(MAX_CONCURRENT_PER_REPO)
+    return _repo_limits[repo_name]
+
+
+@asynccontextmanager
+async def command_slot(repo_name=None):
+    """Holds one of the global command slots, and one of the repo's if given."""
+    repo_limit = _repo_limit(repo_name) if repo_name else None
+    async with _global_limit:
+        if repo_limit:
+            await repo_limit.acquire()
+        try:
+            yield
+        finally:
+            if repo_limit:
+                repo_limit.release()
+
+
+async def _spawn(command, cwd):
+    if isinstance(command, str):
+        return await asyncio.create_subprocess_shell(
+            command,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+    return await asyncio.create_subprocess_exec(
+        *command,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+    )
+
+
+async def _pump(stream, name, queue):
+    """Forwards output from a pipe into the shared queue as soon as it arrives."""
+    while True:
+        chunk = await stream.read(4096)
+        if not chunk:
+            break
+        await queue.put((name, chunk.decode(errors="replace")))
+    await queue.put((name, None))
+
+
+def kill_process(process):
+    """Kills a command together with any children it spawned (e.g. `sh -c`)."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def _kill(process):
+    kill_process(process)
+    await process.wait()
+
+
+async def stream_command(
+    command, cwd, repo_name=None, timeout=DEFAULT_TIMEOUT, result=None
+):
+    """
+    Runs a command without blocking the event loop and yields
+    ("stdout" | "stderr", text) chunks while it runs.
+    A string is run through the shell, a list is executed directly.
+    The final exit status is written into `result` if one is given.
+    """
+    result = result if result is not None else CommandResult()
+
+    async with command_slot(repo_name):
+        process = await _spawn(command, cwd)
+        result.process = process
+        queue = asyncio.Queue(PIPE_QUEUE_CHUNKS)
+        pumps = [
+            asyncio.create_task(_pump(process.stdout, "stdout", queue)),
+            asyncio.create_task(_pump(process.stderr, "stderr", queue)),
+        ]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+        open_streams = 2
+
+        try:
+            while open_streams:
+                remaining = deadline - loop.time() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError
+                name, text = await asyncio.wait_for(queue.get(), remaining)
+                if text is None:
+                    open_streams -= 1
+                    continue
+                result.add(name, text)
+                yield name, text
+            remaining = deadline - loop.time() if deadline else None
+            result.returncode = await asyncio.wait_for(process.wait(), remaining)
+        except asyncio.TimeoutError:
+            result.timed_out = True
+            result.add("stderr", f"\nTimed out after {timeout}s")
+            await _kill(process)
+            result.returncode = process.returncode
+        finally:
+            for pump in pumps:
+                pump.cancel()
+            if process.returncode is None:
+                await _kill(process)
+
+
+async def run_command(command, cwd, repo_name=None, timeout=DEFAULT_TIMEOUT):
+    """Runs a command to completion and returns its CommandResult."""
+    result = CommandResult()
+    async for _ in stream_command(command, cwd, repo_name, timeout, result):
+        pass
+    return result
@@ -0,0 +1,132 @@
+import os
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "12000"))
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "6"))
+HISTORY_MAX_RESULT_CHARS = int(os.getenv("HISTORY_MAX_RESULT_CHARS", "2000"))
+
+SUMMARY_LINE_CHARS = 200
+
+
+def count_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting."""
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(messages) -> int:
+    """Estimates the prompt size of a list of chat messages."""
+    return sum(count_tokens(m["content"]) + 4 for m in messages)
+
+
+class HistoryManager:
+    """
+    Keeps the conversation of one task within a token budget.
+    The most recent turns stay verbatim, older turns are folded into a rolling
+    summary and long command results are cut down to their head and tail.
+    A summarized result keeps the byte range of its full output in the task log.
+    """
+
+    def __init__(
+        self,
+        token_budget=HISTORY_TOKEN_BUDGET,
+        recent_turns=HISTORY_RECENT_TURNS,
+        max_result_chars=HISTORY_MAX_RESULT_CHARS,
+    ):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.max_result_chars = max_result_chars
+        self.pinned = []
+        self.turns = []
+        self.summary_lines = []
+        self.compacted_turns = 0
+
+    def __len__(self):
+        return len(self.pinned) + len(self.turns)
+
+    def pin(self, message):
+        """Adds task setup context that is always sent verbatim."""
+        self.pinned.append(message)
+
+    def append(self, message):
+        """Adds a message and compacts older turns if needed."""
+        self.turns.append(message)
+        self._compact()
+
+    def add_result(self, result: str, log=None):
+        """
+        Adds a command result, keeping only an excerpt of long output. `log` is
+        the command's byte range in the task log (CapturedResult.log_range()).
+        """
+        message = {"role": "user", "content": f"Result: {self.shorten(result)}"}
+        if log:
+            message["log"] = log
+        self.append(message)
+
+    def shorten(self, text: str) -> str:
+        """Returns `text` or a head/tail excerpt; the full output is in the task log."""
+        if len(text) <= self.max_result_chars:
+            return text
+
+        half = self.max_result_chars // 2
+        return (
+            f"{text[:half]}\n"
+            f"... [output truncated, {len(text)} chars in total, full output in the task log] ...\n"
+            f"{text[-half:]}"
+        )
+
+    def messages(self):
+        """Returns pinned context, the summary (if any) and the recent turns."""
+        turns = [_without_log(m) for m in self.turns]
+        if not self.summary_lines:
+            return self.pinned + turns
+        summary = {
+            "role": "user",
+            "content": "Summary of earlier steps:\n" + "\n".join(self.summary_lines),
+        }
+        return self.pinned + [summary] + turns
+
+    def token_count(self) -> int:
+        return count_message_tokens(self.messages())
+
+    def _compact(self):
+        while len(self.turns) > self.recent_turns:
+            self._summarize(self.turns.pop(0))
+
+        # Fall back to fewer verbatim turns if we are still over budget
+        while self.token_count() > self.token_budget and len(self.turns) > 2:
+            self._summarize(self.turns.pop(0))
+
+        # The summary itself gets at most a quarter of the budget
+        while (
+            count_tokens("\n".join(self.summary_lines)) > self.token_budget // 4
+            and len(self.summary_lines) > 1
+        ):
+            self.summary_lines.pop(0)
+
+    def _summarize(self, message):
+        self.compacted_turns += 1
+        content = message["content"]
+        if message["role"] == "assistant":
+            line = _first_line_starting_with(content, "action:") or content
+            prefix = "Agent"
+        else:
+            line = content
+            prefix = "System"
+        line = " ".join(line.split())[:SUMMARY_LINE_CHARS]
+        log = message.get("log")
+        if log:
+            line += f" [full output: task log bytes {log['start']}-{log['end']}]"
+        self.summary_lines.append(f"- {prefix}: {line}")
+
+
+def _without_log(message):
+    """The message as sent to the LLM, without its task log range."""
+    if "log" not in message:
+        return message
+    return {key: value for key, value in message.items() if key != "log"}
+
+
+def _first_line_starting_with(text, prefix):
+    for line in text.splitlines():
+        if line.strip().lower().startswith(prefix):
+            return line.strip()
+    return None
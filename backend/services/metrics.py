@@ -0,0 +1,246 @@
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from backend.env import env_flag
+
+METRICS_ENABLED = env_flag("METRICS_ENABLED", True)
+TRACES_KEPT = int(os.getenv("TRACES_KEPT", "500"))
+TRACE_SPANS_KEPT = int(os.getenv("TRACE_SPANS_KEPT", "1000"))
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600,
+)
+
+# Task the current coroutine works for; inherited by tasks it spawns
+current_task_id = ContextVar("current_task_id", default=None)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge(Counter):
+    """A value that goes up and down, or is read from `fn` at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        self.values[_label_key(self.labelnames, labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.fn is not None:
+            yield self.name, "", self.fn()
+            return
+        yield from super().samples()
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[i] += 1
+                break
+        entry[-2] += value
+        entry[-1] += 1
+
+    def samples(self):
+        for key, entry in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", bound)])
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+            yield f"{self.name}_bucket", labels, entry[-1]
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), entry[-2]
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), entry[-1]
+
+
+class MetricsRegistry:
+    """Holds every metric of the process and renders them in Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+
+    def _register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), fn=None):
+        return self._register(Gauge(name, help, labelnames, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class TraceStore:
+    """Keeps the timed spans of recent tasks so one task can be inspected afterwards."""
+
+    def __init__(self, traces_kept=TRACES_KEPT, spans_kept=TRACE_SPANS_KEPT):
+        self.traces = OrderedDict()
+        self.traces_kept = traces_kept
+        self.spans_kept = spans_kept
+
+    def start(self, task_id, started=None):
+        self.traces[task_id] = {
+            "started": started if started is not None else time.perf_counter(),
+            "spans": deque(maxlen=self.spans_kept),
+        }
+        while len(self.traces) > self.traces_kept:
+            self.traces.popitem(last=False)
+        return self.traces[task_id]
+
+    def add(self, task_id, name, start, duration, labels):
+        trace = self.traces.get(task_id) or self.start(task_id, start)
+        trace["spans"].append(
+            {
+                "name": name,
+                "offset": round(start - trace["started"], 6),
+                "duration": round(duration, 6),
+                **labels,
+            }
+        )
+
+    def get(self, task_id):
+        trace = self.traces.get(task_id)
+        if trace is None:
+            return None
+        totals = {}
+        for span in trace["spans"]:
+            totals[span["name"]] = totals.get(span["name"], 0) + span["duration"]
+        return {
+            "task_id": task_id,
+            "spans": list(trace["spans"]),
+            "totals": {name: round(total, 6) for name, total in totals.items()},
+        }
+
+
+registry = MetricsRegistry()
+traces = TraceStore()
+
+# --- Hot-path metrics ---
+
+llm_latency = registry.histogram(
+    "agent_llm_request_seconds",
+    "LLM request latency",
+    ("agent", "mode", "provider"),
+)
+llm_tokens = registry.counter(
+    "agent_llm_tokens_total", "Tokens used by LLM requests", ("agent", "direction")
+)
+command_latency = registry.histogram(
+    "agent_command_seconds", "Time spent running approved shell commands", ("status",)
+)
+approval_wait = registry.histogram(
+    "agent_approval_wait_seconds", "Time spent waiting for a user decision", ("outcome",)
+)
+repo_sync_latency = registry.histogram(
+    "agent_repo_sync_seconds", "Time spent preparing repositories", ("phase",)
+)
+task_duration = registry.histogram(
+    "agent_task_seconds", "End-to-end task duration", ("state",)
+)
+tasks_finished = registry.counter(
+    "agent_tasks_total", "Finished tasks by final state", ("state",)
+)
+answer_formats = registry.counter(
+    "agent_reasoning_answers_total",
+    "Reasoning answers by how the next step was read (tool call or text parsing)",
+    ("source",),
+)
+format_retries = registry.counter(
+    "agent_format_retries_total",
+    "Reasoning answers that had to be corrected or were unusable",
+    ("reason",),
+)
+
+
+def observe(histogram, name, duration, task_id=None, **labels):
+    """
+    Records a duration in a histogram and in the trace of the current task.
+    Labels the histogram does not know about (e.g. token counts) only go
+    into the trace.
+    """
+    if not METRICS_ENABLED:
+        return
+    histogram.observe(duration, **labels)
+    task_id = task_id or current_task_id.get()
+    if task_id is not None:
+        traces.add(task_id, name, time.perf_counter() - duration, duration, labels)
+
+
+@contextmanager
+def timed(histogram, name, task_id=None, **labels):
+    """
+    Times the enclosed block. Labels may be filled in while it runs:
+        with timed(command_latency, "command") as labels:
+            labels["status"] = "ok"
+    """
+    start = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        observe(histogram, name, time.perf_counter() - start, task_id, **labels)
@@ -0,0 +1,250 @@
+import os
+import re
+import tempfile
+
+from backend.services.executor import CommandResult
+
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "task_output")
+OUTPUT_HEAD_CHARS = int(os.getenv("OUTPUT_HEAD_CHARS", "1000"))
+OUTPUT_TAIL_CHARS = int(os.getenv("OUTPUT_TAIL_CHARS", "1000"))
+OUTPUT_ERROR_LINES = int(os.getenv("OUTPUT_ERROR_LINES", "10"))
+OUTPUT_STREAM_CHARS = int(os.getenv("OUTPUT_STREAM_CHARS", "65536"))
+OUTPUT_LOGS_KEPT = int(os.getenv("OUTPUT_LOGS_KEPT", "1000"))
+SPOOL_MEMORY_BYTES = 65536  # spooled output moves to disk beyond this
+SPOOL_CHUNK_CHARS = 4096
+
+ERROR_LINE = re.compile(
+    r"\b(error|errors|failed|failure|fatal|exception|traceback|denied|cannot|unable)\b"
+    r"|\bnot found\b|ERR!",
+    re.IGNORECASE,
+)
+MAX_ERROR_LINE_CHARS = 300
+TASK_ID = re.compile(r"^[\w-]+$")
+
+
+def log_path(task_id, base_dir=OUTPUT_DIR):
+    """Path of the file holding the full output of every command of a task."""
+    if not TASK_ID.match(task_id):
+        raise ValueError(f"Invalid task id: {task_id}")
+    return os.path.join(base_dir, f"{task_id}.log")
+
+
+def prune_logs(base_dir=OUTPUT_DIR, keep=OUTPUT_LOGS_KEPT):
+    """Deletes the oldest task logs once there are more than `keep`."""
+    try:
+        paths = [
+            os.path.join(base_dir, name)
+            for name in os.listdir(base_dir)
+            if name.endswith(".log")
+        ]
+    except FileNotFoundError:
+        return
+    if len(paths) <= keep:
+        return
+    paths.sort(key=os.path.getmtime)
+    for path in paths[: len(paths) - keep]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class Excerpt:
+    """Keeps the first and last characters of a stream, plus its first error lines."""
+
+    def __init__(self, head=OUTPUT_HEAD_CHARS, tail=OUTPUT_TAIL_CHARS):
+        self.head_chars = head
+        self.tail_chars = tail
+        self.head = ""
+        self.tail = ""
+        self.total = 0
+        self.line = ""  # the unfinished last line
+        self.line_offset = 0
+        self.errors = []  # (offset, line)
+
+    def add(self, text):
+        self._scan(text)
+        self.total += len(text)
+        if len(self.head) < self.head_chars:
+            taken = text[: self.head_chars - len(self.head)]
+            self.head += taken
+            text = text[len(taken) :]
+        if text:
+            self.tail = (self.tail + text)[-self.tail_chars :]
+
+    def _scan(self, text):
+        if len(self.errors) >= OUTPUT_ERROR_LINES:
+            return
+        lines = (self.line + text).split("\n")
+        self.line = lines.pop()
+        if len(self.line) > MAX_ERROR_LINE_CHARS * 10:
+            # A very long line without a newline (e.g. a progress bar) is only kept in part
+            self.line_offset += len(self.line) - MAX_ERROR_LINE_CHARS
+            self.line = self.line[-MAX_ERROR_LINE_CHARS:]
+        for line in lines:
+            if ERROR_LINE.search(line) and len(self.errors) < OUTPUT_ERROR_LINES:
+                excerpt = line.strip()[:MAX_ERROR_LINE_CHARS]
+                self.errors.append((self.line_offset, excerpt))
+            self.line_offset += len(line) + 1
+
+    def text(self):
+        """The whole stream if it is short, otherwise head, hidden error lines and tail."""
+        if self.total <= self.head_chars + self.tail_chars:
+            return self.head + self.tail
+        tail_start = self.total - len(self.tail)
+        hidden = [
+            line for offset, line in self.errors if len(self.head) <= offset < tail_start
+        ]
+        middle = (
+            f"\n... [{tail_start - len(self.head)} chars omitted, "
+            "full output in the task log] ...\n"
+        )
+        if hidden:
+            middle += "Error lines from the omitted part:\n" + "\n".join(hidden)
+            middle += "\n...\n"
+        return self.head + middle + self.tail
+
+
+class ExcerptResult(CommandResult):
+    """A CommandResult that keeps only an excerpt of each stream in memory."""
+
+    def __init__(self):
+        self.excerpts = {"stdout": Excerpt(), "stderr": Excerpt()}
+        super().__init__()
+
+    def add(self, stream, text):
+        self.write(stream, text)
+        self.excerpts[stream].add(text)
+
+    def write(self, stream, text):
+        """Stores the full output somewhere other than memory."""
+
+    @property
+    def stdout(self):
+        return self.excerpts["stdout"].text()
+
+    @stdout.setter
+    def stdout(self, text):
+        self._replace("stdout", text)
+
+    @property
+    def stderr(self):
+        return self.excerpts["stderr"].text()
+
+    @stderr.setter
+    def stderr(self, text):
+        self._replace("stderr", text)
+
+    def _replace(self, stream, text):
+        # Only used for short messages such as "Repository directory does not exist"
+        self.excerpts[stream] = Excerpt()
+        if text:
+            self.add(stream, text)
+
+
+class SpooledResult(ExcerptResult):
+    """
+    The result of a command whose output is handed on later, e.g. one run in
+    parallel with others or ahead of approval. Each stream is spooled to a
+    temporary file (in memory while it is small) that `chunks` reads back.
+    """
+
+    def __init__(self):
+        self.spools = {}
+        super().__init__()
+
+    def write(self, stream, text):
+        if stream not in self.spools:
+            self.spools[stream] = tempfile.SpooledTemporaryFile(
+                max_size=SPOOL_MEMORY_BYTES, mode="w+", encoding="utf-8", errors="replace"
+            )
+        spool = self.spools[stream]
+        spool.seek(0, os.SEEK_END)
+        spool.write(text)
+
+    def chunks(self, size=SPOOL_CHUNK_CHARS):
+        """Yields the full output as (stream, text) chunks, stdout first."""
+        for stream in ("stdout", "stderr"):
+            spool = self.spools.get(stream)
+            if spool is None:
+                continue
+            spool.seek(0)
+            while True:
+                text = spool.read(size)
+                if not text:
+                    break
+                yield stream, text
+
+    def close(self):
+        for spool in self.spools.values():
+            spool.close()
+        self.spools = {}
+
+
+class CapturedResult(ExcerptResult):
+    """
+    A CommandResult that keeps only an excerpt of each stream in memory and
+    appends the full output to the task's log file. `log_start`/`log_end`
+    are the byte range of this command in that file.
+    """
+
+    def __init__(self, task_id, command, base_dir=OUTPUT_DIR):
+        self.path = log_path(task_id, base_dir)
+        os.makedirs(base_dir, exist_ok=True)
+        if not os.path.exists(self.path):
+            prune_logs(base_dir)
+        self.file = open(self.path, "ab")
+        self.file.write(f"$ {command}\n".encode())
+        self.log_start = self.file.tell()
+        self.log_end = self.log_start
+        super().__init__()
+
+    def write(self, stream, text):
+        if self.file is not None:
+            self.file.write(text.encode(errors="replace"))
+
+    def copy_from(self, result):
+        """Takes over the output and exit status of a SpooledResult that already ran."""
+        for stream, text in result.chunks():
+            self.add(stream, text)
+        self.returncode = result.returncode
+        self.timed_out = result.timed_out
+
+    def log_range(self):
+        """
+        Byte range of this command's output in the task log, inclusive like a
+        `Range: bytes=start-end` header, or None if it printed nothing.
+        """
+        if self.log_end <= self.log_start:
+            return None
+        return {"start": self.log_start, "end": self.log_end - 1}
+
+    def close(self):
+        if self.file is None:
+            return
+        self.log_end = self.file.tell()
+        self.file.write(f"\n[exit {self.returncode}]\n\n".encode())
+        self.file.close()
+        self.file = None
+
+
+def parse_range(header, size):
+    """Parses `bytes=start-end`, `bytes=start-` or `bytes=-suffix` into an inclusive range."""
+    match = re.match(r"^bytes=(\d*)-(\d*)$", header.strip())
+    if not match or not any(match.groups()):
+        raise ValueError(f"Unsupported range: {header}")
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(f"Range not satisfiable: {header}")
+    return start, end
+
+
+def read_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start + 1)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+
+from backend.env import env_flag
+from backend.services import metrics
+from backend.services.executor import run_command
+from backend.services.sqlite_store import SQLiteStore
+
+PLAN_CACHE_ENABLED = env_flag("PLAN_CACHE_ENABLED", True)
+PLAN_CACHE_PATH = os.getenv("PLAN_CACHE_PATH", "plan_cache.sqlite3")
+PLAN_CACHE_ENTRIES = int(os.getenv("PLAN_CACHE_ENTRIES", "1000"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", str(30 * 24 * 3600)))
+
+plan_cache_lookups = metrics.registry.counter(
+    "agent_plan_cache_lookups_total", "Plan cache lookups by result", ("result",)
+)
+plan_cache_replays = metrics.registry.counter(
+    "agent_plan_cache_replays_total", "Replayed plans by outcome", ("outcome",)
+)
+
+
+async def repo_fingerprint(workspace):
+    """
+    Summarizes what kind of repository a workspace is: its top-level entries
+    and the file extensions it contains (a proxy for its languages).
+    """
+    listing = await run_command(["git", "ls-files"], workspace, timeout=30)
+    if listing.ok:
+        paths = listing.stdout.splitlines()
+    else:
+        paths = [name for name in os.listdir(workspace) if name != ".git"]
+    entries = sorted({path.split("/", 1)[0] for path in paths})
+    languages = sorted({os.path.splitext(path)[1].lower() for path in paths} - {""})
+    summary = {"entries": entries, "languages": languages}
+    digest = hashlib.sha256(json.dumps(summary).encode()).hexdigest()
+    return digest, summary
+
+
+def make_key(task, fingerprint) -> str:
+    """
+    Hashes the user's instruction, ignoring case and whitespace, with a repo
+    fingerprint. The refined task is not used: the LLM words it differently
+    from one run to the next.
+    """
+    normalized = " ".join(str(task).lower().split())
+    return hashlib.sha256(json.dumps([normalized, fingerprint]).encode()).hexdigest()
+
+
+class PlanCache:
+    """
+    SQLite store of the command sequences that completed a task, keyed by the
+    user's instruction and the repository fingerprint. Entries expire after `ttl`
+    seconds and the least recently used ones are evicted once it is full.
+    """
+
+    def __init__(
+        self, path=PLAN_CACHE_PATH, entries=PLAN_CACHE_ENTRIES, ttl=PLAN_CACHE_TTL
+    ):
+        self.stats = {"hits": 0, "misses": 0}
+        self.store = SQLiteStore(path, "plan_cache", entries, ttl)
+
+    async def get(self, key):
+        """Returns the cached commands for `key`, or None."""
+        entry = await self.store.get(key)
+        commands = entry["commands"] if entry else None
+        self.stats["hits" if commands else "misses"] += 1
+        plan_cache_lookups.inc(result="hit" if commands else "miss")
+        return commands
+
+    async def set(self, key, task, fingerprint, commands):
+        await self.store.set(
+            key, {"task": task, "fingerprint": fingerprint, "commands": commands}
+        )
+
+    async def touch(self, key):
+        """Counts a successful replay and keeps the entry from being evicted."""
+        await self.store.touch(key)
+
+    async def invalidate(self, key):
+        await self.store.delete(key)
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+
+class PlanReplay:
+    """
+    Follows one task against the plan cache: hands out the cached commands
+    while the task stays on the cached path, and records the commands that
+    succeeded so a completed task can be stored for the next time.
+    """
+
+    def __init__(self, cache, key, task, fingerprint, cached=None):
+        self.cache = cache
+        self.key = key
+        self.task = task
+        self.fingerprint = fingerprint
+        self.cached = cached or []
+        self.active = bool(self.cached)
+        self.position = 0
+        self.expected = []
+        self.succeeded = []
+        self.completed = False
+
+    @classmethod
+    async def start(cls, cache, task, workspace):
+        fingerprint, summary = await repo_fingerprint(workspace)
+        key = make_key(task, fingerprint)
+        return cls(cache, key, task, summary, await cache.get(key))
+
+    @property
+    def finished(self):
+        """True once every cached command has been handed out."""
+        return self.active and self.position >= len(self.cached)
+
+    def take(self, count=1):
+        """Returns the next cached commands, or an empty list at the end of the plan."""
+        if not self.active:
+            return []
+        self.expected = self.cached[self.position : self.position + count]
+        self.position += len(self.expected)
+        return self.expected
+
+    def follows(self, commands):
+        """True if the user approved exactly the commands that were proposed."""
+        return list(commands) == self.expected
+
+    async def diverge(self, failed=False):
+        """
+        Hands control back to the LLM; a failing cached command evicts the plan.
+        Returns True if the task was still following the cached plan.
+        """
+        if not self.active:
+            return False
+        self.active = False
+        plan_cache_replays.inc(outcome="failed" if failed else "diverged")
+        if failed:
+            await self.cache.invalidate(self.key)
+        return True
+
+    def record(self, command):
+        self.succeeded.append(command)
+
+    async def finish(self):
+        """Stores the commands of a completed task, or counts a verbatim replay."""
+        if not self.completed:
+            return
+        if self.active:
+            plan_cache_replays.inc(outcome="completed")
+            await self.cache.touch(self.key)
+        elif self.succeeded:
+            await self.cache.set(self.key, self.task, self.fingerprint, self.succeeded)
+
+
+_cache = None
+
+
+def get_plan_cache():
+    """Returns the process-wide plan cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = PlanCache()
+    return _cache
+
+
+metrics.registry.gauge(
+    "agent_plan_cache_hit_ratio",
+    "Share of plan cache lookups that found a plan",
+    fn=lambda: _cache.hit_rate() if _cache else 0.0,
+)
@@ -0,0 +1,227 @@
+import json
+import os
+import re
+import shlex
+
+COMMAND_POLICY_FILE = os.getenv("COMMAND_POLICY_FILE")
+POLICY_AUTO_APPROVE = [
+    c.strip() for c in os.getenv("POLICY_AUTO_APPROVE", "read_only").split(",") if c.strip()
+]
+
+
+class Classification:
+    READ_ONLY = "read_only"
+    MUTATING = "mutating"
+    DANGEROUS = "dangerous"
+
+
+READ_ONLY_COMMANDS = [
+    "ls", "cat", "head", "tail", "pwd", "wc", "grep", "find", "tree", "stat",
+    "file", "test", "[", "du", "which", "basename", "dirname", "true",
+]
+READ_ONLY_GIT = [
+    "status", "log", "diff", "show", "ls-files", "rev-parse", "describe",
+    "remote", "branch",
+]
+DANGEROUS_PATTERNS = [
+    r"\brm\s+(-\w*\s+)*-\w*[rR]\w*\s+(-\w+\s+)*(/|~|\*|\.\.?)(\s|$)",
+    r"\bsudo\b",
+    r"\bgit\s+push\b.*(\s-f\b|--force)",
+    r"\bgit\s+reset\s+--hard\b",
+    r"\bgit\s+clean\s+-\w*f",
+    r"\bmkfs\b",
+    r"\bdd\s+if=",
+    r"\bchmod\s+(-R\s+)?777\b",
+    r"\b(curl|wget)\b.*\|\s*(sudo\s+)?(ba|z)?sh\b",
+    r">\s*/dev/sd",
+    r"\b(shutdown|reboot|halt)\b",
+    r":\(\)\s*\{",
+]
+
+# Flags that write files or run other programs, which no read-only command may use
+UNSAFE_FIND_FLAGS = {
+    "-exec", "-execdir", "-ok", "-okdir", "-delete",
+    "-fprint", "-fprint0", "-fprintf", "-fls",
+}
+UNSAFE_TREE_FLAGS = ("-o",)
+UNSAFE_GIT_FLAGS = ("--output", "--ext-diff")
+SAFE_GIT_BRANCH_FLAGS = {"-a", "-r", "-v", "-vv", "--list", "--show-current", "--all"}
+
+
+class PolicyDecision:
+    def __init__(self, command, classification, auto_approved, reason):
+        self.command = command
+        self.classification = classification
+        self.auto_approved = auto_approved
+        self.reason = reason
+
+    def to_dict(self):
+        return {
+            "command": self.command,
+            "classification": self.classification,
+            "auto_approved": self.auto_approved,
+            "reason": self.reason,
+        }
+
+
+def split_command(command):
+    """
+    Splits a shell line into [(operator, [simple command, ...])]: its pipelines,
+    each with the operator before it, keeping the source text of every command.
+    Returns None for lines with redirections, command substitution, background
+    jobs, newlines or unbalanced quotes.
+    """
+    if not command or re.search(r"[<>`\n]|\$\(", command):
+        return None
+    segments, pipeline, op = [], [], None
+    start, i, quote = 0, 0, None
+    while i <= len(command):
+        c = command[i] if i < len(command) else ";"
+        if quote:
+            if c == "\\" and quote == '"':
+                i += 1
+            elif c == quote:
+                quote = None
+            i += 1
+            continue
+        if c == "\\":
+            if i + 1 >= len(command):
+                return None  # a line continuation
+            i += 2
+            continue
+        if c in "'\"":
+            quote = c
+            i += 1
+            continue
+        if c not in ";&|":
+            i += 1
+            continue
+        token = command[i : i + 2] if command[i : i + 2] in ("&&", "||") else c
+        if token == "&":
+            return None
+        part = command[start:i].strip()
+        i += len(token)
+        start = i
+        if not part:
+            if token == ";" and not pipeline and op in (None, ";"):
+                continue
+            return None
+        pipeline.append(part)
+        if token == "|":
+            continue
+        segments.append((op, pipeline))
+        pipeline, op = [], token
+    if quote:
+        return None
+    return segments
+
+
+class CommandPolicy:
+    """
+    Classifies shell actions as read-only, mutating or dangerous.
+    Classifications listed in `auto_approve` skip the approval round trip;
+    dangerous commands are never auto-approved.
+    """
+
+    def __init__(
+        self,
+        read_only_commands=READ_ONLY_COMMANDS,
+        read_only_git=READ_ONLY_GIT,
+        dangerous_patterns=DANGEROUS_PATTERNS,
+        auto_approve=POLICY_AUTO_APPROVE,
+    ):
+        self.read_only_commands = set(read_only_commands)
+        self.read_only_git = set(read_only_git)
+        self.dangerous_patterns = [re.compile(p) for p in dangerous_patterns]
+        self.auto_approve = set(auto_approve) - {Classification.DANGEROUS}
+
+    def classify(self, command: str) -> PolicyDecision:
+        for pattern in self.dangerous_patterns:
+            if pattern.search(command):
+                return PolicyDecision(
+                    command,
+                    Classification.DANGEROUS,
+                    False,
+                    f"matches dangerous pattern `{pattern.pattern}`",
+                )
+        if self.is_read_only(command):
+            classification = Classification.READ_ONLY
+            reason = "only runs read-only commands"
+        else:
+            classification = Classification.MUTATING
+            reason = "may modify the workspace or the remote"
+        return PolicyDecision(
+            command, classification, classification in self.auto_approve, reason
+        )
+
+    def is_read_only(self, command: str) -> bool:
+        """True if a command cannot change anything, so it is safe to run unasked."""
+        return self._segments(command) is not None
+
+    def parallel_groups(self, command: str):
+        """
+        Splits a read-only chain like `ls && git status; cat README.md` into
+        independent commands, each paired with the operator that precedes it.
+        Returns None unless there is more than one and they may run concurrently.
+        """
+        segments = self._segments(command)
+        if not segments or len(segments) < 2:
+            return None
+        if any(op == "||" for op, _ in segments):
+            return None
+        # The source text is kept so that globs, ~ and $VARs still expand
+        return [(op, " | ".join(pipeline)) for op, pipeline in segments]
+
+    def _segments(self, command):
+        """Returns [(operator, pipeline)] for a fully read-only command, else None."""
+        segments = split_command(command)
+        if segments is None:
+            return None
+        for _, pipeline in segments:
+            for part in pipeline:
+                try:
+                    words = shlex.split(part)
+                except ValueError:
+                    return None
+                if not self._is_read_only_words(words):
+                    return None
+        return segments
+
+    def _is_read_only_words(self, words):
+        if not words:
+            return False
+        program, args = words[0], words[1:]
+        if program == "git":
+            if not args or args[0] not in self.read_only_git:
+                return False
+            if args[0] == "branch":
+                return all(a in SAFE_GIT_BRANCH_FLAGS for a in args[1:])
+            if args[0] == "remote":
+                return len(args) == 1 or args[1] in ("-v", "show", "get-url")
+            return not any(a.startswith(UNSAFE_GIT_FLAGS) for a in args[1:])
+        if program == "find":
+            return not UNSAFE_FIND_FLAGS.intersection(args)
+        if program == "tree":
+            return not any(a.startswith(UNSAFE_TREE_FLAGS) for a in args)
+        return program in self.read_only_commands
+
+
+def load_policy(path=COMMAND_POLICY_FILE):
+    """
+    Builds the policy, extending the defaults with a JSON file such as
+    {"read_only_commands": ["jq"], "dangerous_patterns": ["terraform destroy"],
+     "auto_approve": ["read_only"]}
+    """
+    if not path:
+        return CommandPolicy()
+    with open(path) as f:
+        config = json.load(f)
+    return CommandPolicy(
+        read_only_commands=READ_ONLY_COMMANDS + config.get("read_only_commands", []),
+        read_only_git=READ_ONLY_GIT + config.get("read_only_git", []),
+        dangerous_patterns=DANGEROUS_PATTERNS + config.get("dangerous_patterns", []),
+        auto_approve=config.get("auto_approve", POLICY_AUTO_APPROVE),
+    )
+
+
+command_policy = load_policy()
@@ -0,0 +1,560 @@
+import asyncio
+import fnmatch
+import json
+import logging
+import os
+import re
+import tomllib
+
+from backend.env import env_flag
+from backend.services import metrics
+from backend.services.executor import run_command
+
+REPO_INDEX_ENABLED = env_flag("REPO_INDEX_ENABLED", True)
+REPO_INDEX_MAX_CHARS = int(os.getenv("REPO_INDEX_MAX_CHARS", "4000"))
+REPO_INDEX_TREE_FILES = int(os.getenv("REPO_INDEX_TREE_FILES", "80"))
+REPO_INDEX_KEY_FILES = int(os.getenv("REPO_INDEX_KEY_FILES", "40"))
+# Past this many changed paths a full rebuild is cheaper than patching
+REPO_INDEX_MAX_CHANGES = int(os.getenv("REPO_INDEX_MAX_CHANGES", "500"))
+
+MAX_KEY_FILE_BYTES = 64 * 1024
+MAX_FIELD_VALUES = 8
+
+# Commands after which the checkout is at a different commit
+MOVES_HEAD = re.compile(
+    r"\bgit\s+(commit|pull|merge|rebase|reset|checkout|switch|cherry-pick|revert|am)\b"
+)
+
+repo_index_updates = metrics.registry.counter(
+    "agent_repo_index_updates_total", "Repository index lookups by mode", ("mode",)
+)
+
+LANGUAGES = {
+    ".py": "Python",
+    ".js": "JavaScript",
+    ".jsx": "JavaScript",
+    ".mjs": "JavaScript",
+    ".ts": "TypeScript",
+    ".tsx": "TypeScript",
+    ".go": "Go",
+    ".rs": "Rust",
+    ".java": "Java",
+    ".kt": "Kotlin",
+    ".rb": "Ruby",
+    ".php": "PHP",
+    ".cs": "C#",
+    ".c": "C",
+    ".h": "C",
+    ".cpp": "C++",
+    ".cc": "C++",
+    ".swift": "Swift",
+    ".scala": "Scala",
+    ".sh": "Shell",
+    ".tf": "Terraform",
+    ".html": "HTML",
+    ".css": "CSS",
+    ".scss": "CSS",
+    ".vue": "Vue",
+}
+
+# Marker file name -> build tool
+BUILD_TOOLS = {
+    "package.json": "npm",
+    "yarn.lock": "yarn",
+    "pnpm-lock.yaml": "pnpm",
+    "pyproject.toml": "pyproject",
+    "poetry.lock": "poetry",
+    "requirements.txt": "pip",
+    "setup.py": "setuptools",
+    "Pipfile": "pipenv",
+    "go.mod": "go modules",
+    "Cargo.toml": "cargo",
+    "pom.xml": "maven",
+    "build.gradle": "gradle",
+    "build.gradle.kts": "gradle",
+    "Gemfile": "bundler",
+    "composer.json": "composer",
+    "Makefile": "make",
+    "CMakeLists.txt": "cmake",
+}
+
+# (category, glob) pairs for the files whose key fields go into the manifest
+KEY_FILES = [
+    ("ci", ".github/workflows/*.yml"),
+    ("ci", ".github/workflows/*.yaml"),
+    ("ci", ".gitlab-ci.yml"),
+    ("ci", "Jenkinsfile"),
+    ("ci", ".circleci/config.yml"),
+    ("ci", "azure-pipelines.yml"),
+    ("ci", "bitbucket-pipelines.yml"),
+    ("docker", "Dockerfile"),
+    ("docker", "*/Dockerfile"),
+    ("docker", "Dockerfile.*"),
+    ("docker", "*.dockerfile"),
+    ("docker", "docker-compose*.yml"),
+    ("docker", "docker-compose*.yaml"),
+    ("docker", "compose.yml"),
+    ("docker", "compose.yaml"),
+    ("build", "package.json"),
+    ("build", "pyproject.toml"),
+    ("build", "requirements.txt"),
+    ("build", "go.mod"),
+    ("build", "Cargo.toml"),
+    ("build", "Makefile"),
+    ("build", "pom.xml"),
+]
+
+CATEGORY_TITLES = {
+    "ci": "CI",
+    "docker": "Docker",
+    "k8s": "Kubernetes",
+    "build": "Build files",
+}
+
+
+def moves_head(command) -> bool:
+    return MOVES_HEAD.search(command) is not None
+
+
+def key_file_category(path):
+    """The category of a file worth summarizing, or None."""
+    for category, pattern in KEY_FILES:
+        # fnmatch's `*` also matches `/`, so compare the depth as well
+        if path.count("/") == pattern.count("/") and fnmatch.fnmatch(path, pattern):
+            return category
+    if path.endswith((".yml", ".yaml")):
+        return "k8s"  # any other YAML file is checked for Kubernetes resources
+    return None
+
+
+# --- Key field extraction ---
+
+
+def yaml_children(text, parent):
+    """Keys nested one level under a top-level YAML key (no YAML parser needed)."""
+    children = []
+    inside = False
+    indent = None
+    for line in text.splitlines():
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        if not line[0].isspace():
+            inside = re.match(rf"^[\"']?{re.escape(parent)}[\"']?\s*:", line) is not None
+            indent = None
+            continue
+        if not inside:
+            continue
+        current = len(line) - len(line.lstrip())
+        if indent is None:
+            indent = current
+        if current == indent:
+            match = re.match(r"^\s*[\"']?([\w.\-/]+)[\"']?\s*:", line)
+            if match:
+                children.append(match.group(1))
+    return children
+
+
+def yaml_value(text, key):
+    """The inline value of a top-level YAML key."""
+    match = re.search(
+        rf"^[\"']?{re.escape(key)}[\"']?[ \t]*:[ \t]*(\S.*?)[ \t]*$", text, re.MULTILINE
+    )
+    return match.group(1).strip("\"'") if match else None
+
+
+def github_workflow_fields(text):
+    triggers = yaml_value(text, "on") or yaml_children(text, "on")
+    return {
+        "name": yaml_value(text, "name"),
+        "on": triggers,
+        "jobs": yaml_children(text, "jobs"),
+    }
+
+
+GITLAB_RESERVED = {
+    "stages",
+    "variables",
+    "image",
+    "services",
+    "default",
+    "include",
+    "workflow",
+    "before_script",
+    "after_script",
+    "cache",
+}
+
+
+def gitlab_ci_fields(text):
+    keys = re.findall(r"^([\w\-. ]+):", text, re.MULTILINE)
+    return {
+        "stages": re.findall(r"^\s+-\s*(\S+)", "\n".join(_yaml_block(text, "stages"))),
+        "jobs": [k for k in keys if k not in GITLAB_RESERVED and not k.startswith(".")],
+    }
+
+
+def _yaml_block(text, key):
+    lines, inside = [], False
+    for line in text.splitlines():
+        if line and not line[0].isspace():
+            inside = line.startswith(f"{key}:")
+            continue
+        if inside:
+            lines.append(line)
+    return lines
+
+
+def dockerfile_fields(text):
+    instructions = re.findall(
+        r"^\s*(FROM|EXPOSE|CMD|ENTRYPOINT)\s+(.+)$", text, re.MULTILINE | re.IGNORECASE
+    )
+    fields = {"from": [], "expose": [], "cmd": None}
+    for instruction, value in instructions:
+        instruction = instruction.upper()
+        if instruction == "FROM":
+            fields["from"].append(value.split()[0])
+        elif instruction == "EXPOSE":
+            fields["expose"].extend(value.split())
+        else:
+            fields["cmd"] = value.strip()
+    return fields
+
+
+def compose_fields(text):
+    return {"services": yaml_children(text, "services")}
+
+
+def k8s_fields(text):
+    resources = []
+    for document in re.split(r"^---", text, flags=re.MULTILINE):
+        kind = re.search(r"^kind:\s*(\S+)", document, re.MULTILINE)
+        if not kind or not re.search(r"^apiVersion:", document, re.MULTILINE):
+            continue
+        name = re.search(
+            r"^metadata:[ \t]*\n(?:[ \t]+.*\n)*?[ \t]+name:[ \t]*[\"']?([^\s\"']+)",
+            document,
+            re.MULTILINE,
+        )
+        resources.append(f"{kind.group(1)}/{name.group(1) if name else '?'}")
+    return {"resources": resources} if resources else None
+
+
+def _table(value):
+    """`value` if it is a JSON object or TOML table, else an empty one."""
+    return value if isinstance(value, dict) else {}
+
+
+def package_json_fields(text):
+    data = _table(json.loads(text))
+    return {
+        "name": data.get("name"),
+        "scripts": list(_table(data.get("scripts")).keys()),
+        "engines": data.get("engines"),
+        "dependencies": len(_table(data.get("dependencies"))),
+    }
+
+
+def pyproject_fields(text):
+    data = tomllib.loads(text)
+    tool = _table(data.get("tool"))
+    project = _table(data.get("project")) or _table(tool.get("poetry"))
+    return {
+        "name": project.get("name"),
+        "build-backend": _table(data.get("build-system")).get("build-backend"),
+        "tools": sorted(tool.keys()),
+    }
+
+
+def requirements_fields(text):
+    lines = [
+        line
+        for line in text.splitlines()
+        if line.strip() and not line.lstrip().startswith(("#", "-"))
+    ]
+    return {"requirements": len(lines)}
+
+
+def go_mod_fields(text):
+    module = re.search(r"^module\s+(\S+)", text, re.MULTILINE)
+    version = re.search(r"^go\s+(\S+)", text, re.MULTILINE)
+    return {"module": module and module.group(1), "go": version and version.group(1)}
+
+
+def cargo_fields(text):
+    return {"name": _table(tomllib.loads(text).get("package")).get("name")}
+
+
+def makefile_fields(text):
+    targets = re.findall(r"^([A-Za-z0-9][\w.\-]*)\s*:(?!=)", text, re.MULTILINE)
+    return {"targets": targets}
+
+
+def pom_fields(text):
+    artifact = re.search(r"<artifactId>([^<]+)</artifactId>", text)
+    return {"artifactId": artifact and artifact.group(1)}
+
+
+def extract_fields(path, text):
+    """Key fields of a known file, or None if it is not worth mentioning."""
+    name = os.path.basename(path)
+    category = key_file_category(path)
+    if path.startswith(".github/workflows/"):
+        return github_workflow_fields(text)
+    if name == ".gitlab-ci.yml":
+        return gitlab_ci_fields(text)
+    if name == "Jenkinsfile":
+        return {"stages": re.findall(r"stage\s*\(\s*['\"](.+?)['\"]", text)}
+    if category == "ci":
+        return {"jobs": yaml_children(text, "jobs") or yaml_children(text, "stages")}
+    if name.startswith("Dockerfile") or name.endswith(".dockerfile"):
+        return dockerfile_fields(text)
+    if category == "docker":
+        return compose_fields(text)
+    if category == "k8s":
+        return k8s_fields(text)
+    parsers = {
+        "package.json": package_json_fields,
+        "pyproject.toml": pyproject_fields,
+        "requirements.txt": requirements_fields,
+        "go.mod": go_mod_fields,
+        "Cargo.toml": cargo_fields,
+        "Makefile": makefile_fields,
+        "pom.xml": pom_fields,
+    }
+    return parsers[name](text) if name in parsers else None
+
+
+def read_fields(workspace, path):
+    try:
+        with open(os.path.join(workspace, path), "rb") as f:
+            text = f.read(MAX_KEY_FILE_BYTES).decode(errors="replace")
+        return extract_fields(path, text)
+    except (OSError, ValueError, TypeError, AttributeError, tomllib.TOMLDecodeError) as e:
+        # One odd file must not cost the repository its manifest
+        logging.debug(f"Could not index {path}: {e}")
+        return None
+
+
+# --- Manifest ---
+
+
+def format_fields(fields):
+    parts = []
+    for key, value in fields.items():
+        if value in (None, "", [], {}, 0):
+            continue
+        if isinstance(value, list):
+            shown = ", ".join(str(v) for v in value[:MAX_FIELD_VALUES])
+            if len(value) > MAX_FIELD_VALUES:
+                shown += f", … (+{len(value) - MAX_FIELD_VALUES})"
+            value = shown
+        elif isinstance(value, dict):
+            value = ", ".join(f"{k} {v}" for k, v in value.items())
+        parts.append(f"{key}: {value}")
+    return "; ".join(parts)
+
+
+def format_tree(files, limit=REPO_INDEX_TREE_FILES):
+    """Every path of a small repository, otherwise its first two levels with file counts."""
+    if len(files) <= limit:
+        return [f"  {path}" for path in files]
+    counts = {}
+    for path in files:
+        parts = path.split("/")
+        top = parts[0] + ("/" if len(parts) > 1 else "")
+        counts.setdefault(top, {})
+        if len(parts) > 1:
+            second = parts[1] + ("/" if len(parts) > 2 else "")
+            counts[top][second] = counts[top].get(second, 0) + 1
+    lines = []
+    for top in sorted(counts):
+        children = counts[top]
+        if not children:
+            lines.append(f"  {top}")
+            continue
+        total = sum(children.values())
+        lines.append(f"  {top} ({total} files)")
+        if len(children) <= 10:
+            for child in sorted(children):
+                suffix = f" ({children[child]} files)" if child.endswith("/") else ""
+                lines.append(f"    {child}{suffix}")
+    return lines
+
+
+class Manifest:
+    """What the index knows about one commit of a repository."""
+
+    def __init__(self, repo_name, commit, files, details):
+        self.repo_name = repo_name
+        self.commit = commit
+        self.files = files  # sorted paths tracked at `commit`
+        self.details = details  # path -> key fields
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            return cls(data["repo"], data["commit"], data["files"], data["details"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "repo": self.repo_name,
+                    "commit": self.commit,
+                    "files": self.files,
+                    "details": self.details,
+                },
+                f,
+            )
+        os.replace(tmp, path)
+
+    def languages(self):
+        counts = {}
+        for path in self.files:
+            language = LANGUAGES.get(os.path.splitext(path)[1].lower())
+            if language:
+                counts[language] = counts.get(language, 0) + 1
+        return sorted(counts.items(), key=lambda item: -item[1])
+
+    def build_tools(self):
+        names = {os.path.basename(path) for path in self.files if "/" not in path}
+        return sorted({tool for marker, tool in BUILD_TOOLS.items() if marker in names})
+
+    def text(self, max_chars=REPO_INDEX_MAX_CHARS):
+        """A compact description for the agents' prompts."""
+        lines = [
+            f"Repository manifest of {self.repo_name} at commit {self.commit[:7]} "
+            f"({len(self.files)} tracked files). Use it instead of exploring with "
+            "ls, cat or test -f; read a file only when you need its contents."
+        ]
+        languages = self.languages()
+        if languages:
+            lines.append(
+                "Languages: " + ", ".join(f"{name} ({count})" for name, count in languages[:8])
+            )
+        lines.append("Build tools: " + (", ".join(self.build_tools()) or "none detected"))
+        for category, title in CATEGORY_TITLES.items():
+            entries = [
+                f"  {path} — {format_fields(fields)}".rstrip(" —")
+                for path, fields in sorted(self.details.items())
+                if key_file_category(path) == category and fields
+            ]
+            lines.append(f"{title}:" if entries else f"{title}: none")
+            lines.extend(entries)
+        lines.append("File tree:")
+        lines.extend(format_tree(self.files))
+
+        text = "\n".join(lines)
+        if len(text) > max_chars:
+            text = text[:max_chars].rsplit("\n", 1)[0] + "\n  … (manifest truncated)"
+        return text
+
+
+class RepoIndex:
+    """
+    Keeps a manifest per repository in `<base_dir>/.index/<repo>.json`.
+    A checkout at a new commit is indexed incrementally: only the paths in
+    `git diff --name-only <indexed commit> HEAD` are re-read.
+    """
+
+    def __init__(self, base_dir, key_files=REPO_INDEX_KEY_FILES):
+        self.dir = os.path.join(base_dir, ".index")
+        self.key_files = key_files
+        self.locks = {}
+        self.manifests = {}  # repo -> latest Manifest
+
+    def path(self, repo_name):
+        return os.path.join(self.dir, f"{repo_name}.json")
+
+    def lock(self, repo_name):
+        if repo_name not in self.locks:
+            self.locks[repo_name] = asyncio.Lock()
+        return self.locks[repo_name]
+
+    async def update(self, repo_name, workspace):
+        """Returns the manifest of the commit checked out in `workspace`."""
+        head = await self._git(["rev-parse", "HEAD"], workspace)
+        if head is None:
+            raise RuntimeError(f"{workspace} is not a git checkout")
+        commit = head.strip()
+
+        async with self.lock(repo_name):
+            previous = self.manifests.get(repo_name) or await asyncio.to_thread(
+                Manifest.load, self.path(repo_name)
+            )
+            if previous and previous.commit == commit:
+                repo_index_updates.inc(mode="hit")
+                self.manifests[repo_name] = previous
+                return previous
+
+            manifest = None
+            if previous:
+                manifest = await self._patch(previous, commit, workspace)
+            if manifest is None:
+                manifest = await self._build(repo_name, commit, workspace)
+
+            os.makedirs(self.dir, exist_ok=True)
+            await asyncio.to_thread(manifest.save, self.path(repo_name))
+            self.manifests[repo_name] = manifest
+            return manifest
+
+    async def _build(self, repo_name, commit, workspace):
+        listing = await self._git(["ls-tree", "-r", "--name-only", commit], workspace)
+        files = sorted(listing.splitlines()) if listing else []
+        details = await asyncio.to_thread(self._read_details, workspace, files)
+        repo_index_updates.inc(mode="full")
+        return Manifest(repo_name, commit, files, details)
+
+    async def _patch(self, previous, commit, workspace):
+        """Applies the changes since the indexed commit, or None to rebuild."""
+        diff = await self._git(
+            ["diff", "--name-only", "--no-renames", previous.commit, commit], workspace
+        )
+        if diff is None:
+            return None  # e.g. the indexed commit is gone after a force push
+        changed = [path for path in diff.splitlines() if path]
+        if len(changed) > REPO_INDEX_MAX_CHANGES:
+            return None
+
+        present = set()
+        if changed:
+            listing = await self._git(
+                ["ls-tree", "-r", "--name-only", commit, "--", *changed], workspace
+            )
+            present = set((listing or "").splitlines())
+        files = (set(previous.files) - set(changed)) | present
+        details = {
+            path: fields
+            for path, fields in previous.details.items()
+            if path not in changed
+        }
+        details.update(
+            await asyncio.to_thread(self._read_details, workspace, sorted(present), details)
+        )
+        repo_index_updates.inc(mode="incremental")
+        return Manifest(previous.repo_name, commit, sorted(files), details)
+
+    def _read_details(self, workspace, paths, known=None):
+        budget = self.key_files - len(known or {})
+        reads = budget * 5  # most YAML files turn out not to be Kubernetes resources
+        details = {}
+        for path in paths:
+            if budget <= 0 or reads <= 0:
+                break
+            if key_file_category(path) is None:
+                continue
+            reads -= 1
+            fields = read_fields(workspace, path)
+            if fields:
+                details[path] = fields
+                budget -= 1
+        return details
+
+    async def _git(self, args, workspace):
+        result = await run_command(["git", *args], workspace, timeout=60)
+        return result.stdout if result.ok else None
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import os
+import shlex
+import shutil
+import time
+
+from backend.services import metrics
+from backend.services.executor import run_command
+from backend.services.policy import split_command
+
+REPOS_DIR = os.getenv("REPOS_DIR", "./repos")
+REPO_URL_TEMPLATE = os.getenv(
+    "REPO_URL_TEMPLATE", "https://github.com/eugenius0/{repo_name}.git"
+)
+REPO_DEFAULT_BRANCH = os.getenv("REPO_DEFAULT_BRANCH", "main")
+REPO_REFRESH_INTERVAL = float(os.getenv("REPO_REFRESH_INTERVAL", "300"))
+REPO_CLONE_DEPTH = int(os.getenv("REPO_CLONE_DEPTH", "0")) or None
+REPO_CLONE_FILTER = os.getenv("REPO_CLONE_FILTER") or None  # e.g. "blob:none"
+GIT_TIMEOUT = float(os.getenv("GIT_TIMEOUT", "300"))
+
+# Repositories that do not live under the default GitHub account
+KNOWN_REMOTES = {
+    "gitlab-automation": "https://gitlab.com/automation-framework-gitlab/gitlab-automation.git",
+}
+
+
+class RepoError(Exception):
+    pass
+
+
+class RepoManager:
+    """
+    Keeps one bare mirror per repository under `<base_dir>/.mirrors`, refreshed
+    in the background, and hands out a cheap `git worktree` per task under
+    `<base_dir>/.worktrees/<task_id>/<repo_name>`.
+    """
+
+    def __init__(
+        self,
+        base_dir=REPOS_DIR,
+        url_template=REPO_URL_TEMPLATE,
+        default_branch=REPO_DEFAULT_BRANCH,
+        refresh_interval=REPO_REFRESH_INTERVAL,
+        clone_depth=REPO_CLONE_DEPTH,
+        clone_filter=REPO_CLONE_FILTER,
+    ):
+        self.base_dir = base_dir
+        self.url_template = url_template
+        self.default_branch = default_branch
+        self.refresh_interval = refresh_interval
+        self.clone_depth = clone_depth
+        self.clone_filter = clone_filter
+        self.mirror_locks = {}
+        self.push_locks = {}
+        self.last_refresh = {}
+        self._refresher = None
+
+    # --- Paths ---
+
+    def mirror_path(self, repo_name):
+        return os.path.join(self.base_dir, ".mirrors", f"{repo_name}.git")
+
+    def worktree_path(self, task_id, repo_name):
+        return os.path.join(self.base_dir, ".worktrees", task_id, repo_name)
+
+    def legacy_path(self, repo_name):
+        """The shared checkout used before per-task worktrees existed."""
+        return os.path.join(self.base_dir, repo_name)
+
+    async def remote_url(self, repo_name):
+        if repo_name in KNOWN_REMOTES:
+            return KNOWN_REMOTES[repo_name]
+        legacy = self.legacy_path(repo_name)
+        if os.path.isdir(os.path.join(legacy, ".git")):
+            result = await self._git(["remote", "get-url", "origin"], legacy)
+            if result.ok and result.stdout.strip():
+                return result.stdout.strip()
+        return self.url_template.format(repo_name=repo_name)
+
+    # --- Locks ---
+
+    def mirror_lock(self, repo_name):
+        if repo_name not in self.mirror_locks:
+            self.mirror_locks[repo_name] = asyncio.Lock()
+        return self.mirror_locks[repo_name]
+
+    def push_lock(self, repo_name):
+        """Serializes pushes to the same remote across concurrent tasks."""
+        if repo_name not in self.push_locks:
+            self.push_locks[repo_name] = asyncio.Lock()
+        return self.push_locks[repo_name]
+
+    # --- Mirrors ---
+
+    async def ensure_mirror(self, repo_name):
+        """Clones the bare mirror on first use; afterwards this is a no-op."""
+        self._start_refresher()
+        mirror = self.mirror_path(repo_name)
+        async with self.mirror_lock(repo_name):
+            if os.path.isdir(mirror):
+                return mirror
+
+            with metrics.timed(metrics.repo_sync_latency, "repo_sync", phase="clone"):
+                os.makedirs(os.path.dirname(mirror), exist_ok=True)
+                clone = ["git", "clone", "--bare"]
+                if self.clone_depth:
+                    clone += ["--depth", str(self.clone_depth), "--no-single-branch"]
+                if self.clone_filter:
+                    clone += [f"--filter={self.clone_filter}"]
+                clone += [await self.remote_url(repo_name), mirror]
+
+                result = await run_command(clone, self.base_dir, timeout=GIT_TIMEOUT)
+                if not result.ok:
+                    shutil.rmtree(mirror, ignore_errors=True)
+                    raise RepoError(f"Failed to clone {repo_name}: {result.stderr.strip()}")
+
+                # A bare clone has no remote-tracking refs; add them so worktrees
+                # can branch off origin/<branch> and `git push` targets upstream
+                await self._git(
+                    ["config", "remote.origin.fetch", "+refs/heads/*:refs/remotes/origin/*"],
+                    mirror,
+                )
+                await self._git(["config", "push.default", "upstream"], mirror)
+                await self._fetch(repo_name, mirror)
+                return mirror
+
+    async def refresh(self, repo_name):
+        """Fetches the latest refs into the mirror."""
+        mirror = self.mirror_path(repo_name)
+        if not os.path.isdir(mirror):
+            return
+        async with self.mirror_lock(repo_name):
+            await self._fetch(repo_name, mirror)
+
+    async def _fetch(self, repo_name, mirror):
+        fetch = ["fetch", "--prune", "origin"]
+        if self.clone_depth:
+            fetch += ["--depth", str(self.clone_depth)]
+        with metrics.timed(metrics.repo_sync_latency, "repo_sync", phase="fetch"):
+            result = await self._git(fetch, mirror)
+        if result.ok:
+            self.last_refresh[repo_name] = time.monotonic()
+        else:
+            logging.warning(f"Fetch of {repo_name} failed: {result.stderr.strip()}")
+
+    def _start_refresher(self):
+        if self._refresher is None and self.refresh_interval > 0:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        """Keeps every known mirror fresh so tasks never fetch on the critical path."""
+        mirrors_dir = os.path.join(self.base_dir, ".mirrors")
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            if not os.path.isdir(mirrors_dir):
+                continue
+            for entry in os.listdir(mirrors_dir):
+                if entry.endswith(".git"):
+                    try:
+                        await self.refresh(entry[: -len(".git")])
+                    except Exception as e:
+                        logging.warning(f"Background refresh of {entry} failed: {e}")
+
+    # --- Worktrees ---
+
+    async def create_worktree(self, task_id, repo_name):
+        """Creates a fresh worktree of origin/<default branch> for one task."""
+        mirror = await self.ensure_mirror(repo_name)
+        path = self.worktree_path(task_id, repo_name)
+        branch = f"task/{task_id}"
+
+        with metrics.timed(metrics.repo_sync_latency, "repo_sync", phase="worktree"):
+            async with self.mirror_lock(repo_name):
+                base = await self._base_ref(mirror)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                result = await self._git(
+                    ["worktree", "add", "-B", branch, os.path.abspath(path), base], mirror
+                )
+                if not result.ok:
+                    raise RepoError(
+                        f"Failed to create worktree for {repo_name}: {result.stderr.strip()}"
+                    )
+                await self._git(["branch", "--set-upstream-to", base, branch], mirror)
+        return path
+
+    async def remove_worktree(self, task_id, repo_name):
+        """Deletes a task's worktree and its local branch."""
+        mirror = self.mirror_path(repo_name)
+        path = self.worktree_path(task_id, repo_name)
+        if os.path.isdir(mirror):
+            with metrics.timed(metrics.repo_sync_latency, "repo_sync", phase="cleanup"):
+                async with self.mirror_lock(repo_name):
+                    await self._git(
+                        ["worktree", "remove", "--force", os.path.abspath(path)], mirror
+                    )
+                    await self._git(["branch", "-D", f"task/{task_id}"], mirror)
+                    await self._git(["worktree", "prune"], mirror)
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    async def _base_ref(self, mirror):
+        for branch in (self.default_branch, "master"):
+            ref = f"origin/{branch}"
+            if (await self._git(["rev-parse", "--verify", "--quiet", ref], mirror)).ok:
+                return ref
+        raise RepoError(f"No origin/{self.default_branch} branch in {mirror}")
+
+    async def _git(self, args, cwd):
+        return await run_command(["git", *args], cwd, timeout=GIT_TIMEOUT)
+
+
+def is_push(command: str) -> bool:
+    """True if one of the simple commands of `command` runs `git push`."""
+    segments = split_command(command)
+    if segments is None:
+        # Redirections and substitutions are not split; rather lock than race
+        return "git push" in command
+    for _, pipeline in segments:
+        for part in pipeline:
+            try:
+                words = shlex.split(part)
+            except ValueError:
+                return "git push" in command
+            if _git_subcommand(words) == "push":
+                return True
+    return False
+
+
+def _git_subcommand(words):
+    """The subcommand of a `git [-C dir] [-c key=value] <subcommand>` command line."""
+    if not words or words[0] != "git":
+        return None
+    args = words[1:]
+    while args and args[0].startswith("-"):
+        args = args[2:] if args[0] in ("-C", "-c") else args[1:]
+    return args[0] if args else None
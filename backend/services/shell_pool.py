@@ -0,0 +1,309 @@
+import asyncio
+import codecs
+import logging
+import os
+import shlex
+import uuid
+
+from backend.env import env_flag
+from backend.services import metrics
+from backend.services.executor import (
+    DEFAULT_TIMEOUT,
+    PIPE_QUEUE_CHUNKS,
+    CommandResult,
+    kill_process,
+)
+
+SHELL_SESSIONS_ENABLED = env_flag("SHELL_SESSIONS_ENABLED", True)
+SHELL_POOL_SIZE = int(os.getenv("SHELL_POOL_SIZE", "4"))
+SHELL_SESSION_MAX_COMMANDS = int(os.getenv("SHELL_SESSION_MAX_COMMANDS", "500"))
+SHELL_PATH = os.getenv(
+    "SHELL_PATH", "/bin/bash" if os.path.exists("/bin/bash") else "/bin/sh"
+)
+
+shell_sessions = metrics.registry.counter(
+    "agent_shell_sessions_total", "Shell sessions started and retired", ("event",)
+)
+
+
+class SessionError(Exception):
+    pass
+
+
+def _partial_marker(buffer, marker):
+    """Length of the longest end of `buffer` that could be the start of `marker`."""
+    for length in range(min(len(buffer), len(marker) - 1), 0, -1):
+        if buffer.endswith(marker[:length]):
+            return length
+    return 0
+
+
+def _shell_args():
+    if os.path.basename(SHELL_PATH) == "bash":
+        return [SHELL_PATH, "--noprofile", "--norc"]
+    return [SHELL_PATH]
+
+
+class ShellSession:
+    """
+    One long-lived shell that runs commands one after another, so the working
+    directory, exported variables and activated virtualenvs carry over.
+    Each command is followed by a random sentinel on stdout and stderr that
+    marks the end of its output and carries its exit status and $PWD.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.marker = f"__agent_done_{uuid.uuid4().hex}"
+        self.cwd = None
+        self.commands = 0
+        self.broken = False
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *_shell_args(),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        shell_sessions.inc(event="started")
+        return self
+
+    @property
+    def alive(self):
+        return (
+            not self.broken
+            and self.process is not None
+            and self.process.returncode is None
+        )
+
+    async def enter(self, cwd):
+        """Moves the session into `cwd`; later commands may `cd` elsewhere."""
+        result = CommandResult()
+        async for _ in self.run(f"cd {shlex.quote(cwd)}", result, timeout=30):
+            pass
+        if not result.ok:
+            raise SessionError(f"Could not enter {cwd}: {result.stderr.strip()}")
+
+    async def run(self, command, result=None, timeout=DEFAULT_TIMEOUT):
+        """
+        Runs a command in the session and yields ("stdout" | "stderr", text)
+        chunks while it runs. A command that times out or is interrupted
+        takes the session down with it, since its state is then unknown.
+        Commands run one at a time.
+        """
+        # A command that arrives while another runs (e.g. a speculative probe)
+        # waits for it, so their output never interleaves
+        async with self.lock:
+            if not self.alive:
+                raise SessionError("Shell session is gone")
+            result = result if result is not None else CommandResult()
+            result.process = self.process
+            self.commands += 1
+            # eval keeps syntax errors inside the command; stdin stays reserved for us
+            script = (
+                f"eval {shlex.quote(command)} < /dev/null\n"
+                f"printf '\\n{self.marker}:%d:%s\\n' \"$?\" \"$PWD\"; "
+                f"printf '\\n{self.marker}\\n' >&2\n"
+            )
+            try:
+                self.process.stdin.write(script.encode())
+                await self.process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError) as e:
+                self.broken = True
+                raise SessionError(f"Shell session is gone: {e}") from e
+
+            queue = asyncio.Queue(PIPE_QUEUE_CHUNKS)
+            readers = [
+                asyncio.create_task(self._read(self.process.stdout, "stdout", queue)),
+                asyncio.create_task(self._read(self.process.stderr, "stderr", queue)),
+            ]
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout if timeout else None
+            open_streams = 2
+            finished = False
+
+            try:
+                while open_streams:
+                    remaining = deadline - loop.time() if deadline else None
+                    if remaining is not None and remaining <= 0:
+                        raise asyncio.TimeoutError
+                    name, text = await asyncio.wait_for(queue.get(), remaining)
+                    if text is None:
+                        open_streams -= 1
+                        continue
+                    result.add(name, text)
+                    yield name, text
+
+                trailer = readers[0].result()
+                if trailer is None:
+                    # The command ended the shell itself (e.g. `exit`) or it was killed
+                    self.broken = True
+                    result.returncode = await self.process.wait()
+                else:
+                    _, returncode, cwd = trailer.split(":", 2)
+                    result.returncode = int(returncode)
+                    self.cwd = cwd
+                finished = True
+            except asyncio.TimeoutError:
+                result.timed_out = True
+                result.add("stderr", f"\nTimed out after {timeout}s")
+            finally:
+                for reader in readers:
+                    reader.cancel()
+                if not finished:
+                    self.close()
+                    result.returncode = await self.process.wait()
+
+    async def _read(self, stream, name, queue):
+        """
+        Forwards output until the sentinel, holding back anything that could
+        be the start of it. Returns what follows the sentinel on its line,
+        or None if the stream ended first.
+        """
+        marker = f"\n{self.marker}"
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        buffer = ""
+        found = -1
+        while True:
+            chunk = await stream.read(4096)
+            if not chunk:
+                if buffer:
+                    await queue.put((name, buffer))
+                await queue.put((name, None))
+                return None
+            buffer += decoder.decode(chunk)
+            if found < 0:
+                found = buffer.find(marker)
+                if found < 0:
+                    keep = _partial_marker(buffer, marker)
+                    if len(buffer) > keep:
+                        await queue.put((name, buffer[: len(buffer) - keep]))
+                        buffer = buffer[len(buffer) - keep :]
+                    continue
+                if found:
+                    await queue.put((name, buffer[:found]))
+                buffer = buffer[found + len(marker) :]
+            end = buffer.find("\n")
+            if end >= 0:
+                await queue.put((name, None))
+                return buffer[:end]
+
+    def close(self):
+        """Kills the shell and anything it started."""
+        self.broken = True
+        if self.process is not None and self.process.returncode is None:
+            kill_process(self.process)
+            shell_sessions.inc(event="retired")
+
+
+class ShellPool:
+    """
+    Keeps `size` shells started ahead of time and leases one to each task for
+    its whole lifetime. Sessions are never shared between tasks: a released
+    session is killed and the pool is topped up in the background. A session
+    that breaks, or has run `max_commands` commands, is replaced by a fresh
+    one in the same directory.
+    """
+
+    def __init__(
+        self, size=SHELL_POOL_SIZE, max_commands=SHELL_SESSION_MAX_COMMANDS
+    ):
+        self.size = size
+        self.max_commands = max_commands
+        self.idle = []
+        self.leases = {}  # task_id -> ShellSession
+        self.refilling = None
+
+    async def lease(self, task_id, cwd):
+        session = await self._take()
+        self.refill()
+        try:
+            await session.enter(cwd)
+        except Exception:
+            session.close()
+            raise
+        self.leases[task_id] = session
+        return session
+
+    def get(self, task_id):
+        """The session leased to a task, if any."""
+        return self.leases.get(task_id)
+
+    async def acquire(self, task_id):
+        """
+        Returns (session, restarted) for a task that holds a lease, replacing
+        a broken or worn-out session first, or (None, False) without a lease.
+        """
+        session = self.leases.get(task_id)
+        if session is None:
+            return None, False
+        if session.alive and session.commands < self.max_commands:
+            return session, False
+
+        restarted = not session.alive  # rather than retired after max_commands
+        session.close()
+        fresh = await self._take()
+        self.refill()
+        if session.cwd and os.path.isdir(session.cwd):
+            await fresh.enter(session.cwd)
+        self.leases[task_id] = fresh
+        return fresh, restarted
+
+    def release(self, task_id):
+        session = self.leases.pop(task_id, None)
+        if session is not None:
+            session.close()
+
+    def refill(self):
+        """Starts shells in the background until `size` are idle."""
+        if self.refilling is None or self.refilling.done():
+            self.refilling = asyncio.create_task(self._refill())
+
+    async def _refill(self):
+        while len(self.idle) < self.size:
+            try:
+                self.idle.append(await ShellSession().start())
+            except OSError as e:
+                logging.warning(f"Could not start a shell session: {e}")
+                return
+
+    async def _take(self):
+        while self.idle:
+            session = self.idle.pop()
+            if session.alive:
+                return session
+        return await ShellSession().start()
+
+    def close(self):
+        """Kills every idle and leased shell, e.g. on shutdown."""
+        if self.refilling is not None:
+            self.refilling.cancel()
+        for session in self.idle + list(self.leases.values()):
+            session.close()
+        self.idle.clear()
+        self.leases.clear()
+
+    async def shutdown(self):
+        """Closes every shell and waits for them to exit."""
+        sessions = self.idle + list(self.leases.values())
+        self.close()
+        await asyncio.gather(
+            *(s.process.wait() for s in sessions if s.process is not None)
+        )
+
+
+shell_pool = ShellPool()
+
+metrics.registry.gauge(
+    "agent_shell_sessions_idle",
+    "Pre-started shell sessions waiting for a task",
+    fn=lambda: len(shell_pool.idle),
+)
+metrics.registry.gauge(
+    "agent_shell_sessions_leased",
+    "Shell sessions leased to running tasks",
+    fn=lambda: len(shell_pool.leases),
+)
@@ -0,0 +1,201 @@
+import asyncio
+import copy
+import logging
+import os
+
+from backend.env import env_flag
+from backend.services.executor import CommandResult, stream_command
+from backend.services.output_log import SpooledResult
+from backend.services.policy import command_policy
+from backend.services.shell_pool import SessionError, shell_pool
+
+# 🔮 Speculative execution while the user is deciding on an approval
+SPECULATION_ENABLED = env_flag("SPECULATION_ENABLED", False)
+SPECULATION_TIMEOUT = float(os.getenv("SPECULATION_TIMEOUT", "30"))
+
+# Aggregated over every task handled by this process
+stats = {"speculations": 0, "hits": 0, "misses": 0}
+
+
+class Speculation:
+    """Work done ahead of time for one action that is awaiting approval."""
+
+    def __init__(self, action, read_only):
+        self.action = action
+        self.read_only = read_only
+        self.outcome = None  # SpooledResult, only for read-only actions
+        self.context = None  # history the next thought was computed from
+        self.prefetch = None
+        self.next_thought = None
+        self.settled = False  # counted as a hit or a miss
+
+    def cancel(self):
+        for task in (self.prefetch, self.next_thought):
+            if task is not None:
+                task.cancel()
+        if self.outcome is not None:
+            self.outcome.close()
+
+    async def thought_for(self, context):
+        """Returns the precomputed next thought if it was based on `context`."""
+        if self.prefetch is not None:
+            await asyncio.wait([self.prefetch])
+        if self.next_thought is None or context != self.context:
+            self.cancel()
+            return None
+        try:
+            return await self.next_thought
+        except Exception as e:
+            logging.warning(f"Speculative thought failed: {e}")
+            return None
+
+
+class Speculator:
+    """
+    Uses the time a task spends waiting for approval to compute the next
+    thought. A read-only action runs where the task would run it (in its shell
+    session, or else in its workspace) and the thought is based on its real
+    result, which is reused too. For any other action the thought assumes it
+    succeeds without output (as `git add`, `mkdir` or writing a file do), and
+    is only used if that is exactly what happened.
+    Nothing is kept unless the user approves the very same command.
+    """
+
+    def __init__(
+        self,
+        task_id,
+        reasoning_agent,
+        repo_name,
+        workspace,
+        refined_input,
+        format_result,
+    ):
+        self.task_id = task_id
+        self.reasoning_agent = reasoning_agent
+        self.format_result = format_result
+        self.repo_name = repo_name
+        self.workspace = workspace
+        self.refined_input = refined_input
+        self.current = None
+        self.stats = {"speculations": 0, "hits": 0, "misses": 0}
+
+    def start(self, action, history):
+        """Begins speculating on `action` while the approval is pending."""
+        speculation = Speculation(action, command_policy.is_read_only(action))
+        speculation.prefetch = asyncio.create_task(
+            self._prefetch(speculation, copy.deepcopy(history))
+        )
+        self._count("speculations")
+        self.current = speculation
+        return speculation
+
+    async def resolve(self, speculation, approved_command):
+        """
+        Keeps the speculation if the approved command matches, otherwise
+        discards it. Only a kept read-only speculation has an `outcome` to reuse.
+        """
+        if speculation is None:
+            return None
+        if approved_command != speculation.action:
+            self.discard(speculation)
+            return None
+        if not speculation.read_only:
+            return speculation  # the command runs; the thought may still fit
+
+        try:
+            await speculation.prefetch
+        except Exception as e:
+            logging.warning(f"Speculative probe failed: {e}")
+        if speculation.outcome is None:
+            self.discard(speculation)
+            return None
+        self._settle(speculation, hit=True)
+        return speculation
+
+    async def thought_for(self, speculation, context):
+        """The next thought computed ahead of time, if it was based on `context`."""
+        thought = await speculation.thought_for(context)
+        self._settle(speculation, hit=thought is not None)
+        return thought
+
+    def discard(self, speculation):
+        if speculation is not None:
+            speculation.cancel()
+            self._settle(speculation, hit=False)
+
+    def close(self):
+        """Stops any speculative work that is still running."""
+        if self.current is not None:
+            self.current.cancel()
+
+    def hit_rate(self):
+        total = self.stats["speculations"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def _settle(self, speculation, hit):
+        if not speculation.settled:
+            speculation.settled = True
+            self._count("hits" if hit else "misses")
+
+    def _count(self, key):
+        self.stats[key] += 1
+        stats[key] += 1
+
+    async def _prefetch(self, speculation, history):
+        if speculation.read_only:
+            outcome = await self._probe(speculation.action)
+            if outcome is None:
+                return
+            if outcome.timed_out:
+                outcome.close()
+                return
+            speculation.outcome = outcome
+        else:
+            # Predict a silent success, the usual result of a mutating command
+            outcome = CommandResult()
+            outcome.returncode = 0
+        history.add_result(self.format_result(speculation.action, outcome))
+        speculation.context = history.messages()
+        speculation.next_thought = asyncio.create_task(
+            self.reasoning_agent.think(
+                self.refined_input, self.repo_name, speculation.context
+            )
+        )
+
+    async def _probe(self, command):
+        """Runs a read-only command; None if the task's shell session is unusable."""
+        result = SpooledResult()
+        session = shell_pool.get(self.task_id)
+        if session is not None:
+            if not session.alive:
+                result.close()
+                return None
+            # Runs to the end even if the speculation is dropped: a command cut
+            # short takes the session (and the task's environment) down with it
+            try:
+                await asyncio.shield(_drain(session.run(command, result)))
+            except SessionError:
+                result.close()
+                return None
+            if not session.alive:
+                # Killed under it (e.g. the session was replaced); not a real result
+                result.close()
+                return None
+            return result
+        try:
+            async for _ in stream_command(
+                command,
+                self.workspace,
+                self.repo_name,
+                timeout=SPECULATION_TIMEOUT,
+                result=result,
+            ):
+                pass
+        except OSError as e:
+            result.stderr = str(e)
+        return result
+
+
+async def _drain(chunks):
+    async for _ in chunks:
+        pass
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import sqlite3
+import time
+
+COLUMNS = ["key", "value", "uses", "created", "accessed"]
+
+
+class SQLiteStore:
+    """
+    A SQLite table of JSON values by key. Entries expire `ttl` seconds after
+    they were written and the least recently used ones are evicted once
+    there are more than `max_entries`. Queries run one at a time in a
+    worker thread.
+    """
+
+    def __init__(self, path, table, max_entries, ttl):
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self._create()
+        self.lock = asyncio.Lock()
+
+    async def get(self, key):
+        """Returns the value stored under `key`, or None if there is none or it expired."""
+        return await self._run(self._get, key, time.time())
+
+    async def set(self, key, value):
+        await self._run(self._set, key, json.dumps(value), time.time())
+
+    async def touch(self, key):
+        """Counts a use of an entry and keeps it from being evicted."""
+        await self._run(
+            self._execute,
+            f"UPDATE {self.table} SET uses = uses + 1, accessed = ? WHERE key = ?",
+            (time.time(), key),
+        )
+
+    async def delete(self, key):
+        await self._run(
+            self._execute, f"DELETE FROM {self.table} WHERE key = ?", (key,)
+        )
+
+    async def _run(self, function, *args):
+        async with self.lock:
+            return await asyncio.to_thread(function, *args)
+
+    # --- SQLite helpers (run in a worker thread) ---
+
+    def _create(self):
+        columns = [row[1] for row in self.db.execute(f"PRAGMA table_info({self.table})")]
+        if columns and columns != COLUMNS:
+            # Written by an older version; a cache can simply start over
+            self.db.execute(f"DROP TABLE {self.table}")
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT, uses INTEGER, created REAL, accessed REAL)"
+        )
+        self.db.commit()
+
+    def _execute(self, query, params):
+        self.db.execute(query, params)
+        self.db.commit()
+
+    def _get(self, key, now):
+        row = self.db.execute(
+            f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[1] >= self.ttl:
+            self._execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            return None
+        self._execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def _set(self, key, value, now):
+        self.db.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, uses, created, accessed) "
+            "VALUES (?, ?, 0, ?, ?)",
+            (key, value, now, now),
+        )
+        # Expire old entries, then trim the least recently used ones
+        self.db.execute(f"DELETE FROM {self.table} WHERE created < ?", (now - self.ttl,))
+        self.db.execute(
+            f"DELETE FROM {self.table} WHERE key IN ("
+            f"SELECT key FROM {self.table} ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self.db.commit()
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import os
+import zlib
+
+from backend.env import env_flag
+
+SSE_FLUSH_WINDOW = float(os.getenv("SSE_FLUSH_WINDOW", "0.02"))
+SSE_MAX_BATCH = int(os.getenv("SSE_MAX_BATCH", "500"))
+SSE_GZIP = env_flag("SSE_GZIP", True)
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # keep reverse proxies from buffering the stream
+}
+
+_DONE = object()
+
+
+def format_event(event) -> str:
+    """Serializes one stored event as an SSE frame."""
+    return (
+        f"id: {event['id']}\n"
+        f"event: {event['type']}\n"
+        f"data: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+    )
+
+
+def accepts_gzip(accept_encoding) -> bool:
+    return SSE_GZIP and "gzip" in (accept_encoding or "").lower()
+
+
+def stream_headers(compress=False, **extra):
+    headers = {**SSE_HEADERS, **extra}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return headers
+
+
+async def encode_events(events, flush_window=SSE_FLUSH_WINDOW, compress=False):
+    """
+    Turns an async iterator of events into SSE bytes.
+    Events arriving within `flush_window` of each other are written as one
+    chunk, so token-by-token LLM output does not cost one write per token.
+    With `compress`, the whole response is a gzip stream flushed after every
+    chunk, so the client can still decode each batch as soon as it arrives.
+    """
+    queue = asyncio.Queue()
+    failure = []
+
+    async def produce():
+        try:
+            async for event in events:
+                queue.put_nowait(event)
+        except Exception as e:
+            failure.append(e)
+        finally:
+            queue.put_nowait(_DONE)
+
+    # Reading in a separate task means the flush timer never interrupts `events`
+    producer = asyncio.create_task(produce())
+    gzip = zlib.compressobj(wbits=31) if compress else None
+    try:
+        done = False
+        while not done:
+            batch = [await queue.get()]
+            if batch[0] is _DONE:
+                break
+            if flush_window > 0:
+                await asyncio.sleep(flush_window)
+            while not queue.empty() and len(batch) < SSE_MAX_BATCH:
+                batch.append(queue.get_nowait())
+            if batch[-1] is _DONE:
+                batch.pop()
+                done = True
+
+            chunk = "".join(format_event(event) for event in batch).encode()
+            if gzip:
+                chunk = gzip.compress(chunk) + gzip.flush(zlib.Z_SYNC_FLUSH)
+            yield chunk
+
+        if failure:
+            raise failure[0]
+        if gzip:
+            yield gzip.flush()
+    finally:
+        producer.cancel()
@@ -1,2 +1,253 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+from backend.services import metrics
+
+# 🔀 Coordination state backend: "memory" (single process) or "sqlite" (many workers)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "task_state.sqlite3")
+STATE_POLL_INTERVAL = float(os.getenv("STATE_POLL_INTERVAL", "0.2"))
+
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+# step_id / task_id -> asyncio.Queue of approval decisions (in-process backend)
 approval_channels = {}
-cancelled_tasks = set()
\ No newline at end of file
+
+metrics.registry.gauge(
+    "agent_approval_channels",
+    "Entries in the in-process approval channel map",
+    fn=lambda: len(approval_channels),
+)
+
+
+class StateBackend:
+    """
+    Coordination state shared by everything serving the API: which worker owns
+    a task, which approval steps are open, and pending cancellations.
+    `on_cancel(task_id)` is called in the worker that owns a cancelled task.
+    """
+
+    def __init__(self):
+        self.on_cancel = None
+
+    async def register_task(self, task_id):
+        raise NotImplementedError
+
+    async def unregister_task(self, task_id):
+        raise NotImplementedError
+
+    async def open_step(self, task_id, step_id):
+        raise NotImplementedError
+
+    async def close_step(self, task_id, step_id):
+        raise NotImplementedError
+
+    async def submit_approval(self, key, decision) -> bool:
+        """Delivers a decision for a step (or a task's current step). False if unknown."""
+        raise NotImplementedError
+
+    async def wait_for_approval(self, step_id):
+        raise NotImplementedError
+
+    async def request_cancel(self, task_id=None) -> bool:
+        """Cancels one task wherever it runs, or every task if task_id is None."""
+        raise NotImplementedError
+
+
+class InProcessStateBackend(StateBackend):
+    """Keeps everything in this process's memory; only valid with a single worker."""
+
+    def __init__(self):
+        super().__init__()
+        self.tasks = set()
+
+    async def register_task(self, task_id):
+        self.tasks.add(task_id)
+
+    async def unregister_task(self, task_id):
+        self.tasks.discard(task_id)
+        approval_channels.pop(task_id, None)
+
+    async def open_step(self, task_id, step_id):
+        queue = asyncio.Queue()
+        approval_channels[step_id] = queue
+        approval_channels[task_id] = queue
+
+    async def close_step(self, task_id, step_id):
+        queue = approval_channels.pop(step_id, None)
+        # A task-keyed approval between steps must not land in the closed step
+        if queue is not None and approval_channels.get(task_id) is queue:
+            del approval_channels[task_id]
+
+    async def submit_approval(self, key, decision):
+        if key not in approval_channels:
+            return False
+        await approval_channels[key].put(decision)
+        return True
+
+    async def wait_for_approval(self, step_id):
+        return await approval_channels[step_id].get()
+
+    async def request_cancel(self, task_id=None):
+        targets = list(self.tasks) if task_id is None else [task_id]
+        found = False
+        for target in targets:
+            if target in self.tasks and self.on_cancel:
+                found = self.on_cancel(target) or found
+        return found
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Shares state between worker processes through one SQLite file.
+    Approvals and cancellations are written to the database by whichever
+    worker receives the request, and picked up by polling in the worker
+    that owns the task.
+    """
+
+    def __init__(self, path=STATE_DB_PATH, poll_interval=STATE_POLL_INTERVAL):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self.db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS owners ("
+            " task_id TEXT PRIMARY KEY, worker_id TEXT, cancel_requested INTEGER DEFAULT 0,"
+            " updated REAL);"
+            "CREATE TABLE IF NOT EXISTS steps ("
+            " step_id TEXT PRIMARY KEY, task_id TEXT, decision TEXT, created REAL);"
+            "CREATE INDEX IF NOT EXISTS steps_task ON steps (task_id);"
+        )
+        self.db.commit()
+        self.lock = asyncio.Lock()
+        self.local_tasks = set()
+        self._watcher = None
+
+    async def _run(self, fn, *args):
+        async with self.lock:
+            return await asyncio.to_thread(fn, *args)
+
+    async def register_task(self, task_id):
+        self.local_tasks.add(task_id)
+        await self._run(self._register, task_id)
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch_cancellations())
+
+    async def unregister_task(self, task_id):
+        self.local_tasks.discard(task_id)
+        await self._run(self._unregister, task_id)
+
+    async def open_step(self, task_id, step_id):
+        await self._run(self._open_step, task_id, step_id)
+
+    async def close_step(self, task_id, step_id):
+        await self._run(self._close_step, step_id)
+
+    async def submit_approval(self, key, decision):
+        return await self._run(self._submit, key, json.dumps(decision))
+
+    async def wait_for_approval(self, step_id):
+        while True:
+            decision = await self._run(self._decision, step_id)
+            if decision is not None:
+                return json.loads(decision)
+            await asyncio.sleep(self.poll_interval)
+
+    async def request_cancel(self, task_id=None):
+        if task_id in self.local_tasks and self.on_cancel:
+            return self.on_cancel(task_id)
+        return await self._run(self._request_cancel, task_id)
+
+    async def _watch_cancellations(self):
+        """Routes cancellations requested through other workers to our own tasks."""
+        while self.local_tasks:
+            for task_id in await self._run(self._pending_cancels):
+                if self.on_cancel:
+                    self.on_cancel(task_id)
+            await asyncio.sleep(self.poll_interval)
+
+    # --- SQLite helpers (run in a worker thread) ---
+
+    def _register(self, task_id):
+        self.db.execute(
+            "INSERT OR REPLACE INTO owners (task_id, worker_id, cancel_requested, updated) "
+            "VALUES (?, ?, 0, ?)",
+            (task_id, WORKER_ID, time.time()),
+        )
+        self.db.commit()
+
+    def _unregister(self, task_id):
+        self.db.execute("DELETE FROM owners WHERE task_id = ?", (task_id,))
+        self.db.execute("DELETE FROM steps WHERE task_id = ?", (task_id,))
+        self.db.commit()
+
+    def _open_step(self, task_id, step_id):
+        self.db.execute(
+            "INSERT INTO steps (step_id, task_id, decision, created) VALUES (?, ?, NULL, ?)",
+            (step_id, task_id, time.time()),
+        )
+        self.db.commit()
+
+    def _close_step(self, step_id):
+        self.db.execute("DELETE FROM steps WHERE step_id = ?", (step_id,))
+        self.db.commit()
+
+    def _submit(self, key, decision):
+        row = self.db.execute(
+            "SELECT step_id FROM steps WHERE (step_id = ? OR task_id = ?) "
+            "AND decision IS NULL ORDER BY created DESC LIMIT 1",
+            (key, key),
+        ).fetchone()
+        if row is None:
+            return False
+        self.db.execute(
+            "UPDATE steps SET decision = ? WHERE step_id = ?", (decision, row[0])
+        )
+        self.db.commit()
+        return True
+
+    def _decision(self, step_id):
+        row = self.db.execute(
+            "SELECT decision FROM steps WHERE step_id = ?", (step_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _request_cancel(self, task_id):
+        if task_id is None:
+            cursor = self.db.execute("UPDATE owners SET cancel_requested = 1")
+        else:
+            cursor = self.db.execute(
+                "UPDATE owners SET cancel_requested = 1 WHERE task_id = ?", (task_id,)
+            )
+        self.db.commit()
+        return cursor.rowcount > 0
+
+    def _pending_cancels(self):
+        rows = self.db.execute(
+            "SELECT task_id FROM owners WHERE worker_id = ? AND cancel_requested = 1",
+            (WORKER_ID,),
+        ).fetchall()
+        if rows:
+            self.db.execute(
+                "UPDATE owners SET cancel_requested = 2 "
+                "WHERE worker_id = ? AND cancel_requested = 1",
+                (WORKER_ID,),
+            )
+            self.db.commit()
+        return [r[0] for r in rows]
+
+
+def create_state_backend(kind=STATE_BACKEND):
+    if kind == "sqlite":
+        return SQLiteStateBackend()
+    if kind == "memory":
+        return InProcessStateBackend()
+    raise ValueError(f"Unknown STATE_BACKEND: {kind}")
+
+
+state_backend = create_state_backend()
@@ -0,0 +1,223 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from backend.services import metrics
+from backend.services.executor import kill_process
+from backend.services.state import state_backend
+
+APPROVAL_TIMEOUT = float(os.getenv("APPROVAL_TIMEOUT", "900"))
+TASK_TIMEOUT = float(os.getenv("TASK_TIMEOUT", "3600"))
+CANCEL_GRACE_PERIOD = float(os.getenv("CANCEL_GRACE_PERIOD", "5"))
+FINISHED_TASKS_KEPT = int(os.getenv("FINISHED_TASKS_KEPT", "1000"))
+
+
+class TaskState:
+    RUNNING = "Running"
+    AWAITING_APPROVAL = "Awaiting approval"
+    EXECUTING = "Executing"
+    COMPLETED = "Completed"
+    FAILED = "Failed"
+    CANCELLED = "Cancelled"
+    TIMED_OUT = "Timed out"
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task once it has been cancelled or has run out of time."""
+
+    def __init__(self, reason="cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class ApprovalTimeout(Exception):
+    pass
+
+
+class TaskRecord:
+    def __init__(self, task_id, repo_name):
+        self.task_id = task_id
+        self.repo_name = repo_name
+        self.state = TaskState.RUNNING
+        self.started = time.time()
+        self.asyncio_task = asyncio.current_task()
+        self.cancel_event = asyncio.Event()
+        self.cancel_reason = None
+        self.step_ids = set()
+        self.outcomes = []  # CommandResults of the commands currently running
+        self.history = None
+        self.manifest = None  # pinned repository manifest message, see repo_index
+        self.timers = []
+
+
+class TaskRegistry:
+    """
+    Tracks every running task: its state, its asyncio task, the command it is
+    running and its approval channels. Finished tasks are cleaned up and only
+    their final state is kept.
+    """
+
+    def __init__(
+        self,
+        task_timeout=TASK_TIMEOUT,
+        approval_timeout=APPROVAL_TIMEOUT,
+        backend=state_backend,
+    ):
+        self.task_timeout = task_timeout
+        self.approval_timeout = approval_timeout
+        self.tasks = {}
+        self.finished = OrderedDict()
+        # Approvals and cancellations may arrive through any worker
+        self.backend = backend
+        self.backend.on_cancel = self.cancel
+
+    async def register(self, task_id, repo_name):
+        record = TaskRecord(task_id, repo_name)
+        self.tasks[task_id] = record
+        metrics.traces.start(task_id)
+        await self.backend.register_task(task_id)
+        if self.task_timeout:
+            loop = asyncio.get_running_loop()
+            record.timers.append(
+                loop.call_later(self.task_timeout, self.cancel, task_id, "timeout")
+            )
+        return record
+
+    def get(self, task_id):
+        return self.tasks.get(task_id)
+
+    def status(self, task_id):
+        if task_id in self.tasks:
+            return self.tasks[task_id].state
+        return self.finished.get(task_id)
+
+    def set_state(self, task_id, state):
+        if task_id in self.tasks:
+            self.tasks[task_id].state = state
+
+    # --- Approvals ---
+
+    async def add_step(self, task_id, step_id):
+        self.tasks[task_id].step_ids.add(step_id)
+        await self.backend.open_step(task_id, step_id)
+
+    async def remove_step(self, task_id, step_id):
+        await self.backend.close_step(task_id, step_id)
+        if task_id in self.tasks:
+            self.tasks[task_id].step_ids.discard(step_id)
+
+    async def wait_for_approval(self, task_id, step_id):
+        """Waits for the user's decision, giving up on cancellation or timeout."""
+        record = self.tasks[task_id]
+        record.state = TaskState.AWAITING_APPROVAL
+        approval = asyncio.ensure_future(self.backend.wait_for_approval(step_id))
+        cancelled = asyncio.ensure_future(record.cancel_event.wait())
+        with metrics.timed(metrics.approval_wait, "approval", task_id) as labels:
+            labels["outcome"] = "cancelled"
+            try:
+                done, _ = await asyncio.wait(
+                    {approval, cancelled},
+                    timeout=self.approval_timeout or None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            finally:
+                approval.cancel()
+                cancelled.cancel()
+
+            if approval in done:
+                record.state = TaskState.RUNNING
+                decision = approval.result()
+                labels["outcome"] = "approved" if decision["approved"] else "rejected"
+                return decision
+            if cancelled in done:
+                raise TaskCancelled(record.cancel_reason)
+            labels["outcome"] = "timeout"
+            raise ApprovalTimeout()
+
+    # --- Commands ---
+
+    def attach_command(self, task_id, *outcomes):
+        record = self.tasks[task_id]
+        record.outcomes = list(outcomes)
+        record.state = TaskState.EXECUTING
+
+    def detach_command(self, task_id):
+        record = self.tasks.get(task_id)
+        if record:
+            record.outcomes = []
+            record.state = TaskState.RUNNING
+
+    # --- Cancellation ---
+
+    def check_cancelled(self, task_id):
+        record = self.tasks.get(task_id)
+        if record and record.cancel_event.is_set():
+            raise TaskCancelled(record.cancel_reason)
+
+    def cancel(self, task_id, reason="cancelled"):
+        """Cancels one task and kills the command it is running. Returns False if unknown."""
+        record = self.tasks.get(task_id)
+        if record is None:
+            return False
+        if record.cancel_event.is_set():
+            return True
+
+        record.cancel_reason = reason
+        record.cancel_event.set()
+        for outcome in record.outcomes:
+            process = outcome.process
+            if process is not None and process.returncode is None:
+                kill_process(process)
+
+        # Give the task a moment to stop on its own before cancelling it outright
+        if record.asyncio_task is not None:
+            loop = asyncio.get_running_loop()
+            record.timers.append(
+                loop.call_later(CANCEL_GRACE_PERIOD, self._force_cancel, task_id)
+            )
+        return True
+
+    def _force_cancel(self, task_id):
+        record = self.tasks.get(task_id)
+        if record and not record.asyncio_task.done():
+            record.asyncio_task.cancel()
+
+    # --- Cleanup ---
+
+    async def finish(self, task_id, state):
+        """Releases everything held for a task and remembers its final state."""
+        record = self.tasks.pop(task_id, None)
+        if record is None:
+            return
+        for timer in record.timers:
+            timer.cancel()
+        for step_id in record.step_ids:
+            await self.backend.close_step(task_id, step_id)
+        await self.backend.unregister_task(task_id)
+        record.history = None
+        record.outcomes = []
+
+        self.finished[task_id] = state
+        while len(self.finished) > FINISHED_TASKS_KEPT:
+            self.finished.popitem(last=False)
+
+        metrics.tasks_finished.inc(state=state)
+        metrics.observe(
+            metrics.task_duration, "task", time.time() - record.started, task_id, state=state
+        )
+
+    def pending_approvals(self):
+        return sum(len(record.step_ids) for record in self.tasks.values())
+
+
+task_registry = TaskRegistry()
+
+metrics.registry.gauge(
+    "agent_tasks_in_flight", "Tasks currently running", fn=lambda: len(task_registry.tasks)
+)
+metrics.registry.gauge(
+    "agent_pending_approvals",
+    "Approval steps waiting for a user decision",
+    fn=task_registry.pending_approvals,
+)
@@ -4,6 +4,7 @@ import { useMutation } from "@tanstack/react-query";
 import { Maximize } from "lucide-react";
 import { AnimatePresence, motion } from "framer-motion";
 import { Loader2 } from "lucide-react";
+import { SSEParser } from "./sse";
 
 export default function AutomationFrameworkUI() {
   const [command, setCommand] = useState("");
@@ -21,6 +22,7 @@ export default function AutomationFrameworkUI() {
 
   const logsEndRef = useRef<HTMLDivElement>(null);
   const controllerRef = useRef<AbortController | null>(null);
+  const serverTaskIdRef = useRef<string | null>(null);
 
   const [startTime, setStartTime] = useState<number | null>(null);
   const [elapsedTime, setElapsedTime] = useState(0);
@@ -70,15 +72,6 @@ export default function AutomationFrameworkUI() {
     return "🤖 AI DevOps Agent completed the requested automation";
   };
 
-  const parseApprovalTag = (line: string) => {
-    const approvalRegex = /\[ApprovalRequired\]\s(.+?)\s→\s(.+)/;
-    const match = approvalRegex.exec(line);
-    if (match) {
-      return { taskId: match[1], action: match[2] };
-    }
-    return null;
-  };
-
   const sendApproval = async (approved: boolean) => {
     if (!pendingApproval) return;
     const { taskId } = pendingApproval;
@@ -142,28 +135,35 @@ export default function AutomationFrameworkUI() {
 
       if (!response.ok) throw new Error("Failed to execute automation");
 
-      const taskId = crypto.randomUUID();
+      serverTaskIdRef.current = response.headers.get("X-Task-ID");
+      const taskId = serverTaskIdRef.current ?? crypto.randomUUID();
       const reader = response.body?.getReader();
       if (!reader) throw new Error("No response stream available");
 
       const decoder = new TextDecoder();
+      const parser = new SSEParser();
       let newOutput = "";
 
       while (true) {
         const { value, done } = await reader.read();
         if (done) break;
 
-        const chunk = decoder.decode(value, { stream: true });
-        newOutput += chunk;
-        setExecutionStatus(newOutput);
-
-        const approval = parseApprovalTag(chunk);
-        if (approval) {
-          setPendingApproval(approval);
-          if (!isEditing) {
-            setEditedAction(approval.action);
+        const events = parser.feed(decoder.decode(value, { stream: true }));
+        for (const event of events) {
+          newOutput += event.data.text ?? "";
+
+          if (event.type === "action_pending") {
+            const approval = {
+              taskId: event.data.step_id,
+              action: event.data.action,
+            };
+            setPendingApproval(approval);
+            if (!isEditing) {
+              setEditedAction(approval.action);
+            }
           }
         }
+        if (events.length > 0) setExecutionStatus(newOutput);
       }
 
       setIsRunning(false);
@@ -201,7 +201,11 @@ export default function AutomationFrameworkUI() {
       if (controllerRef.current) {
         controllerRef.current.abort();
       }
-      await fetch("http://localhost:8000/cancel-automation", {
+      // Cancel only our own task when the server told us its id
+      const cancelUrl = serverTaskIdRef.current
+        ? `http://localhost:8000/cancel-automation/${serverTaskIdRef.current}`
+        : "http://localhost:8000/cancel-automation";
+      await fetch(cancelUrl, {
         method: "POST",
       });
 
@@ -0,0 +1,56 @@
+export type TaskEvent = {
+  id: number | null;
+  type: string;
+  data: { text?: string; [key: string]: any };
+};
+
+/**
+ * Incremental parser for the backend's server-sent events.
+ * Chunks may end anywhere (mid-line or mid-event); incomplete input is kept
+ * until the rest of it arrives.
+ */
+export class SSEParser {
+  private buffer = "";
+  lastEventId: number | null = null;
+
+  feed(chunk: string): TaskEvent[] {
+    this.buffer += chunk;
+    const events: TaskEvent[] = [];
+
+    let end = this.buffer.indexOf("\n\n");
+    while (end !== -1) {
+      const block = this.buffer.slice(0, end);
+      this.buffer = this.buffer.slice(end + 2);
+      const event = this.parseBlock(block);
+      if (event) events.push(event);
+      end = this.buffer.indexOf("\n\n");
+    }
+    return events;
+  }
+
+  private parseBlock(block: string): TaskEvent | null {
+    let id: number | null = null;
+    let type = "message";
+    const dataLines: string[] = [];
+
+    for (const line of block.split("\n")) {
+      if (!line || line.startsWith(":")) continue;
+      const colon = line.indexOf(":");
+      const field = colon === -1 ? line : line.slice(0, colon);
+      let value = colon === -1 ? "" : line.slice(colon + 1);
+      if (value.startsWith(" ")) value = value.slice(1);
+
+      if (field === "id") id = Number(value);
+      else if (field === "event") type = value;
+      else if (field === "data") dataLines.push(value);
+    }
+    if (dataLines.length === 0) return null;
+
+    if (id !== null) this.lastEventId = id;
+    try {
+      return { id, type, data: JSON.parse(dataLines.join("\n")) };
+    } catch {
+      return { id, type, data: { text: dataLines.join("\n") } };
+    }
+  }
+}
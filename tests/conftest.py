@@ -0,0 +1,44 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from backend.benchmarks import anthropic_stub, ollama_stub
+
+
+def serve(handler):
+    """Starts a stub server on a free port; returns (base_url, server)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", server
+
+
+@pytest.fixture
+def anthropic_server(tmp_path):
+    """An Anthropic stub that logs every request body to `log`."""
+    log = tmp_path / "requests.jsonl"
+    url, server = serve(
+        anthropic_stub.make_handler(
+            "Thought: Done.\nFinal Answer: Nothing to do.",
+            anthropic_stub.PromptCache(min_tokens=1),
+            str(log),
+        )
+    )
+    yield url, log
+    server.shutdown()
+
+
+
+@pytest.fixture
+def ollama_server():
+    """Starts Ollama stubs: `ollama_server(reply, delay)` returns the URL of one."""
+    servers = []
+
+    def start(reply, delay=0):
+        url, server = serve(ollama_stub.make_handler(reply, delay))
+        servers.append(server)
+        return url
+
+    yield start
+    for server in servers:
+        server.shutdown()
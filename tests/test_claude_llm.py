@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+from backend.llms.claude_llm import (
+    CACHE_BREAKPOINT,
+    ClaudeLLM,
+    mark_last_message,
+    split_system_prompt,
+)
+from backend.llms.gateway import LLMGateway
+from backend.services.agents.reasoning_agent import ACTION_TOOLS, TOOL_CHOICE
+
+MESSAGES = [
+    {"role": "system", "content": "rules"},
+    {"role": "system", "content": "task context"},
+    {"role": "user", "content": "The task is: add CI"},
+    {"role": "assistant", "content": "Thought: Look.\nAction: ls"},
+    {"role": "user", "content": "Result: README.md"},
+]
+
+
+def breakpoints(body):
+    """Where a request body has cache_control, as (section, index) pairs."""
+    marks = [("system", i) for i, b in enumerate(body.get("system", [])) if "cache_control" in b]
+    for i, message in enumerate(body["messages"]):
+        content = message["content"]
+        if isinstance(content, list):
+            marks += [("messages", i) for b in content if "cache_control" in b]
+    return marks
+
+
+def test_split_system_prompt_keeps_order():
+    system, messages = split_system_prompt(MESSAGES)
+    assert system == ["rules", "task context"]
+    assert [m["role"] for m in messages] == ["user", "assistant", "user"]
+
+
+def test_mark_last_message_copies_and_marks_only_the_last_block():
+    messages = [
+        {"role": "user", "content": "first"},
+        {"role": "user", "content": [{"type": "text", "text": "a"}, {"type": "text", "text": "b"}]},
+    ]
+    marked = mark_last_message(messages)
+    assert marked[0] is messages[0]
+    assert marked[1]["content"] == [
+        {"type": "text", "text": "a"},
+        {"type": "text", "text": "b", "cache_control": CACHE_BREAKPOINT},
+    ]
+    assert "cache_control" not in messages[1]["content"][1]
+    assert mark_last_message([]) == []
+
+
+def test_request_marks_static_system_prompt_and_latest_message():
+    body = ClaudeLLM("m", gateway=object()).request(MESSAGES, ACTION_TOOLS, TOOL_CHOICE)
+    assert breakpoints(body) == [("system", 0), ("messages", 2)]
+    assert body["system"][1] == {"type": "text", "text": "task context"}
+    assert body["tools"] == ACTION_TOOLS and body["tool_choice"] == TOOL_CHOICE
+
+
+def test_request_without_prompt_caching_has_no_breakpoints():
+    body = ClaudeLLM("m", gateway=object(), prompt_caching=False).request(MESSAGES)
+    assert breakpoints(body) == []
+    assert body["messages"][-1]["content"] == "Result: README.md"
+
+
+def test_each_step_reads_what_the_previous_one_wrote(anthropic_server):
+    url, log = anthropic_server
+    llm = ClaudeLLM("m", gateway=LLMGateway(api_key="test", base_url=url, requests_per_minute=0))
+    first = MESSAGES[:3]
+    second = MESSAGES
+
+    async def run():
+        try:
+            usages = []
+            for messages in (first, second):
+                response = await llm.gateway.create(**llm.request(messages))
+                usages.append(response.usage)
+            text, calls = await llm.chat_tools(second, ACTION_TOOLS, TOOL_CHOICE)
+            return usages, calls
+        finally:
+            await llm.gateway.aclose()
+
+    (written, read), calls = asyncio.run(run())
+    assert written.cache_creation_input_tokens > 0 and not written.cache_read_input_tokens
+    assert read.cache_read_input_tokens >= written.cache_creation_input_tokens
+    assert calls[0]["name"] == "final_answer"
+
+    bodies = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [breakpoints(body) for body in bodies] == [
+        [("system", 0), ("messages", 0)],
+        [("system", 0), ("messages", 2)],
+        [("system", 0), ("messages", 2)],
+    ]
@@ -0,0 +1,22 @@
+import pytest
+
+from backend.env import env_flag
+
+
+@pytest.mark.parametrize("value", ["1", "true", "True", "YES", "on", " true "])
+def test_true_values(monkeypatch, value):
+    monkeypatch.setenv("SOME_FLAG", value)
+    assert env_flag("SOME_FLAG") is True
+
+
+@pytest.mark.parametrize("value", ["0", "false", "no", "off", "disabled"])
+def test_other_values_are_false(monkeypatch, value):
+    monkeypatch.setenv("SOME_FLAG", value)
+    assert env_flag("SOME_FLAG", True) is False
+
+
+def test_unset_or_empty_keeps_the_default(monkeypatch):
+    monkeypatch.delenv("SOME_FLAG", raising=False)
+    assert env_flag("SOME_FLAG", True) is True
+    monkeypatch.setenv("SOME_FLAG", "")
+    assert env_flag("SOME_FLAG") is False
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from anthropic import APIConnectionError, BadRequestError, InternalServerError, RateLimitError
+
+from backend.llms.gateway import LLMGateway, TokenBucket, is_retryable
+
+REQUEST = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+
+
+def status_error(cls, status, headers=None):
+    response = httpx.Response(status, request=REQUEST, headers=headers)
+    return cls("error", response=response, body=None)
+
+
+@pytest.mark.parametrize(
+    "error, retryable",
+    [
+        (status_error(RateLimitError, 429), True),
+        (status_error(InternalServerError, 529), True),
+        (APIConnectionError(request=REQUEST), True),
+        (status_error(BadRequestError, 400), False),
+        (ValueError("bad input"), False),
+    ],
+)
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def gateway(**kwargs):
+    return LLMGateway(api_key="test", requests_per_minute=0, backoff_base=0, **kwargs)
+
+
+def flaky(errors, result="ok"):
+    """A request that fails with `errors` in turn, then returns `result`."""
+    remaining = list(errors)
+    calls = []
+
+    async def send():
+        calls.append(time.monotonic())
+        if remaining:
+            raise remaining.pop(0)
+        return result
+
+    return send, calls
+
+
+def test_retries_transient_errors_until_success():
+    llm = gateway()
+    send, calls = flaky([status_error(RateLimitError, 429), APIConnectionError(request=REQUEST)])
+    assert asyncio.run(llm._with_retries(send)) == "ok"
+    assert len(calls) == 3
+    assert llm.stats == {"requests": 3, "retries": 2, "failures": 0}
+
+
+def test_gives_up_after_max_retries():
+    llm = gateway(max_retries=2)
+    send, calls = flaky([status_error(InternalServerError, 500)] * 5)
+    with pytest.raises(InternalServerError):
+        asyncio.run(llm._with_retries(send))
+    assert len(calls) == 3
+    assert llm.stats["failures"] == 1
+
+
+def test_does_not_retry_client_errors():
+    llm = gateway()
+    send, calls = flaky([status_error(BadRequestError, 400)])
+    with pytest.raises(BadRequestError):
+        asyncio.run(llm._with_retries(send))
+    assert len(calls) == 1
+
+
+def test_backoff_is_jittered_and_capped():
+    llm = LLMGateway(api_key="test", backoff_base=1.0, backoff_max=4.0)
+    delays = [llm.backoff_delay(10) for _ in range(50)]
+    assert all(0 <= d <= 4.0 for d in delays)
+    assert len(set(delays)) > 1
+
+
+def test_backoff_respects_retry_after():
+    llm = LLMGateway(api_key="test", backoff_base=0.01)
+    error = status_error(RateLimitError, 429, headers={"retry-after": "3"})
+    assert llm.backoff_delay(0, error) >= 3
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=20, capacity=2)
+
+    async def take(n):
+        started = time.monotonic()
+        for _ in range(n):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    burst = asyncio.run(take(2))
+    paced = asyncio.run(take(2))
+    assert burst < 0.05
+    assert paced >= 0.08
+
+
+def test_create_goes_through_the_stub(anthropic_server):
+    url, _ = anthropic_server
+    llm = LLMGateway(api_key="test", base_url=url, requests_per_minute=0)
+
+    async def run():
+        try:
+            return await llm.create(
+                model="stub", max_tokens=10, messages=[{"role": "user", "content": "hi"}]
+            )
+        finally:
+            await llm.aclose()
+
+    message = asyncio.run(run())
+    assert message.content[0].text.startswith("Thought: Done.")
+    assert llm.stats == {"requests": 1, "retries": 0, "failures": 0}
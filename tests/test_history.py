@@ -0,0 +1,43 @@
+from backend.services.history import HistoryManager, count_tokens
+
+PINNED = {"role": "user", "content": "The repository is already cloned."}
+
+
+def run_task(history, steps):
+    for i in range(steps):
+        history.append(
+            {"role": "assistant", "content": f"Thought: step {i}\nAction: cat file{i}.txt"}
+        )
+        history.add_result(f"line of file{i}\n" * 400, {"start": i * 1000, "end": i * 1000 + 999})
+
+
+def test_history_stays_within_budget_and_keeps_pinned_context():
+    history = HistoryManager(token_budget=2000, recent_turns=6, max_result_chars=2000)
+    history.pin(PINNED)
+    run_task(history, 30)
+
+    messages = history.messages()
+    assert history.token_count() <= 2000
+    assert messages[0] == PINNED
+    assert messages[1]["content"].startswith("Summary of earlier steps:")
+    assert messages[-1]["content"].startswith("Result: line of file29")
+    assert history.compacted_turns > 0
+
+
+def test_summarized_results_point_at_the_task_log():
+    history = HistoryManager(token_budget=100000, recent_turns=2)
+    run_task(history, 3)
+
+    summary = history.messages()[0]["content"]
+    assert "- Agent: Action: cat file0.txt" in summary
+    assert "[full output: task log bytes 0-999]" in summary
+    assert "[full output: task log bytes 1000-1999]" in summary
+
+
+def test_log_ranges_are_not_sent_to_the_llm():
+    history = HistoryManager(max_result_chars=100)
+    history.add_result("x" * 500, {"start": 0, "end": 499})
+    (message,) = history.messages()
+    assert set(message) == {"role", "content"}
+    assert "500 chars in total, full output in the task log" in message["content"]
+    assert count_tokens(message["content"]) < 60
@@ -0,0 +1,55 @@
+import pytest
+
+from backend.services.output_log import CapturedResult, parse_range, read_range
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-9", (0, 9)),
+        ("bytes=5-", (5, 99)),
+        ("bytes=-10", (90, 99)),
+        ("bytes=-500", (0, 99)),
+        ("bytes=90-500", (90, 99)),
+        (" bytes=0-0 ", (0, 0)),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize(
+    "header", ["bytes=-", "bytes=100-", "bytes=9-5", "bytes=0-1,5-6", "items=0-1", "0-1"]
+)
+def test_parse_range_rejects(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 100)
+
+
+def test_read_range_is_inclusive(tmp_path):
+    path = tmp_path / "x.log"
+    path.write_bytes(b"0123456789")
+    assert read_range(path, 2, 4) == b"234"
+    assert read_range(path, *parse_range("bytes=-3", 10)) == b"789"
+
+
+def run(task_id, base_dir, command, output):
+    result = CapturedResult(task_id, command, base_dir)
+    for stream, text in output:
+        result.add(stream, text)
+    result.returncode = 0
+    result.close()
+    return result
+
+
+def test_log_range_fetches_exactly_the_command_output(tmp_path):
+    first = run("task", str(tmp_path), "ls", [("stdout", "a.txt\nb.txt\n")])
+    empty = run("task", str(tmp_path), "true", [])
+    second = run("task", str(tmp_path), "cat é", [("stdout", "é\n"), ("stderr", "warn\n")])
+    path = first.path
+
+    for result, output in ((first, b"a.txt\nb.txt\n"), (second, "é\nwarn\n".encode())):
+        log = result.log_range()
+        header = f"bytes={log['start']}-{log['end']}"
+        assert read_range(path, *parse_range(header, len(open(path, "rb").read()))) == output
+    assert empty.log_range() is None
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from backend.services.plan_cache import PlanCache, PlanReplay, make_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PlanCache(str(tmp_path / "plans.sqlite3"))
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "package.json").write_text("{}")
+    (repo / "index.js").write_text("")
+    return str(repo)
+
+
+def complete(cache, task, workspace, commands):
+    """Runs a task that is not replayed and stores the commands that completed it."""
+
+    async def run():
+        replay = await PlanReplay.start(cache, task, workspace)
+        assert not replay.active
+        for command in commands:
+            replay.record(command)
+        replay.completed = True
+        await replay.finish()
+
+    asyncio.run(run())
+
+
+def test_key_ignores_case_and_whitespace():
+    assert make_key("Add a CI  workflow", "f") == make_key(" add a ci workflow", "f")
+    assert make_key("Add a CI workflow", "f") != make_key("Add a CI workflow", "g")
+
+
+def test_same_instruction_on_a_similar_repo_hits(cache, workspace, tmp_path):
+    complete(cache, "Add a CI workflow", workspace, ["ls", "git push"])
+
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "package.json").write_text('{"name": "other"}')
+    (other / "index.js").write_text("console.log(1)")
+    replay = asyncio.run(PlanReplay.start(cache, "add a CI workflow", str(other)))
+    assert replay.active
+    assert replay.cached == ["ls", "git push"]
+    assert cache.stats == {"hits": 1, "misses": 1}
+
+
+@pytest.mark.parametrize(
+    "task, extra_file",
+    [("Add a Dockerfile", None), ("Add a CI workflow", "main.py")],
+)
+def test_other_instruction_or_repo_misses(cache, workspace, tmp_path, task, extra_file):
+    complete(cache, "Add a CI workflow", workspace, ["ls"])
+    if extra_file:
+        (tmp_path / "repo" / extra_file).write_text("")
+    replay = asyncio.run(PlanReplay.start(cache, task, workspace))
+    assert not replay.active
+
+
+def test_failing_replay_evicts_the_plan(cache, workspace):
+    complete(cache, "Add a CI workflow", workspace, ["ls", "git push"])
+
+    async def run():
+        replay = await PlanReplay.start(cache, "Add a CI workflow", workspace)
+        assert replay.take() == ["ls"]
+        assert await replay.diverge(failed=True)
+        return await cache.get(replay.key)
+
+    assert asyncio.run(run()) is None
+
+
+def test_diverging_replay_keeps_the_plan(cache, workspace):
+    complete(cache, "Add a CI workflow", workspace, ["ls", "git push"])
+
+    async def run():
+        replay = await PlanReplay.start(cache, "Add a CI workflow", workspace)
+        replay.take()
+        assert not replay.follows(["ls -la"])
+        await replay.diverge()
+        return await cache.get(replay.key)
+
+    assert asyncio.run(run()) == ["ls", "git push"]
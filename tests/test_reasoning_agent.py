@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from backend.benchmarks.fake_llm import ScriptedLLM
+from backend.services import agent_orchestrator
+from backend.services.agent_orchestrator import AgentOrchestrator
+from backend.services.agents.reasoning_agent import AnswerFormatError, tool_answer
+from backend.services.history import HistoryManager
+
+
+def call(name, **fields):
+    return [{"id": "toolu_test", "name": name, "input": fields}]
+
+
+def test_tool_answer_reads_run_command_and_final_answer():
+    assert tool_answer(call("run_command", thought="Look.", command=" ls -la ")) == (
+        "Thought: Look.\nAction: ls -la\nResult: Will be filled in after execution.",
+        "ls -la",
+    )
+    assert tool_answer(call("final_answer", thought="Done.", answer="Pushed.")) == (
+        "Thought: Done.\nFinal Answer: Pushed.",
+        "",
+    )
+    assert tool_answer([]) is None
+
+
+@pytest.mark.parametrize(
+    "command, reason", [("", "empty"), ("cd src\nls", "spans 2 lines")]
+)
+def test_tool_answer_explains_unusable_commands(command, reason):
+    with pytest.raises(AnswerFormatError, match=reason):
+        tool_answer(call("run_command", thought="x", command=command))
+
+
+def run_steps(transcript, plan_mode=False):
+    orchestrator = AgentOrchestrator(
+        shell_sessions=False, index_repos=False, speculate=False, replay_plans=False
+    )
+    orchestrator.reasoning_agent.llm = ScriptedLLM(transcript, latency=0, chunk_delay=0)
+    history = HistoryManager()
+    steps = orchestrator._plan_steps if plan_mode else orchestrator._steps
+
+    async def collect():
+        return [
+            event
+            async for event in steps("task", "repo", "task", history, None, None, None)
+        ]
+
+    return asyncio.run(collect()), history
+
+
+def statuses(events):
+    return [e["data"]["text"] for e in events if e["type"] == "status"]
+
+
+def test_answer_without_action_is_sent_back_for_correction():
+    events, history = run_steps(["Thought: Let me think.", "Final Answer: Nothing to do."])
+    messages = statuses(events)
+    assert any("Asking again (1/" in m for m in messages)
+    assert any("All steps executed" in m for m in messages)
+    assert any(
+        m["role"] == "user" and "no usable tool call" in m["content"]
+        for m in history.messages()
+    )
+
+
+def test_gives_up_after_the_format_retries():
+    events, _ = run_steps(["Thought: Let me think."])
+    messages = statuses(events)
+    retries = [m for m in messages if "Asking again" in m]
+    assert len(retries) == agent_orchestrator.FORMAT_RETRIES
+    assert "No action found" in messages[-1]
+
+
+def test_plan_without_steps_is_sent_back_for_correction():
+    events, _ = run_steps(["Thought: Let me think.", "Final Answer: Done."], plan_mode=True)
+    messages = statuses(events)
+    assert any("had no Plan" in m for m in messages)
+    assert any("All steps executed" in m for m in messages)
@@ -0,0 +1,76 @@
+import asyncio
+import subprocess
+
+import pytest
+
+from backend.services.repo_index import RepoIndex, extract_fields, read_fields
+
+
+@pytest.mark.parametrize(
+    "path, text, fields",
+    [
+        (
+            "package.json",
+            "[1, 2]",
+            {"name": None, "scripts": [], "engines": None, "dependencies": 0},
+        ),
+        (
+            "package.json",
+            '{"name": "app", "scripts": ["build"], "dependencies": 3}',
+            {"name": "app", "scripts": [], "engines": None, "dependencies": 0},
+        ),
+        (
+            "pyproject.toml",
+            "project = 1",
+            {"name": None, "build-backend": None, "tools": []},
+        ),
+        (
+            "pyproject.toml",
+            'tool = "x"\n"build-system" = [1]',
+            {"name": None, "build-backend": None, "tools": []},
+        ),
+        ("Cargo.toml", "package = 1", {"name": None}),
+    ],
+)
+def test_oddly_shaped_manifests_give_empty_fields(path, text, fields):
+    assert extract_fields(path, text) == fields
+
+
+def test_package_json_fields():
+    text = '{"name": "app", "scripts": {"build": "tsc"}, "dependencies": {"a": "1"}}'
+    assert extract_fields("package.json", text) == {
+        "name": "app",
+        "scripts": ["build"],
+        "engines": None,
+        "dependencies": 1,
+    }
+
+
+def test_unreadable_key_file_is_skipped(tmp_path):
+    (tmp_path / "package.json").write_text("{not json")
+    assert read_fields(str(tmp_path), "package.json") is None
+
+
+def git(workspace, *args):
+    subprocess.run(["git", *args], cwd=workspace, check=True, capture_output=True)
+
+
+def test_malformed_key_files_do_not_cost_the_manifest(tmp_path):
+    workspace = tmp_path / "repo"
+    workspace.mkdir()
+    (workspace / "package.json").write_text("[1, 2]")
+    (workspace / "pyproject.toml").write_text("project = 1")
+    (workspace / "Makefile").write_text("build:\n\techo hi\n")
+    git(workspace, "init", "-q")
+    git(workspace, "add", ".")
+    git(
+        workspace,
+        "-c", "user.name=t", "-c", "user.email=t@example.com",
+        "commit", "-qm", "init",
+    )
+
+    index = RepoIndex(str(tmp_path))
+    manifest = asyncio.run(index.update("repo", str(workspace)))
+    assert manifest.files == ["Makefile", "package.json", "pyproject.toml"]
+    assert manifest.details["Makefile"] == {"targets": ["build"]}
+    assert "Makefile" in manifest.text()
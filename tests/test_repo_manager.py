@@ -0,0 +1,125 @@
+import asyncio
+import os
+import subprocess
+
+import pytest
+
+from backend.benchmarks.load_test import create_remotes
+from backend.services.repo_manager import RepoManager, is_push
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    for role in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{role}_NAME", "Test")
+        monkeypatch.setenv(f"GIT_{role}_EMAIL", "test@example.com")
+    (name,) = create_remotes(str(tmp_path), 1)
+    base_dir = tmp_path / "repos"
+    base_dir.mkdir()
+    template = os.path.join(str(tmp_path), "remotes", "{repo_name}.git")
+    return RepoManager(str(base_dir), template, refresh_interval=0), name
+
+
+def git(cwd, *args):
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def test_mirror_is_cloned_once(manager):
+    repos, name = manager
+
+    async def run():
+        first = await repos.ensure_mirror(name)
+        marker = os.path.join(first, "marker")
+        open(marker, "w").close()
+        second = await repos.ensure_mirror(name)
+        return first, second, os.path.exists(marker)
+
+    first, second, kept = asyncio.run(run())
+    assert first == second == repos.mirror_path(name)
+    assert kept
+    assert git(first, "rev-parse", "--verify", "origin/main")
+
+
+def test_worktrees_are_isolated_per_task(manager):
+    repos, name = manager
+
+    async def run():
+        return await asyncio.gather(
+            repos.create_worktree("a", name), repos.create_worktree("b", name)
+        )
+
+    a, b = asyncio.run(run())
+    assert a != b
+    assert open(os.path.join(a, "README.md")).read() == f"# {name}\n"
+    assert git(a, "rev-parse", "--abbrev-ref", "HEAD") == "task/a"
+    assert git(a, "rev-parse", "--abbrev-ref", "@{upstream}") == "origin/main"
+    open(os.path.join(a, "new.txt"), "w").close()
+    assert not os.path.exists(os.path.join(b, "new.txt"))
+
+
+def test_push_from_a_worktree_reaches_the_remote(manager, tmp_path):
+    repos, name = manager
+    path = asyncio.run(repos.create_worktree("a", name))
+    open(os.path.join(path, "ci.yml"), "w").close()
+    git(path, "add", ".")
+    git(path, "commit", "-qm", "Add CI")
+    git(path, "push", "-q", "origin", "HEAD:main")
+    remote = os.path.join(str(tmp_path), "remotes", f"{name}.git")
+    assert git(remote, "log", "-1", "--format=%s", "main") == "Add CI"
+
+    asyncio.run(repos.refresh(name))
+    assert git(repos.mirror_path(name), "log", "-1", "--format=%s", "origin/main") == "Add CI"
+
+
+def test_remove_worktree_deletes_checkout_and_branch(manager):
+    repos, name = manager
+
+    async def run():
+        path = await repos.create_worktree("a", name)
+        await repos.remove_worktree("a", name)
+        return path
+
+    path = asyncio.run(run())
+    mirror = repos.mirror_path(name)
+    assert not os.path.exists(os.path.dirname(path))
+    assert "task/a" not in git(mirror, "branch", "--list")
+    assert os.path.abspath(path) not in git(mirror, "worktree", "list")
+
+
+def test_push_lock_serializes_pushes_per_repo(manager):
+    repos, name = manager
+    order = []
+
+    async def push(task):
+        async with repos.push_lock(name):
+            order.append(f"{task} start")
+            await asyncio.sleep(0.01)
+            order.append(f"{task} end")
+
+    async def run():
+        assert repos.push_lock(name) is repos.push_lock(name)
+        assert repos.push_lock(name) is not repos.push_lock("other")
+        await asyncio.gather(push("a"), push("b"))
+
+    asyncio.run(run())
+    assert order == ["a start", "a end", "b start", "b end"]
+
+
+@pytest.mark.parametrize(
+    "command, pushes",
+    [
+        ("git push", True),
+        ("git push -q origin HEAD", True),
+        ("git add . && git commit -m 'x' && git push", True),
+        ("git -C sub push", True),
+        ("git push > push.log 2>&1", True),
+        ('echo "git push"', False),
+        ("git commit -m 'then git push'", False),
+        ("git status; echo git push", False),
+        ("git pushy", False),
+    ],
+)
+def test_is_push(command, pushes):
+    assert is_push(command) is pushes
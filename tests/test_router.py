@@ -0,0 +1,113 @@
+import asyncio
+
+import httpx
+import ollama
+import pytest
+from anthropic import APIConnectionError, BadRequestError, RateLimitError
+
+from backend.llms import router
+from backend.llms.ollama_llm import OllamaLLM
+from backend.llms.router import RoutedLLM, parse_route, should_fail_over
+
+REQUEST = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def status_error(cls, status):
+    return cls("error", response=httpx.Response(status, request=REQUEST), body=None)
+
+
+@pytest.fixture(autouse=True)
+def fresh_health(monkeypatch):
+    monkeypatch.setattr(router, "_health", {})
+
+
+@pytest.mark.parametrize(
+    "error, fails_over",
+    [
+        (asyncio.TimeoutError(), True),
+        (httpx.ConnectError("refused"), True),
+        (ConnectionResetError(), True),
+        (APIConnectionError(request=REQUEST), True),
+        (status_error(RateLimitError, 429), True),
+        (ollama.ResponseError("busy", 503), True),
+        (ollama.ResponseError("model not found", 404), False),
+        (status_error(BadRequestError, 400), False),
+        (ValueError("bad prompt"), False),
+    ],
+)
+def test_should_fail_over(error, fails_over):
+    assert should_fail_over(error) is fails_over
+
+
+def test_parse_route():
+    assert parse_route("claude:haiku, ollama:llama3.2") == [
+        ("claude", "haiku"),
+        ("ollama", "llama3.2"),
+    ]
+    with pytest.raises(ValueError):
+        parse_route("openai:gpt")
+
+
+def ollama_llm(url, model):
+    return OllamaLLM(model=model, host=url, agent="test")
+
+
+def test_slow_provider_fails_over_and_cools_down(ollama_server):
+    slow = ollama_llm(ollama_server("slow answer", delay=1), "slow")
+    fast = ollama_llm(ollama_server("fast answer"), "fast")
+    llm = RoutedLLM("test", [slow, fast], timeout=0.2)
+
+    assert asyncio.run(llm.chat(MESSAGES)) == "fast answer"
+    # The slow provider is tried last while it cools down
+    assert [provider for provider, _ in llm.attempts()] == [fast, slow]
+    assert llm.attempts()[-1][1] is None
+
+
+def test_stream_fails_over_before_the_first_token(ollama_server):
+    slow = ollama_llm(ollama_server("slow answer", delay=1), "slow")
+    fast = ollama_llm(ollama_server("fast answer"), "fast")
+    stream = RoutedLLM("test", [slow, fast], timeout=0.2).chat_stream(MESSAGES)
+
+    async def read():
+        return "".join([chunk async for chunk in stream])
+
+    assert asyncio.run(read()) == "fast answer"
+    assert stream.text == "fast answer"
+
+
+def test_unreachable_provider_fails_over(ollama_server):
+    down = ollama_llm("http://127.0.0.1:9", "down")
+    up = ollama_llm(ollama_server("answer"), "up")
+    assert asyncio.run(RoutedLLM("test", [down, up]).chat(MESSAGES)) == "answer"
+
+
+class Failing:
+    provider = "fake"
+    model = "failing"
+    name = "fake:failing"
+
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    async def chat(self, messages):
+        self.calls += 1
+        raise self.error
+
+
+def test_request_errors_do_not_fail_over(ollama_server):
+    bad = Failing(status_error(BadRequestError, 400))
+    up = ollama_llm(ollama_server("answer"), "up")
+    with pytest.raises(BadRequestError):
+        asyncio.run(RoutedLLM("test", [bad, up]).chat(MESSAGES))
+    # Not an outage, so the provider keeps its place
+    assert [provider for provider, _ in RoutedLLM("test", [bad, up]).attempts()] == [bad, up]
+
+
+def test_last_error_is_raised_when_every_provider_fails():
+    first = Failing(status_error(RateLimitError, 429))
+    second = Failing(ConnectionResetError())
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(RoutedLLM("test", [first, second]).chat(MESSAGES))
+    assert first.calls == second.calls == 1
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+from backend.services.executor import CommandResult
+from backend.services.shell_pool import ShellPool, ShellSession
+
+
+def run_in_session(*commands, timeout=10):
+    """Runs commands one after another in a fresh session; returns the results and session."""
+
+    async def run():
+        session = await ShellSession().start()
+        results = []
+        try:
+            for command in commands:
+                result = CommandResult()
+                async for _ in session.run(command, result, timeout=timeout):
+                    pass
+                results.append(result)
+        finally:
+            session.close()
+            await session.process.wait()
+        return results, session
+
+    return asyncio.run(run())
+
+
+def test_output_without_trailing_newline():
+    (result,), session = run_in_session("printf abc; printf err >&2")
+    assert result.stdout == "abc"
+    assert result.stderr == "err"
+    assert result.returncode == 0
+
+
+def test_state_carries_over_between_commands(tmp_path):
+    (tmp_path / "sub").mkdir()
+    results, session = run_in_session(
+        f"cd {tmp_path}/sub", "export GREETING=hi", "echo $GREETING; pwd", "false"
+    )
+    assert results[2].stdout == f"hi\n{tmp_path}/sub\n"
+    assert results[3].returncode == 1
+    assert session.cwd == f"{tmp_path}/sub"
+
+
+def test_syntax_error_keeps_the_session():
+    (bad, good), session = run_in_session("if then fi", "echo still here")
+    assert bad.returncode != 0
+    assert "syntax error" in bad.stderr
+    assert good.stdout == "still here\n"
+
+
+def test_exit_ends_the_session():
+    (result,), session = run_in_session("echo bye; exit 3")
+    assert result.stdout == "bye\n"
+    assert result.returncode == 3
+    assert not session.alive
+
+
+def test_timeout_kills_the_session():
+    (result,), session = run_in_session("echo started; sleep 30", timeout=0.5)
+    assert result.timed_out
+    # Output sent before the timeout is not held back waiting for the sentinel
+    assert result.stdout.startswith("started")
+    assert "Timed out" in result.stderr
+    assert not session.alive
+
+
+def test_pool_replaces_a_broken_session(tmp_path):
+    pool = ShellPool(size=1)
+
+    async def run():
+        try:
+            session = await pool.lease("task", str(tmp_path))
+            session.close()
+            fresh, restarted = await pool.acquire("task")
+            result = CommandResult()
+            async for _ in fresh.run("pwd", result):
+                pass
+            await session.process.wait()
+            return session, fresh, restarted, result
+        finally:
+            await pool.shutdown()
+
+    session, fresh, restarted, result = asyncio.run(run())
+    assert fresh is not session and restarted
+    assert result.stdout == f"{tmp_path}\n"
+    assert not pool.leases and not pool.idle
+
+
+def test_sentinel_split_across_reads_is_not_output():
+    # Long output makes the sentinel straddle pipe reads now and then
+    (result,), _ = run_in_session("seq 1 20000")
+    assert result.stdout == "".join(f"{i}\n" for i in range(1, 20001))
+
+
+def test_app_fills_the_pool_on_startup_and_closes_it_on_shutdown(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from backend import main
+
+    pool = ShellPool(size=2)
+    monkeypatch.setattr(main, "shell_pool", pool)
+    with TestClient(main.app):
+        deadline = time.monotonic() + 10
+        while len(pool.idle) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sessions = list(pool.idle)
+        assert len(sessions) == 2
+    assert not pool.idle
+    assert not any(session.alive for session in sessions)
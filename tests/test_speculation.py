@@ -0,0 +1,87 @@
+import asyncio
+
+from backend.services import speculation
+from backend.services.executor import CommandResult
+from backend.services.shell_pool import ShellPool
+from backend.services.speculation import Speculator
+
+
+def speculator(task_id, workspace):
+    return Speculator(task_id, None, None, str(workspace), "", None)
+
+
+def with_session(monkeypatch, tmp_path, test):
+    """Runs `test(session)` with a session leased to "task" in `tmp_path`."""
+    pool = ShellPool(size=1)
+    monkeypatch.setattr(speculation, "shell_pool", pool)
+
+    async def run():
+        try:
+            session = await pool.lease("task", str(tmp_path))
+            return await test(session)
+        finally:
+            await pool.shutdown()
+
+    return asyncio.run(run())
+
+
+async def run(session, command):
+    result = CommandResult()
+    async for _ in session.run(command, result):
+        pass
+    return result
+
+
+def test_probe_sees_the_session_cwd_and_environment(monkeypatch, tmp_path):
+    (tmp_path / "sub").mkdir()
+
+    async def test(session):
+        await run(session, "cd sub && export GREETING=hi")
+        outcome = await speculator("task", tmp_path)._probe("echo $GREETING; pwd")
+        try:
+            return outcome.stdout, outcome.returncode, session.cwd
+        finally:
+            outcome.close()
+
+    stdout, returncode, cwd = with_session(monkeypatch, tmp_path, test)
+    assert stdout == f"hi\n{tmp_path}/sub\n"
+    assert returncode == 0
+    assert cwd == f"{tmp_path}/sub"
+
+
+def test_commands_wait_for_a_running_probe(monkeypatch, tmp_path):
+    async def test(session):
+        probe = asyncio.create_task(
+            speculator("task", tmp_path)._probe("sleep 0.2; echo probe")
+        )
+        await asyncio.sleep(0.05)
+        # A dropped speculation still lets the probe finish in the session
+        probe.cancel()
+        result = await run(session, "echo real")
+        return result.stdout, session.alive
+
+    stdout, alive = with_session(monkeypatch, tmp_path, test)
+    assert stdout == "real\n"
+    assert alive
+
+
+def test_no_probe_in_a_dead_session(monkeypatch, tmp_path):
+    async def test(session):
+        session.close()
+        await session.process.wait()
+        return await speculator("task", tmp_path)._probe("pwd")
+
+    assert with_session(monkeypatch, tmp_path, test) is None
+
+
+def test_probe_without_a_session_runs_in_the_workspace(monkeypatch, tmp_path):
+    monkeypatch.setattr(speculation, "shell_pool", ShellPool(size=0))
+
+    async def test():
+        outcome = await speculator("task", tmp_path)._probe("pwd")
+        try:
+            return outcome.stdout
+        finally:
+            outcome.close()
+
+    assert asyncio.run(test()) == f"{tmp_path}\n"
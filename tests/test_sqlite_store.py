@@ -0,0 +1,54 @@
+import asyncio
+
+from backend.services.sqlite_store import SQLiteStore
+
+
+def test_round_trips_json_values(tmp_path):
+    store = SQLiteStore(str(tmp_path / "s.sqlite3"), "cache", 10, 60)
+
+    async def run():
+        await store.set("a", {"commands": ["ls"]})
+        assert await store.get("a") == {"commands": ["ls"]}
+        await store.delete("a")
+        assert await store.get("a") is None
+
+    asyncio.run(run())
+
+
+def test_expires_old_entries(tmp_path):
+    store = SQLiteStore(str(tmp_path / "s.sqlite3"), "cache", 10, 0)
+
+    async def run():
+        await store.set("a", "x")
+        assert await store.get("a") is None
+
+    asyncio.run(run())
+
+
+def test_evicts_least_recently_used(tmp_path):
+    store = SQLiteStore(str(tmp_path / "s.sqlite3"), "cache", 2, 60)
+
+    async def run():
+        await store.set("a", 1)
+        await store.set("b", 2)
+        await store.touch("a")
+        await store.set("c", 3)
+        assert [await store.get(k) for k in "abc"] == [1, None, 3]
+
+    asyncio.run(run())
+
+
+def test_starts_over_on_an_older_layout(tmp_path):
+    path = str(tmp_path / "s.sqlite3")
+    old = SQLiteStore(path, "cache", 10, 60)
+    old.db.execute("DROP TABLE cache")
+    old.db.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT)")
+    old.db.commit()
+
+    store = SQLiteStore(path, "cache", 10, 60)
+
+    async def run():
+        await store.set("a", 1)
+        assert await store.get("a") == 1
+
+    asyncio.run(run())
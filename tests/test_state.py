@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from backend.services.state import InProcessStateBackend, SQLiteStateBackend, approval_channels
+
+APPROVE = {"approved": True, "edited_command": None}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return InProcessStateBackend()
+    return SQLiteStateBackend(str(tmp_path / "state.sqlite3"), poll_interval=0.01)
+
+
+def test_approval_by_task_id_reaches_the_open_step(backend):
+    async def run():
+        await backend.open_step("task", "step")
+        assert await backend.submit_approval("task", APPROVE)
+        decision = await backend.wait_for_approval("step")
+        await backend.close_step("task", "step")
+        return decision
+
+    assert asyncio.run(run()) == APPROVE
+
+
+def test_approval_between_steps_is_refused(backend):
+    async def run():
+        await backend.open_step("task", "step-1")
+        await backend.close_step("task", "step-1")
+        refused = not await backend.submit_approval("task", APPROVE)
+
+        await backend.open_step("task", "step-2")
+        await backend.close_step("task", "step-2")
+        return refused
+
+    assert asyncio.run(run())
+    assert "task" not in approval_channels
+
+
+def test_closing_an_old_step_keeps_the_current_one():
+    backend = InProcessStateBackend()
+
+    async def run():
+        await backend.open_step("task", "step-1")
+        await backend.open_step("task", "step-2")
+        await backend.close_step("task", "step-1")
+        return await backend.submit_approval("task", APPROVE)
+
+    assert asyncio.run(run())
+    asyncio.run(backend.close_step("task", "step-2"))